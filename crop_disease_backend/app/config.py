@@ -9,6 +9,26 @@ class Settings:
     # Database
     MONGODB_URL: str = os.getenv("MONGODB_URL", "mongodb://localhost:27017")
     DATABASE_NAME: str = os.getenv("DATABASE_NAME", "crop_disease_db")
+    # "mongodb" or "memory" (in-process stand-in for offline benchmarking)
+    DATABASE_BACKEND: str = os.getenv("DATABASE_BACKEND", "mongodb").lower()
+    MONGO_MAX_POOL_SIZE: int = int(os.getenv("MONGO_MAX_POOL_SIZE", "10"))
+    MONGO_MIN_POOL_SIZE: int = int(os.getenv("MONGO_MIN_POOL_SIZE", "1"))
+    MONGO_MAX_IDLE_TIME_MS: int = int(os.getenv("MONGO_MAX_IDLE_TIME_MS", "0"))  # 0 = no limit
+    MONGO_WAIT_QUEUE_TIMEOUT_MS: int = int(os.getenv("MONGO_WAIT_QUEUE_TIMEOUT_MS", "0"))  # 0 = no limit
+    MONGO_SERVER_SELECTION_TIMEOUT_MS: int = int(os.getenv("MONGO_SERVER_SELECTION_TIMEOUT_MS", "5000"))
+    MONGO_CONNECT_TIMEOUT_MS: int = int(os.getenv("MONGO_CONNECT_TIMEOUT_MS", "5000"))
+    MONGO_SOCKET_TIMEOUT_MS: int = int(os.getenv("MONGO_SOCKET_TIMEOUT_MS", "30000"))
+    # Comma-separated, e.g. "zstd,snappy,zlib" (zstd/snappy need the zstandard/python-snappy packages)
+    MONGO_COMPRESSORS: str = os.getenv("MONGO_COMPRESSORS", "")
+    MONGO_READ_PREFERENCE: str = os.getenv("MONGO_READ_PREFERENCE", "primary")
+    # Read routing for analytics / list queries (max staleness must be >= 90 s)
+    ANALYTICS_READ_PREFERENCE: str = os.getenv("ANALYTICS_READ_PREFERENCE", "secondaryPreferred")
+    ANALYTICS_MAX_STALENESS_SECONDS: int = int(os.getenv("ANALYTICS_MAX_STALENESS_SECONDS", "90"))
+    # Write-behind batching of inserts across concurrent requests
+    BULK_WRITE_MAX_BATCH_SIZE: int = int(os.getenv("BULK_WRITE_MAX_BATCH_SIZE", "100"))
+    BULK_WRITE_FLUSH_INTERVAL_MS: int = int(os.getenv("BULK_WRITE_FLUSH_INTERVAL_MS", "20"))
+    MONGO_HEARTBEAT_INTERVAL_SECONDS: float = float(os.getenv("MONGO_HEARTBEAT_INTERVAL_SECONDS", "10"))
+    MONGO_HEARTBEAT_MAX_BACKOFF_SECONDS: float = float(os.getenv("MONGO_HEARTBEAT_MAX_BACKOFF_SECONDS", "120"))
     
     # JWT
     SECRET_KEY: str = os.getenv("SECRET_KEY")
@@ -17,22 +37,120 @@ class Settings:
     
     ALGORITHM: str = "HS256"
     ACCESS_TOKEN_EXPIRE_MINUTES: int = int(os.getenv("ACCESS_TOKEN_EXPIRE_MINUTES", "30"))
+    REFRESH_TOKEN_EXPIRE_DAYS: int = int(os.getenv("REFRESH_TOKEN_EXPIRE_DAYS", "30"))
+    # How long a user's token version / active flag is trusted before re-checking.
+    # The cache is per worker: after a revocation or deactivation, other workers
+    # keep accepting the user's access tokens for up to this long. Refresh
+    # tokens are always checked against the database.
+    TOKEN_VERSION_CACHE_TTL_SECONDS: int = int(os.getenv("TOKEN_VERSION_CACHE_TTL_SECONDS", "60"))
     
     # File Upload
     UPLOAD_DIR: str = os.getenv("UPLOAD_DIR", "uploads/images")
     MAX_FILE_SIZE: int = int(os.getenv("MAX_FILE_SIZE", str(5 * 1024 * 1024)))  # 5MB default
     ALLOWED_EXTENSIONS: set = {".jpg", ".jpeg", ".png"}
+    # Stored uploads: "webp", "jpeg" or "original" (keep the uploaded bytes)
+    IMAGE_STORE_FORMAT: str = os.getenv("IMAGE_STORE_FORMAT", "webp").lower()
+    IMAGE_MAX_DIMENSION: int = int(os.getenv("IMAGE_MAX_DIMENSION", "2048"))
+    IMAGE_QUALITY: int = int(os.getenv("IMAGE_QUALITY", "82"))
+    # Photos of one plant sent together in a single identification request
+    MAX_IMAGES_PER_DIAGNOSIS: int = int(os.getenv("MAX_IMAGES_PER_DIAGNOSIS", "5"))
+    # Resumable uploads: partial files, and how long an idle upload is kept
+    RESUMABLE_UPLOAD_DIR: str = os.getenv("RESUMABLE_UPLOAD_DIR", "uploads/partial")
+    UPLOAD_SESSION_TTL_MINUTES: int = int(os.getenv("UPLOAD_SESSION_TTL_MINUTES", "1440"))
+    # A request holding an upload longer than this is assumed dead
+    UPLOAD_LOCK_TIMEOUT_SECONDS: int = int(os.getenv("UPLOAD_LOCK_TIMEOUT_SECONDS", "600"))
+    # Idempotency-Key records: lifetime, how long a retry waits for the first
+    # request, and after how long an unfinished first request is presumed dead
+    IDEMPOTENCY_KEY_TTL_HOURS: int = int(os.getenv("IDEMPOTENCY_KEY_TTL_HOURS", "24"))
+    IDEMPOTENCY_WAIT_SECONDS: float = float(os.getenv("IDEMPOTENCY_WAIT_SECONDS", "60"))
+    IDEMPOTENCY_LOCK_SECONDS: int = int(os.getenv("IDEMPOTENCY_LOCK_SECONDS", "300"))
+    # Batch predict: items per request and items diagnosed at once
+    BATCH_PREDICT_MAX_ITEMS: int = int(os.getenv("BATCH_PREDICT_MAX_ITEMS", "50"))
+    BATCH_PREDICT_CONCURRENCY: int = int(os.getenv("BATCH_PREDICT_CONCURRENCY", "4"))
+    # Threads for image decoding / encoding
+    IMAGE_WORKERS: int = int(os.getenv("IMAGE_WORKERS", str(min(4, os.cpu_count() or 1))))
+    # Image storage backend: "local" (uploads/images) or "s3" (any S3-compatible store)
+    STORAGE_BACKEND: str = os.getenv("STORAGE_BACKEND", "local").lower()
+    S3_ENDPOINT_URL: str = os.getenv("S3_ENDPOINT_URL", "https://s3.amazonaws.com")
+    S3_BUCKET: str = os.getenv("S3_BUCKET", "crop-disease-images")
+    S3_REGION: str = os.getenv("S3_REGION", "us-east-1")
+    S3_ACCESS_KEY_ID: str = os.getenv("S3_ACCESS_KEY_ID", "")
+    S3_SECRET_ACCESS_KEY: str = os.getenv("S3_SECRET_ACCESS_KEY", "")
+    S3_PREFIX: str = os.getenv("S3_PREFIX", "")
+    # Redirect image downloads to presigned object-store URLs instead of proxying the bytes
+    STORAGE_REDIRECT_DOWNLOADS: bool = os.getenv("STORAGE_REDIRECT_DOWNLOADS", "true").lower() == "true"
+    # Images are served through signed URLs valid for one to two of these windows
+    IMAGE_URL_TTL_SECONDS: int = int(os.getenv("IMAGE_URL_TTL_SECONDS", "3600"))
+    IMAGE_CACHE_MAX_AGE_SECONDS: int = int(os.getenv("IMAGE_CACHE_MAX_AGE_SECONDS", str(365 * 24 * 3600)))
+    # Longest edge of the on-demand WebP derivatives
+    IMAGE_THUMBNAIL_SIZE: int = int(os.getenv("IMAGE_THUMBNAIL_SIZE", "256"))
+    IMAGE_PREVIEW_SIZE: int = int(os.getenv("IMAGE_PREVIEW_SIZE", "1024"))
+    IMAGE_DERIVATIVE_QUALITY: int = int(os.getenv("IMAGE_DERIVATIVE_QUALITY", "80"))
+    
+    # Retention in days (0 keeps forever); enforced by TTL indexes on created_at
+    DIAGNOSIS_RETENTION_DAYS: int = int(os.getenv("DIAGNOSIS_RETENTION_DAYS", "0"))
+    ADVISORY_RETENTION_DAYS: int = int(os.getenv("ADVISORY_RETENTION_DAYS", "0"))
+    # Raw provider payloads are stripped from diagnoses older than this
+    RAW_RESPONSE_RETENTION_DAYS: int = int(os.getenv("RAW_RESPONSE_RETENTION_DAYS", "30"))
+    # Most diagnoses removed by one batch delete request
+    DIAGNOSIS_BATCH_DELETE_LIMIT: int = int(os.getenv("DIAGNOSIS_BATCH_DELETE_LIMIT", "500"))
+    # Orphaned image collection (0 disables the background run)
+    IMAGE_GC_INTERVAL_MINUTES: int = int(os.getenv("IMAGE_GC_INTERVAL_MINUTES", "360"))
+    # Images touched more recently than this are never collected (uploads in flight)
+    IMAGE_GC_GRACE_MINUTES: int = int(os.getenv("IMAGE_GC_GRACE_MINUTES", "60"))
+    IMAGE_GC_BATCH_SIZE: int = int(os.getenv("IMAGE_GC_BATCH_SIZE", "500"))
+    IMAGE_GC_DELETES_PER_SECOND: float = float(os.getenv("IMAGE_GC_DELETES_PER_SECOND", "20"))
     
     # Kindwise API
     KINDWISE_API_KEY: str = os.getenv("KINDWISE_API_KEY", "")
+    KINDWISE_API_URL: str = os.getenv("KINDWISE_API_URL", "https://crop.kindwise.com/api/v1")
+    
+    # Disease detection: provider ("kindwise", "local", "fixture"), comma-separated
+    # fallbacks tried in order when it is unconfigured or fails (empty disables them),
+    # and provider metadata
+    DETECTION_PROVIDER: str = os.getenv("DETECTION_PROVIDER", "kindwise").lower()
+    DETECTION_FALLBACK_PROVIDER: str = os.getenv("DETECTION_FALLBACK_PROVIDER", "local,fixture").lower()
+    # Give up on the primary provider after this long and use the fallbacks (0 waits indefinitely)
+    DETECTION_TIMEOUT_SECONDS: float = float(os.getenv("DETECTION_TIMEOUT_SECONDS", "0"))
+    # Provider streamed as a provisional result by batch predict while the primary runs
+    DETECTION_PROVISIONAL_PROVIDER: str = os.getenv("DETECTION_PROVISIONAL_PROVIDER", "").lower()
+    KINDWISE_COST_PER_REQUEST: float = float(os.getenv("KINDWISE_COST_PER_REQUEST", "0"))
+    # Fixture provider: optional JSON fixtures and simulated latency
+    DETECTION_FIXTURES_PATH: str = os.getenv("DETECTION_FIXTURES_PATH", "")
+    DETECTION_FIXTURE_LATENCY_MS: float = float(os.getenv("DETECTION_FIXTURE_LATENCY_MS", "0"))
+    # Local classifier: model trained with `python -m app.utils.local_classifier`
+    # (the provider stays unconfigured until the file exists), "knn" or "centroid",
+    # neighbours, and micro-batching of concurrent classifications
+    LOCAL_CLASSIFIER_PATH: str = os.getenv("LOCAL_CLASSIFIER_PATH", "models/local_classifier.npz")
+    LOCAL_CLASSIFIER_METHOD: str = os.getenv("LOCAL_CLASSIFIER_METHOD", "knn").lower()
+    LOCAL_CLASSIFIER_K: int = int(os.getenv("LOCAL_CLASSIFIER_K", "7"))
+    LOCAL_CLASSIFIER_MAX_BATCH: int = int(os.getenv("LOCAL_CLASSIFIER_MAX_BATCH", "32"))
+    LOCAL_CLASSIFIER_BATCH_WINDOW_MS: float = float(os.getenv("LOCAL_CLASSIFIER_BATCH_WINDOW_MS", "5"))
     
     # Gemini API
     GEMINI_API_KEY: str = os.getenv("GEMINI_API_KEY", "")
     GEMINI_MODEL: str = os.getenv("GEMINI_MODEL", "gemini-2.0-flash-exp")
+    # Override the Gemini API host, e.g. http://127.0.0.1:9100/gemini for local fakes
+    GEMINI_API_ENDPOINT: str = os.getenv("GEMINI_API_ENDPOINT", "")
     
     # Weather API (optional)
     WEATHER_API_KEY: str = os.getenv("WEATHER_API_KEY", "")
-    WEATHER_API_URL: str = "http://api.openweathermap.org/data/2.5/weather"
+    WEATHER_API_URL: str = os.getenv("WEATHER_API_URL", "http://api.openweathermap.org/data/2.5/weather")
+    WEATHER_HTTP_TIMEOUT: float = float(os.getenv("WEATHER_HTTP_TIMEOUT", "5"))
+    WEATHER_MAX_CONNECTIONS: int = int(os.getenv("WEATHER_MAX_CONNECTIONS", "20"))
+    # Weather is cached per region; stale entries are served while refreshing
+    WEATHER_CACHE_TTL_SECONDS: int = int(os.getenv("WEATHER_CACHE_TTL_SECONDS", "600"))
+    WEATHER_CACHE_STALE_SECONDS: int = int(os.getenv("WEATHER_CACHE_STALE_SECONDS", "1800"))
+    WEATHER_CACHE_MAX_REGIONS: int = int(os.getenv("WEATHER_CACHE_MAX_REGIONS", "5000"))
+    
+    # Disease risk forecasts (0 disables the background refresh)
+    RISK_FORECAST_INTERVAL_MINUTES: int = int(os.getenv("RISK_FORECAST_INTERVAL_MINUTES", "60"))
+    RISK_HISTORY_DAYS: int = int(os.getenv("RISK_HISTORY_DAYS", "90"))
+    
+    # Response compression (brotli needs the optional brotli package; gzip otherwise)
+    COMPRESSION_MINIMUM_SIZE: int = int(os.getenv("COMPRESSION_MINIMUM_SIZE", "1024"))
+    COMPRESSION_GZIP_LEVEL: int = int(os.getenv("COMPRESSION_GZIP_LEVEL", "6"))
+    COMPRESSION_BROTLI_QUALITY: int = int(os.getenv("COMPRESSION_BROTLI_QUALITY", "4"))
     
     # CORS Settings
     ALLOWED_ORIGINS: List[str] = os.getenv(
@@ -47,6 +165,11 @@ class Settings:
     HOST: str = os.getenv("HOST", "0.0.0.0")
     PORT: int = int(os.getenv("PORT", "8000"))
     
+    # Expose /metrics (pool, latency and provider metrics). Off by default; when
+    # METRICS_TOKEN is set, scrapers must send it as a bearer token
+    METRICS_ENABLED: bool = os.getenv("METRICS_ENABLED", "false").lower() == "true"
+    METRICS_TOKEN: str = os.getenv("METRICS_TOKEN", "")
+    
     # Security
     SECURE_COOKIES: bool = os.getenv("SECURE_COOKIES", "false").lower() == "true"
     
@@ -1,11 +1,15 @@
 # advisory_controller.py
 from typing import Optional, List, Dict, Any
-from app.database import get_database, ensure_connection
-from app.models.advisory import Advisory, Treatment, WeatherAdvice
-from app.utils.weather_utils import get_weather_data, generate_weather_advice
+from app.database import get_database, get_collection, ReadRouting
+from app.models.advisory import Advisory, Treatment, WeatherAdvice, BulkWeatherAdvice
+from app.utils.weather_utils import (
+    get_weather_data, generate_weather_advice, normalize_region, weather_bands,
+    TEMPERATURE_ADVICE, HUMIDITY_ADVICE
+)
 from bson import ObjectId
+import asyncio
 import logging
-from app.utils.mongo_utils import convert_objectids_to_str
+import numpy as np
 
 logger = logging.getLogger(__name__)
 
@@ -13,7 +17,7 @@ class AdvisoryController:
     async def _get_db(self):
         """Get database instance with proper error handling"""
         try:
-            await ensure_connection()
+            # Connection health is tracked by the background heartbeat
             return get_database()
         except Exception as e:
             logger.error(f"Database connection error in advisory controller: {e}")
@@ -40,8 +44,6 @@ class AdvisoryController:
                 logger.info(f"No existing advisory found for {disease_name} on {crop_type}")
                 return None
             
-            advisory = convert_objectids_to_str(advisory)
-            
             # Filter out empty/blank treatment steps and prevention tips
             if 'treatment_steps' in advisory:
                 advisory['treatment_steps'] = [
@@ -94,12 +96,14 @@ class AdvisoryController:
         try:
             db = await self._get_db()
             
+            # The version counter drives advisory ETags
+            changes = {k: v for k, v in advisory_data.items() if k not in ("_id", "version")}
             result = await db.advisories.update_one(
                 {
                     "disease_name": disease_name,
                     "crop_type": crop_type
                 },
-                {"$set": advisory_data}
+                {"$set": changes, "$inc": {"version": 1}}
             )
             
             if result.modified_count > 0:
@@ -116,12 +120,12 @@ class AdvisoryController:
     async def get_all_advisories(self, limit: int = 100) -> List[Dict[str, Any]]:
         """Get all advisories from database"""
         try:
-            db = await self._get_db()
-            cursor = db.advisories.find().limit(limit)
+            await self._get_db()
+            cursor = get_collection("advisories", ReadRouting.ANALYTICS).find().limit(limit)
             
             advisories = []
             async for advisory in cursor:
-                advisories.append(convert_objectids_to_str(advisory))
+                advisories.append(advisory)
             
             return advisories
             
@@ -136,6 +140,33 @@ class AdvisoryController:
             return generate_weather_advice(weather_data)
         return None
     
+    async def get_bulk_weather_advice(self, regions: List[str]) -> BulkWeatherAdvice:
+        """Weather advice for many regions, evaluated in one vectorized pass"""
+        # Fetch each distinct region once, concurrently, through the weather cache
+        unique_regions = list(dict.fromkeys(normalize_region(r) for r in regions))
+        fetched = await asyncio.gather(*(get_weather_data(r) for r in unique_regions))
+        weather_by_region = dict(zip(unique_regions, fetched))
+        weather = [weather_by_region[normalize_region(r)] for r in regions]
+        
+        available = np.array([w is not None for w in weather], dtype=bool)
+        temperatures = np.array([w["temperature"] if w else np.nan for w in weather], dtype=float)
+        humidities = np.array([w["humidity"] if w else np.nan for w in weather], dtype=float)
+        temperature_band, humidity_band = weather_bands(temperatures, humidities)
+        
+        def column(values: np.ndarray) -> List[Any]:
+            return [v if ok else None for v, ok in zip(values.tolist(), available.tolist())]
+        
+        return BulkWeatherAdvice(
+            regions=regions,
+            temperature=column(temperatures),
+            humidity=column(humidities),
+            weather_condition=[w["weather_condition"] if w else None for w in weather],
+            temperature_band=column(temperature_band),
+            humidity_band=column(humidity_band),
+            temperature_advice=list(TEMPERATURE_ADVICE),
+            humidity_advice=list(HUMIDITY_ADVICE)
+        )
+    
     async def initialize_default_advisories(self):
         """Initialize database with default advisories - now optional since we use Gemini"""
         try:
@@ -1,51 +1,97 @@
 # auth_controller.py
 from datetime import timedelta
+from typing import Any, Dict
 from fastapi import HTTPException, status
 from app.database import get_database
 from app.models.user import UserCreate, UserLogin, UserInDB, UserResponse, Token
-from app.utils.auth_utils import get_password_hash, verify_password, create_access_token
+from app.utils.auth_utils import (
+    get_password_hash, verify_password, create_access_token, create_refresh_token,
+    build_token_claims, decode_token, consume_refresh_token
+)
+from bson import ObjectId
 from app.config import settings
 from pymongo.errors import DuplicateKeyError
+import asyncio
+import logging
+
+logger = logging.getLogger(__name__)
 
 # ...existing code...
 class AuthController:
     def __init__(self):
         pass
+
+    def _to_user_response(self, user: Dict[str, Any]) -> UserResponse:
+        """Build the public user representation from a users document"""
+        return UserResponse(
+            id=str(user["_id"]),
+            name=user["name"],
+            email=user["email"],
+            phone_number=user["phone_number"],
+            region=user["region"],
+            is_active=user.get("is_active", True),
+            created_at=user.get("created_at")
+        )
+
+    def _issue_token(self, user: Dict[str, Any]) -> Token:
+        """Create an access / refresh token pair for an already authenticated user"""
+        claims = build_token_claims(user)
+        access_token_expires = timedelta(minutes=settings.ACCESS_TOKEN_EXPIRE_MINUTES)
+        access_token = create_access_token(
+            data=claims, expires_delta=access_token_expires
+        )
+        refresh_token = create_refresh_token(
+            data={"sub": claims["sub"], "uid": claims["uid"], "ver": claims["ver"]}
+        )
+        return Token(access_token=access_token, token_type="bearer", refresh_token=refresh_token)
+
+    def _token_response(self, user: Dict[str, Any]) -> Dict[str, Any]:
+        """Response body shared by register, login and refresh"""
+        token = self._issue_token(user)
+        return {
+            "user": self._to_user_response(user),
+            "access_token": token.access_token,
+            "refresh_token": token.refresh_token,
+            "token_type": token.token_type
+        }
+
+    async def _authenticate(self, login_data: UserLogin) -> Dict[str, Any]:
+        """Look up the user once and verify the password once"""
+        db = get_database()
+        user = await db.users.find_one({"email": login_data.email})
+        # bcrypt takes a few hundred ms of CPU; keep it off the event loop
+        if not user or not await asyncio.to_thread(verify_password, login_data.password, user["hashed_password"]):
+            raise HTTPException(
+                status_code=status.HTTP_401_UNAUTHORIZED,
+                detail="Incorrect email or password",
+                headers={"WWW-Authenticate": "Bearer"},
+            )
+        if not user.get("is_active", True):
+            raise HTTPException(
+                status_code=status.HTTP_400_BAD_REQUEST,
+                detail="Inactive user"
+            )
+        return user
        
     async def register_user(self, user_data: UserCreate) -> UserResponse:
         """Register a new user"""
-        self.db = get_database()
+        user_doc = await self._create_user(user_data)
+        return self._to_user_response(user_doc)
+
+    async def _create_user(self, user_data: UserCreate) -> Dict[str, Any]:
+        """Hash the password and insert the user, returning the stored document"""
         try:
-            db = get_database()  # Get DB here
-            hashed_password = get_password_hash(user_data.password)
+            db = get_database()
+            hashed_password = await asyncio.to_thread(get_password_hash, user_data.password)
             user_dict = user_data.dict(exclude={"password"})
             user_dict["hashed_password"] = hashed_password
-            user_in_db = UserInDB(**user_dict)
-            
-            # Insert user into database
-            result = await self.db.users.insert_one(user_in_db.dict(by_alias=True))
-            
-            # Get created user
-            created_user = await self.db.users.find_one({"_id": result.inserted_id})
-            
-            if not created_user:
-                raise HTTPException(
-                    status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
-                    detail="Failed to retrieve created user"
-                )
+            user_doc = UserInDB(**user_dict).dict(by_alias=True)
             
-            # Convert MongoDB document to UserResponse
-            user_response_data = {
-                "id": str(created_user["_id"]),
-                "name": created_user["name"],
-                "email": created_user["email"],
-                "phone_number": created_user["phone_number"],
-                "region": created_user["region"],
-                "is_active": created_user.get("is_active", True),
-                "created_at": created_user.get("created_at")
-            }
-            
-            return UserResponse(**user_response_data)
+            # The inserted document is exactly what we hold in memory, so
+            # there is no need to read it back from the database
+            result = await db.users.insert_one(user_doc)
+            user_doc["_id"] = result.inserted_id
+            return user_doc
             
         except DuplicateKeyError:
             raise HTTPException(
@@ -58,15 +104,34 @@ class AuthController:
                 detail=f"Registration failed: {str(e)}"
             )
 
+    async def register_and_login(self, user_data: UserCreate) -> Dict[str, Any]:
+        """Register a new user and issue a token without re-verifying the password"""
+        user_doc = await self._create_user(user_data)
+        return self._token_response(user_doc)
+
     async def login_user(self, login_data: UserLogin) -> Token:
-        self.db = get_database()
         """Authenticate user and return token"""
-        db = get_database()  # Get DB here
-        user = await db.users.find_one({"email": login_data.email})
-        if not user or not verify_password(login_data.password, user["hashed_password"]):
+        user = await self._authenticate(login_data)
+        return self._issue_token(user)
+
+    async def login(self, login_data: UserLogin) -> Dict[str, Any]:
+        """Authenticate user and return both the user and the token from one read"""
+        user = await self._authenticate(login_data)
+        return self._token_response(user)
+
+    async def refresh(self, refresh_token: str) -> Dict[str, Any]:
+        """
+        Exchange a refresh token for a new token pair with up-to-date claims.
+        The refresh token is rotated: presenting it a second time is rejected.
+        """
+        payload = decode_token(refresh_token, expected_type="refresh")
+        
+        db = get_database()
+        user = await db.users.find_one({"_id": ObjectId(payload["uid"])}) if "uid" in payload else None
+        if not user or payload.get("ver", 0) != user.get("token_version", 0):
             raise HTTPException(
                 status_code=status.HTTP_401_UNAUTHORIZED,
-                detail="Incorrect email or password",
+                detail="Refresh token is no longer valid",
                 headers={"WWW-Authenticate": "Bearer"},
             )
         if not user.get("is_active", True):
@@ -74,9 +139,12 @@ class AuthController:
                 status_code=status.HTTP_400_BAD_REQUEST,
                 detail="Inactive user"
             )
-        access_token_expires = timedelta(minutes=settings.ACCESS_TOKEN_EXPIRE_MINUTES)
-        access_token = create_access_token(
-            data={"sub": user["email"]}, expires_delta=access_token_expires
-        )
-        return Token(access_token=access_token, token_type="bearer")
-# ...existing code...
\ No newline at end of file
+        if not await consume_refresh_token(payload):
+            logger.warning(f"Reuse of a rotated refresh token for user {payload['uid']}")
+            raise HTTPException(
+                status_code=status.HTTP_401_UNAUTHORIZED,
+                detail="Refresh token has already been used",
+                headers={"WWW-Authenticate": "Bearer"},
+            )
+        return self._token_response(user)
+# ...existing code...
@@ -1,32 +1,43 @@
 # dashboard_controller.py
 from typing import List
-from app.database import get_database
-from app.models.user import UserInDB
+from app.database import get_collection, ReadRouting
+from app.models.user import TokenPrincipal
 from app.models.diagnosis import DiagnosisResponse
 from bson import ObjectId
-from app.controllers.disease_controller import convert_objectids_to_str
+from app.utils.image_delivery import add_image_urls
+
+# Fields needed for DiagnosisResponse; leaves the raw provider payload on the server
+HISTORY_PROJECTION = {
+    "crop_type": 1,
+    "image_url": 1,
+    "image_path": 1,
+    "image_key": 1,
+    "predicted_disease": 1,
+    "confidence_score": 1,
+    "advisory": 1,
+    "created_at": 1
+}
 
 class DashboardController:
     def __init__(self):
        pass
     
-    async def get_user_diagnosis_history(self, current_user: UserInDB, limit: int = 50) -> List[DiagnosisResponse]:
-        self.db = get_database()
-        
+    async def get_user_diagnosis_history(self, current_user: TokenPrincipal, limit: int = 50) -> List[DiagnosisResponse]:
         """Get diagnosis history for a user"""
-        self.db = get_database()
+        diagnoses_collection = get_collection("diagnoses", ReadRouting.ANALYTICS)
         try:
-            cursor = self.db.diagnoses.find(
-                {"user_id": str(current_user.id)}
+            cursor = diagnoses_collection.find(
+                {"user_id": str(current_user.id)}, HISTORY_PROJECTION
             ).sort("created_at", -1).limit(limit)
             
             diagnoses = []
-            async for diagnosis in cursor:
-                doc = convert_objectids_to_str(diagnosis)
+            async for doc in cursor:
+                add_image_urls(doc)
                 diagnoses.append(DiagnosisResponse(
-                    id=doc["_id"],
+                    id=str(doc["_id"]),
                     crop_type=doc["crop_type"],
                     image_url=doc["image_url"],
+                    thumbnail_url=doc.get("thumbnail_url"),
                     predicted_disease=doc["predicted_disease"],
                     confidence_score=doc["confidence_score"],
                     advisory=doc.get("advisory"),
@@ -37,13 +48,12 @@ class DashboardController:
         except Exception as e:
             raise Exception(f"Failed to fetch diagnosis history: {str(e)}")
     
-    async def get_user_statistics(self, current_user: UserInDB) -> dict:
-        self.db = get_database()
+    async def get_user_statistics(self, current_user: TokenPrincipal) -> dict:
         """Get user statistics"""
-        self.db = get_database()
+        diagnoses_collection = get_collection("diagnoses", ReadRouting.ANALYTICS)
         try:
             # Total diagnoses
-            total_diagnoses = await self.db.diagnoses.count_documents(
+            total_diagnoses = await diagnoses_collection.count_documents(
                 {"user_id": str(current_user.id)}
             )
             
@@ -56,7 +66,7 @@ class DashboardController:
             ]
             
             common_diseases = []
-            async for result in self.db.diagnoses.aggregate(pipeline):
+            async for result in diagnoses_collection.aggregate(pipeline):
                 common_diseases.append({
                     "disease": result["_id"],
                     "count": result["count"]
@@ -65,7 +75,7 @@ class DashboardController:
             # Most common crops
             pipeline[1]["$group"]["_id"] = "$crop_type"
             common_crops = []
-            async for result in self.db.diagnoses.aggregate(pipeline):
+            async for result in diagnoses_collection.aggregate(pipeline):
                 common_crops.append({
                     "crop": result["_id"],
                     "count": result["count"]
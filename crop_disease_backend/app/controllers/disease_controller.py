@@ -1,36 +1,111 @@
 # disease_controller.py
-from fastapi import HTTPException, UploadFile
+from fastapi import BackgroundTasks, HTTPException, UploadFile
 from PIL import Image
-from app.database import get_database, ensure_connection, is_database_connected
-from app.models.user import UserInDB, PyObjectId
-from app.models.diagnosis import DiagnosisCreate, DiagnosisInDB, PredictionResult
-from app.utils.image_utils import save_image, preprocess_image
-from app.utils.kindwise_api import KindwiseAPI
+from app.database import get_database, get_collection, is_database_connected, ReadRouting
+from app.models.user import UserInDB, PyObjectId, TokenPrincipal
+from app.models.diagnosis import (
+    DiagnosisCreate, DiagnosisInDB, PredictionResult, DiagnosisBatchDelete, DiagnosisBatchDeleteResult
+)
+from app.utils.image_storage import (
+    StoredImage, store_images, release_image, release_images, purge_images
+)
+from app.utils.storage import get_image_store
+from app.utils.image_delivery import add_image_urls, diagnosis_image_keys, delete_derivatives
+from app.utils.detection import detect, provisional_detection
 from app.utils.gemini_utils import GeminiAPI
 from app.controllers.advisory_controller import AdvisoryController
+from app.config import settings
 from bson import ObjectId
-from typing import Optional
+from collections import Counter
+from datetime import datetime, timedelta
+from typing import Any, AsyncIterator, Dict, List, Optional, Tuple
+import asyncio
 import logging
-import os
-from app.utils.mongo_utils import convert_objectids_to_str
+from app.utils.bulk_writer import bulk_writer, log_write_failure
+from pymongo import UpdateOne
 
 logger = logging.getLogger(__name__)
 
+# Enough of a diagnosis to find its image
+IMAGE_FIELDS = {"image_key": 1, "image_keys": 1, "image_path": 1, "image_url": 1}
+
+# A batch delete marks the diagnoses it is about to remove; older marks belong to a request that died
+DELETE_CLAIM_SECONDS = 60
+
+def unclaimed(now: datetime) -> Dict[str, Any]:
+    """Filter for diagnoses no live batch delete has marked for removal"""
+    return {"$or": [
+        {"deleting_at": {"$exists": False}},
+        {"deleting_at": {"$lt": now - timedelta(seconds=DELETE_CLAIM_SECONDS)}}
+    ]}
+
+def new_diagnosis(user_id: str, crop_type: str, keys: List[str], disease_name: str, confidence_score: float,
+                  advisory: Dict[str, Any], disease_info: Dict[str, Any],
+                  captured_at: Optional[datetime] = None) -> dict:
+    """Diagnosis document for the stored photos `keys` (the first is the primary image)"""
+    return DiagnosisInDB(
+        user_id=user_id,
+        crop_type=crop_type,
+        image_path=get_image_store().uri(keys[0]),
+        image_url=f"/images/original/{keys[0]}",
+        image_key=keys[0],
+        image_keys=keys if len(keys) > 1 else None,
+        predicted_disease=disease_name,
+        confidence_score=confidence_score,
+        advisory=advisory,
+        api_response=disease_info,
+        captured_at=captured_at
+    ).dict(by_alias=True)
+
+def prediction_response(diagnosis: dict, sign_urls: bool = True) -> dict:
+    """
+    Map a new diagnosis to frontend-expected keys for immediate display.
+    With sign_urls=False the image keys are kept instead of signed URLs, for
+    responses stored longer than a URL stays valid (see sign_prediction).
+    """
+    response = {
+        "disease_name": diagnosis.get("predicted_disease", "N/A"),
+        "confidence_score": diagnosis.get("confidence_score", 0.0),
+        "crop_type": diagnosis.get("crop_type", ""),
+        "advisory": diagnosis.get("advisory", {}),
+        "api_response": diagnosis.get("api_response", {}),
+        "image_key": diagnosis.get("image_key"),
+        "image_keys": diagnosis.get("image_keys"),
+        "captured_at": diagnosis.get("captured_at"),
+        "created_at": diagnosis.get("created_at", ""),
+        "_id": diagnosis.get("_id", "")
+    }
+    return sign_prediction(response) if sign_urls else response
+
+def sign_prediction(response: dict) -> dict:
+    """Replace the image keys of an unsigned prediction response with freshly signed URLs"""
+    signed = {k: v for k, v in response.items() if k not in ("image_key", "image_keys")}
+    urls = add_image_urls({"image_key": response.get("image_key"), "image_keys": response.get("image_keys")})
+    signed["image_url"] = urls.get("image_url", "")
+    signed["thumbnail_url"] = urls.get("thumbnail_url", "")
+    signed["images"] = urls.get("images", [])
+    return signed
+
+async def remove_images(keys: List[str]):
+    """Delete images (and their derivatives) whose last reference was released"""
+    try:
+        for key in await purge_images(keys):
+            await delete_derivatives(key)
+    except Exception as e:
+        # Whatever is left is picked up by the retention pass
+        logger.error(f"Failed to remove released images: {e}")
+
 class DiseaseController:
     def __init__(self):
         self.advisory_controller = AdvisoryController()
-        self.kindwise_api = KindwiseAPI()
         self.gemini_api = GeminiAPI()
     
     async def _get_db(self):
         """Get database instance with proper error handling and connection check"""
         try:
+            # Reconnection happens in the background heartbeat, off the request path
             if not is_database_connected():
-                logger.warning("Database not connected, attempting to connect...")
-                await ensure_connection()
-            
-            if not is_database_connected():
-                logger.error("Failed to establish database connection")
+                logger.error("Database connection not available")
                 return None
                 
             return get_database()
@@ -38,21 +113,72 @@ class DiseaseController:
             logger.error(f"Database connection error: {e}")
             return None
     
-    async def predict_disease(self, file: UploadFile, crop_type: str, current_user: UserInDB) -> dict:
-        """Predict disease from uploaded image and generate advisory using Gemini API"""
+    async def _identify(self, stored_images: List[Tuple[StoredImage, bytes]], crop_type: str):
+        """Identify the stored photos with the configured detection provider"""
+        detection = await detect([data for _, data in stored_images], crop_type)
+        logger.info(f"Identified by {detection.provider} in {detection.latency_ms:.0f} ms")
+        # Recorded with the diagnosis so results can be compared across providers
+        disease_info = {
+            **detection.info,
+            "provider": detection.provider,
+            "provider_latency_ms": round(detection.latency_ms, 1),
+            "provider_cost": detection.cost
+        }
+        return detection.disease_name, detection.confidence, disease_info
+    
+    async def _resolve_advisory(self, disease_name: str, crop_type: str, confidence_score: float,
+                                disease_info: Dict[str, Any]) -> Dict[str, Any]:
+        """Stored advisory for the disease-crop pair, or a newly generated one"""
+        # First, check if we already have an advisory for this disease-crop combination
+        existing_advisory = await self.advisory_controller.get_advisory_by_disease(disease_name, crop_type)
+        
+        if existing_advisory:
+            logger.info(f"Using existing advisory for {disease_name} on {crop_type}")
+            return existing_advisory if isinstance(existing_advisory, dict) else existing_advisory.dict()
+        
+        # Generate new advisory using Gemini API
+        logger.info(f"Generating new advisory using Gemini API for {disease_name} on {crop_type}")
+        advisory = await asyncio.to_thread(
+            self.gemini_api.generate_advisory,
+            disease_name=disease_name,
+            crop_type=crop_type,
+            confidence_score=confidence_score,
+            kindwise_response=disease_info
+        )
+        
+        # Store the generated advisory for future use. Batched and not
+        # awaited; the upsert keeps one advisory per disease-crop pair.
         try:
-            logger.info(f"Starting disease prediction for user {current_user.email}")
+            advisory_with_timestamp = {**advisory, 'created_at': datetime.utcnow()}
             
-            # Save uploaded image
-            file_path, file_url = await save_image(file)
-            logger.info(f"Image saved: {file_path}")
+            bulk_writer.submit("advisories", UpdateOne(
+                {"disease_name": disease_name, "crop_type": crop_type},
+                {"$setOnInsert": advisory_with_timestamp},
+                upsert=True
+            )).add_done_callback(log_write_failure)
+            logger.info(f"Queued new advisory for {disease_name} on {crop_type}")
+        except Exception as e:
+            logger.warning(f"Failed to store advisory in database: {e}")
+            # Continue even if storage fails
+        return advisory
+    
+    async def predict_disease(self, files: List[UploadFile], crop_type: str, current_user: UserInDB,
+                              sign_urls: bool = True) -> dict:
+        """
+        Predict disease from one or more photos of the same plant and generate
+        advisory using Gemini API. All photos go into one Kindwise request and
+        produce one diagnosis.
+        """
+        try:
+            logger.info(f"Starting disease prediction for user {current_user.email} ({len(files)} images)")
             
-            # Load and preprocess image
-            image = preprocess_image(file_path)
-            logger.info("Image preprocessed successfully")
+            # Save uploaded images (transcoded concurrently on the image pool)
+            stored_images = await store_images(files, str(current_user.id))
+            keys = [stored.key for stored, _ in stored_images]
+            logger.info(f"Images saved: {get_image_store().uri(keys[0])}" + (f" and {len(keys) - 1} more" if len(keys) > 1 else ""))
             
-            # Predict disease using Kindwise API
-            disease_name, confidence_score, disease_info = self.kindwise_api.predict_disease(image, crop_type)
+            # Predict disease using Kindwise API (one request for all photos)
+            disease_name, confidence_score, disease_info = await self._identify(stored_images, crop_type)
             logger.info(f"Disease prediction completed: {disease_name} with confidence {confidence_score}")
             
             # Get database connection
@@ -60,71 +186,17 @@ class DiseaseController:
             if db is None:
                 raise HTTPException(status_code=503, detail="Database service unavailable")
             
-            # First, check if we already have an advisory for this disease-crop combination
-            existing_advisory = await self.advisory_controller.get_advisory_by_disease(disease_name, crop_type)
+            advisory = await self._resolve_advisory(disease_name, crop_type, confidence_score, disease_info)
             
-            if existing_advisory:
-                logger.info(f"Using existing advisory for {disease_name} on {crop_type}")
-                advisory = existing_advisory if isinstance(existing_advisory, dict) else existing_advisory.dict()
-            else:
-                # Generate new advisory using Gemini API
-                logger.info(f"Generating new advisory using Gemini API for {disease_name} on {crop_type}")
-                advisory = self.gemini_api.generate_advisory(
-                    disease_name=disease_name,
-                    crop_type=crop_type,
-                    confidence_score=confidence_score,
-                    kindwise_response=disease_info
-                )
-                
-                # Store the generated advisory in database for future use
-                try:
-                    advisory_with_timestamp = advisory.copy()
-                    from datetime import datetime
-                    advisory_with_timestamp['created_at'] = datetime.utcnow()
-                    
-                    await db.advisories.insert_one(advisory_with_timestamp)
-                    logger.info(f"Stored new advisory for {disease_name} on {crop_type}")
-                except Exception as e:
-                    logger.warning(f"Failed to store advisory in database: {e}")
-                    # Continue even if storage fails
-            
-            # Convert user ID to string
-            user_id = str(current_user.id)
-            
-            # Create diagnosis record
-            diagnosis_in_db = DiagnosisInDB(
-                user_id=user_id,
-                crop_type=crop_type,
-                image_path=file_path,
-                image_url=file_url,
-                predicted_disease=disease_name,
-                confidence_score=confidence_score,
-                advisory=advisory,
-                api_response=disease_info
+            # Save to database (batched with concurrent requests). The stored
+            # document is the one we already hold, so it is not read back.
+            diagnosis = new_diagnosis(
+                str(current_user.id), crop_type, keys, disease_name, confidence_score, advisory, disease_info
             )
+            await bulk_writer.insert("diagnoses", diagnosis)
+            logger.info(f"Diagnosis saved to database with ID: {diagnosis['_id']}")
             
-            # Save to database
-            result = await db.diagnoses.insert_one(diagnosis_in_db.dict(by_alias=True))
-            logger.info(f"Diagnosis saved to database with ID: {result.inserted_id}")
-            
-            # Fetch the inserted document and return with ObjectIds as strings
-            diagnosis = await db.diagnoses.find_one({"_id": result.inserted_id})
-            if not diagnosis:
-                raise HTTPException(status_code=500, detail="Failed to fetch saved diagnosis.")
-            
-            diagnosis = convert_objectids_to_str(diagnosis)
-            
-            # Map to frontend-expected keys for immediate display
-            return {
-                "disease_name": diagnosis.get("predicted_disease", "N/A"),
-                "confidence_score": diagnosis.get("confidence_score", 0.0),
-                "crop_type": diagnosis.get("crop_type", ""),
-                "advisory": diagnosis.get("advisory", {}),
-                "api_response": diagnosis.get("api_response", {}),
-                "image_url": diagnosis.get("image_url", ""),
-                "created_at": diagnosis.get("created_at", ""),
-                "_id": diagnosis.get("_id", "")
-            }
+            return prediction_response(diagnosis, sign_urls)
         
         except HTTPException:
             raise
@@ -132,7 +204,95 @@ class DiseaseController:
             logger.error(f"Prediction failed: {str(e)}")
             raise HTTPException(status_code=500, detail=f"Prediction failed: {str(e)}")
     
-    async def get_diagnosis_history(self, current_user: UserInDB, limit: int = 10):
+    async def predict_batch(self, items: List[Tuple[UploadFile, str, Optional[datetime]]],
+                            current_user: UserInDB) -> AsyncIterator[dict]:
+        """
+        Diagnose a bundle of (photo, crop type, capture time) items, one
+        diagnosis each, with at most BATCH_PREDICT_CONCURRENCY in flight.
+        Returns an iterator yielding each item's result as it finishes and a
+        summary last. Advisories are resolved once per disease-crop pair, and
+        inserts from items finishing together share one bulk write. With
+        DETECTION_PROVISIONAL_PROVIDER set, an item's quick provisional result
+        is yielded first while the primary provider is still working on it.
+        """
+        db = await self._get_db()
+        if db is None:
+            raise HTTPException(status_code=503, detail="Database service unavailable")
+        
+        user_id = str(current_user.id)
+        semaphore = asyncio.Semaphore(settings.BATCH_PREDICT_CONCURRENCY)
+        advisories: Dict[Tuple[str, str], asyncio.Task] = {}
+        # Provisional and final results, in the order they become available
+        lines: asyncio.Queue = asyncio.Queue()
+        
+        async def advisory_for(disease_name, crop_type, confidence_score, disease_info):
+            pair = (disease_name.lower(), crop_type.lower())
+            if pair not in advisories:
+                advisories[pair] = asyncio.ensure_future(
+                    self._resolve_advisory(disease_name, crop_type, confidence_score, disease_info)
+                )
+            # Shared by every item with this pair, so one cancelled item must not cancel it
+            return await asyncio.shield(advisories[pair])
+        
+        async def identify(item: dict, stored_images, crop_type: str):
+            primary = asyncio.ensure_future(self._identify(stored_images, crop_type))
+            try:
+                if settings.DETECTION_PROVISIONAL_PROVIDER:
+                    detection = await provisional_detection([data for _, data in stored_images], crop_type)
+                    if detection is not None and not primary.done():
+                        lines.put_nowait({**item, "status": "provisional", "result": {
+                            "disease_name": detection.disease_name,
+                            "confidence_score": detection.confidence,
+                            "provider": detection.provider
+                        }})
+                return await primary
+            finally:
+                primary.cancel()
+        
+        async def process(index: int, file: UploadFile, crop_type: str, captured_at: Optional[datetime]) -> dict:
+            item = {"index": index, "filename": file.filename}
+            try:
+                if not file.content_type or not file.content_type.startswith('image/'):
+                    raise HTTPException(status_code=400, detail="File must be an image")
+                async with semaphore:
+                    stored_images = await store_images([file], user_id)
+                    disease_name, confidence_score, disease_info = await identify(item, stored_images, crop_type)
+                    advisory = await advisory_for(disease_name, crop_type, confidence_score, disease_info)
+                diagnosis = new_diagnosis(
+                    user_id, crop_type, [stored_images[0][0].key], disease_name, confidence_score,
+                    advisory, disease_info, captured_at
+                )
+                await bulk_writer.insert("diagnoses", diagnosis)
+                return {**item, "status": "ok", "result": prediction_response(diagnosis)}
+            except HTTPException as e:
+                return {**item, "status": "error", "status_code": e.status_code, "detail": e.detail}
+            except Exception as e:
+                logger.error(f"Batch prediction item {index} failed: {e}")
+                return {**item, "status": "error", "status_code": 500, "detail": f"Prediction failed: {str(e)}"}
+        
+        async def results():
+            async def run(index, item):
+                lines.put_nowait(await process(index, *item))
+            
+            tasks = [asyncio.ensure_future(run(index, item)) for index, item in enumerate(items)]
+            succeeded = finished = 0
+            try:
+                while finished < len(items):
+                    result = await lines.get()
+                    if result["status"] != "provisional":
+                        finished += 1
+                        succeeded += result["status"] == "ok"
+                    yield result
+                logger.info(f"Batch prediction for user {current_user.email}: {succeeded} of {len(items)} succeeded")
+                yield {"done": True, "succeeded": succeeded, "failed": len(items) - succeeded}
+            finally:
+                # The client went away; stop work that has not finished
+                for task in tasks:
+                    task.cancel()
+        
+        return results()
+    
+    async def get_diagnosis_history(self, current_user: TokenPrincipal, limit: int = 10):
         """Get user's diagnosis history"""
         try:
             db = await self._get_db()
@@ -140,20 +300,17 @@ class DiseaseController:
                 logger.warning("Database not available, returning empty history")
                 return []
             
-            cursor = db.diagnoses.find(
+            cursor = get_collection("diagnoses", ReadRouting.ANALYTICS).find(
                 {"user_id": str(current_user.id)}
             ).sort("created_at", -1).limit(limit)
             
-            diagnoses = []
-            async for doc in cursor:
-                diagnoses.append(convert_objectids_to_str(doc))
-            
-            return diagnoses
+            diagnoses = await cursor.to_list(length=limit)
+            return [add_image_urls(doc) for doc in diagnoses]
         except Exception as e:
             logger.error(f"Failed to fetch diagnosis history: {str(e)}")
             return []
     
-    async def get_diagnosis_by_id(self, diagnosis_id: str, current_user: UserInDB):
+    async def get_diagnosis_by_id(self, diagnosis_id: str, current_user: TokenPrincipal):
         """Get specific diagnosis by ID"""
         try:
             db = await self._get_db()
@@ -168,7 +325,7 @@ class DiseaseController:
             if not diagnosis:
                 raise HTTPException(status_code=404, detail="Diagnosis not found")
             
-            return convert_objectids_to_str(diagnosis)
+            return add_image_urls(diagnosis)
         except HTTPException:
             raise
         except Exception as e:
@@ -182,25 +339,91 @@ class DiseaseController:
             if db is None:
                 raise HTTPException(status_code=503, detail="Database service unavailable")
             
-            diagnosis = await db.diagnoses.find_one({
-                "_id": ObjectId(diagnosis_id),
-                "user_id": str(current_user.id)
-            })
-            
+            # Atomic, so a concurrent batch delete cannot release the image twice
+            diagnosis = await db.diagnoses.find_one_and_delete(
+                {"_id": ObjectId(diagnosis_id), "user_id": str(current_user.id), **unclaimed(datetime.utcnow())},
+                projection=IMAGE_FIELDS
+            )
+
             if not diagnosis:
                 raise HTTPException(status_code=404, detail="Diagnosis not found")
-            
-            # Delete the image file if it exists
-            image_path = diagnosis.get("image_path")
-            if image_path and os.path.exists(image_path):
-                os.remove(image_path)
-            
-            # Delete the diagnosis from the database
-            await db.diagnoses.delete_one({"_id": ObjectId(diagnosis_id)})
-            
+
+            # Delete the images once no other diagnosis references them
+            for key in diagnosis_image_keys(diagnosis):
+                if await release_image(key):
+                    await delete_derivatives(key)
+
             return {"detail": "Diagnosis and image deleted successfully."}
         except HTTPException:
             raise
         except Exception as e:
             logger.error(f"Failed to delete diagnosis: {str(e)}")
-            raise HTTPException(status_code=500, detail=f"Failed to delete diagnosis: {str(e)}")
\ No newline at end of file
+            raise HTTPException(status_code=500, detail=f"Failed to delete diagnosis: {str(e)}")
+    
+    async def delete_diagnoses(self, request: DiagnosisBatchDelete, current_user: UserInDB,
+                               background_tasks: BackgroundTasks) -> DiagnosisBatchDeleteResult:
+        """
+        Delete many diagnoses with one delete_many. The matches are marked
+        first, so the reported statuses and released image references cover
+        exactly the diagnoses this request removed (not those a concurrent
+        request got to first). References are released in one bulk write;
+        removing unreferenced files runs after the response.
+        """
+        db = await self._get_db()
+        if db is None:
+            raise HTTPException(status_code=503, detail="Database service unavailable")
+        
+        limit = settings.DIAGNOSIS_BATCH_DELETE_LIMIT
+        query = {"user_id": str(current_user.id)}
+        if request.crop_type:
+            query["crop_type"] = request.crop_type
+        if request.predicted_disease:
+            query["predicted_disease"] = request.predicted_disease
+        created = {}
+        if request.created_before:
+            created["$lt"] = request.created_before
+        if request.created_after:
+            created["$gte"] = request.created_after
+        if created:
+            query["created_at"] = created
+        if request.ids is None and len(query) == 1:
+            raise HTTPException(status_code=400, detail="Provide ids or at least one filter")
+        
+        statuses = {}
+        if request.ids is not None:
+            if len(request.ids) > limit:
+                raise HTTPException(status_code=400, detail=f"At most {limit} ids per request")
+            statuses = {i: "not_found" if ObjectId.is_valid(i) else "invalid_id" for i in request.ids}
+            query["_id"] = {"$in": [ObjectId(i) for i in request.ids if ObjectId.is_valid(i)]}
+        
+        now = datetime.utcnow()
+        query.update(unclaimed(now))
+        found = await db.diagnoses.find(query, IMAGE_FIELDS).limit(limit).to_list(length=limit)
+        deleted = found
+        if found:
+            claim = ObjectId()
+            result = await db.diagnoses.update_many(
+                {"_id": {"$in": [d["_id"] for d in found]}, "user_id": query["user_id"], **unclaimed(now)},
+                {"$set": {"deleting_by": claim, "deleting_at": now}}
+            )
+            if result.modified_count < len(found):
+                # Some were removed or claimed by a concurrent request since the find; that request reports them
+                deleted = await db.diagnoses.find({"deleting_by": claim}, IMAGE_FIELDS).to_list(length=None)
+            await db.diagnoses.delete_many({"deleting_by": claim})
+        deleted_count = len(deleted)
+        for diagnosis in deleted:
+            statuses[str(diagnosis["_id"])] = "deleted"
+        if deleted:
+            references = Counter(key for d in deleted for key in diagnosis_image_keys(d))
+            released = await release_images(dict(references))
+            if released:
+                background_tasks.add_task(remove_images, released)
+        
+        has_more = request.ids is None and len(found) == limit and \
+            await db.diagnoses.find_one(query, {"_id": 1}) is not None
+        logger.info(f"Batch deleted {deleted_count} diagnoses for user {current_user.email}")
+        return DiagnosisBatchDeleteResult(
+            deleted_count=deleted_count,
+            results=[{"id": i, "status": status} for i, status in statuses.items()],
+            has_more=has_more
+        )
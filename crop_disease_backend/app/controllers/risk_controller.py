@@ -0,0 +1,143 @@
+# risk_controller.py
+from datetime import datetime, timedelta
+from typing import Any, Dict, List, Optional
+from app.database import get_database, get_collection, ReadRouting
+from app.config import settings
+from app.utils.risk_utils import compute_risk_scores
+from app.utils.scheduling import run_periodically
+from app.utils.weather_utils import get_weather_data, normalize_region
+from pymongo import ReplaceOne
+import asyncio
+import logging
+import numpy as np
+
+logger = logging.getLogger(__name__)
+
+# Diagnoses with these labels found no disease and say nothing about disease risk
+HEALTHY_LABEL_PATTERN = r"^\s*(healthy|no[ _-]?disease|none)\s*$"
+
+class RiskController:
+    async def _historical_distribution(self) -> List[Dict[str, Any]]:
+        """Diagnosis counts per (region, crop, disease) over the history window"""
+        since = datetime.utcnow() - timedelta(days=settings.RISK_HISTORY_DAYS)
+        pipeline = [
+            {"$match": {
+                "created_at": {"$gte": since},
+                "predicted_disease": {"$not": {"$regex": HEALTHY_LABEL_PATTERN, "$options": "i"}}
+            }},
+            {"$group": {
+                "_id": {
+                    "user_id": "$user_id",
+                    "crop": {"$toLower": "$crop_type"},
+                    "disease": "$predicted_disease"
+                },
+                "count": {"$sum": 1}
+            }},
+            # Diagnoses only reference the user, whose profile holds the region
+            {"$lookup": {
+                "from": "users",
+                "let": {"uid": {"$toObjectId": "$_id.user_id"}},
+                "pipeline": [
+                    {"$match": {"$expr": {"$eq": ["$_id", "$$uid"]}}},
+                    {"$project": {"region": 1}}
+                ],
+                "as": "user"
+            }},
+            {"$unwind": "$user"},
+            {"$group": {
+                "_id": {
+                    "region": {"$toLower": "$user.region"},
+                    "crop": "$_id.crop",
+                    "disease": "$_id.disease"
+                },
+                "count": {"$sum": "$count"}
+            }}
+        ]
+        
+        rows = []
+        async for row in get_collection("diagnoses", ReadRouting.ANALYTICS).aggregate(pipeline):
+            rows.append({
+                "region": normalize_region(row["_id"]["region"] or ""),
+                "crop_type": row["_id"]["crop"],
+                "disease": row["_id"]["disease"],
+                "count": row["count"]
+            })
+        return [row for row in rows if row["region"]]
+    
+    async def refresh_risk_forecasts(self) -> int:
+        """
+        Recompute risk scores for every region with diagnosis history and
+        store one document per region in risk_forecasts. Returns the number
+        of regions written.
+        """
+        db = get_database()
+        rows = await self._historical_distribution()
+        if not rows:
+            logger.info("No diagnosis history available for risk forecasts")
+            return 0
+        
+        regions, region_index = np.unique([row["region"] for row in rows], return_inverse=True)
+        _, group_index = np.unique(
+            [f"{row['region']}\x00{row['crop_type']}" for row in rows], return_inverse=True
+        )
+        
+        weather = await asyncio.gather(*(get_weather_data(region) for region in regions))
+        temperatures = np.array([w["temperature"] if w else np.nan for w in weather], dtype=float)
+        humidities = np.array([w["humidity"] if w else np.nan for w in weather], dtype=float)
+        
+        scores, levels = compute_risk_scores(
+            np.array([row["count"] for row in rows]),
+            group_index,
+            region_index,
+            temperatures,
+            humidities
+        )
+        
+        forecasts: Dict[str, List[Dict[str, Any]]] = {region: [] for region in regions.tolist()}
+        for row, score, level in zip(rows, scores.tolist(), levels.tolist()):
+            forecasts[row["region"]].append({
+                "crop_type": row["crop_type"],
+                "disease": row["disease"],
+                "score": score,
+                "level": level,
+                "observations": row["count"]
+            })
+        
+        computed_at = datetime.utcnow()
+        operations = [
+            ReplaceOne(
+                {"_id": region},
+                {
+                    "_id": region,
+                    "region": region,
+                    "weather": weather[i],
+                    "risks": sorted(forecasts[region], key=lambda r: r["score"], reverse=True),
+                    "computed_at": computed_at
+                },
+                upsert=True
+            )
+            for i, region in enumerate(regions.tolist())
+        ]
+        await db.risk_forecasts.bulk_write(operations, ordered=False)
+        
+        logger.info(f"Refreshed risk forecasts for {len(regions)} regions")
+        return len(regions)
+    
+    async def get_risk_forecast(self, region: str, crop_type: Optional[str] = None) -> Optional[Dict[str, Any]]:
+        """Precomputed risk forecast for a region (single primary-key lookup)"""
+        db = get_database()
+        forecast = await db.risk_forecasts.find_one({"_id": normalize_region(region)})
+        if not forecast:
+            return None
+        
+        if crop_type:
+            crop = crop_type.lower()
+            forecast["risks"] = [r for r in forecast["risks"] if r["crop_type"] == crop]
+        return forecast
+
+async def run_risk_forecast_scheduler():
+    """Background loop refreshing risk forecasts on a fixed interval, in one worker at a time"""
+    controller = RiskController()
+    await run_periodically(
+        "risk_forecasts", settings.RISK_FORECAST_INTERVAL_MINUTES * 60, controller.refresh_risk_forecasts
+    )
@@ -0,0 +1,146 @@
+# upload_controller.py
+from fastapi import HTTPException, UploadFile
+from starlette.datastructures import Headers
+from pymongo import ReturnDocument
+from app.config import settings
+from app.database import get_database, is_database_connected
+from app.models.upload import UploadSessionInDB, UploadStatus
+from app.models.user import UserInDB
+from app.controllers.disease_controller import DiseaseController
+from app.utils.resumable_uploads import append_chunks, create_partial, partial_path, remove_partial
+from datetime import datetime, timedelta
+from typing import AsyncIterator, Optional
+import asyncio
+import logging
+import os
+
+logger = logging.getLogger(__name__)
+
+def upload_status(session: dict) -> UploadStatus:
+    return UploadStatus(
+        id=session["_id"],
+        location=f"/uploads/{session['_id']}",
+        length=session["length"],
+        offset=session["offset"],
+        expires_at=session["updated_at"] + timedelta(minutes=settings.UPLOAD_SESSION_TTL_MINUTES)
+    )
+
+class UploadController:
+    """
+    Resumable uploads: create a session, append chunks at its offset (a
+    dropped connection keeps what arrived), then finalize it into the normal
+    prediction pipeline.
+    """
+    def __init__(self):
+        self.disease_controller = DiseaseController()
+
+    async def _get_db(self):
+        if not is_database_connected():
+            raise HTTPException(status_code=503, detail="Database service unavailable")
+        return get_database()
+
+    async def _claim(self, upload_id: str, current_user: UserInDB) -> dict:
+        """Lock a session for one writer; stale locks (a crashed request) are taken over"""
+        db = await self._get_db()
+        now = datetime.utcnow()
+        stale = now - timedelta(seconds=settings.UPLOAD_LOCK_TIMEOUT_SECONDS)
+        session = await db.upload_sessions.find_one_and_update(
+            {
+                "_id": upload_id,
+                "user_id": str(current_user.id),
+                "$or": [{"locked_at": None}, {"locked_at": {"$lt": stale}}]
+            },
+            {"$set": {"locked_at": now}},
+            return_document=ReturnDocument.AFTER
+        )
+        if session is None:
+            await self.get_upload(upload_id, current_user)
+            raise HTTPException(status_code=423, detail="Upload is being written by another request")
+        return session
+
+    async def _release(self, upload_id: str, **changes):
+        db = await self._get_db()
+        await db.upload_sessions.update_one({"_id": upload_id}, {"$set": {**changes, "locked_at": None}})
+
+    async def create_upload(self, length: int, filename: Optional[str], content_type: Optional[str],
+                            current_user: UserInDB) -> UploadStatus:
+        """Start a resumable upload of `length` bytes"""
+        if length <= 0 or length > settings.MAX_FILE_SIZE:
+            raise HTTPException(
+                status_code=413 if length > 0 else 400,
+                detail=f"Upload-Length must be between 1 and {settings.MAX_FILE_SIZE} bytes"
+            )
+        # Rejected now rather than after the bytes were sent
+        if not filename or os.path.splitext(filename)[1].lower() not in settings.ALLOWED_EXTENSIONS:
+            raise HTTPException(
+                status_code=400,
+                detail=f"File type not allowed. Supported types: {', '.join(settings.ALLOWED_EXTENSIONS)}"
+            )
+        if not content_type or not content_type.startswith('image/'):
+            raise HTTPException(status_code=400, detail="File must be an image")
+
+        db = await self._get_db()
+        session = UploadSessionInDB(
+            user_id=str(current_user.id), filename=filename, content_type=content_type, length=length
+        ).dict(by_alias=True)
+        await create_partial(session["_id"])
+        await db.upload_sessions.insert_one(session)
+        logger.info(f"Created upload {session['_id']} ({length} bytes) for user {current_user.email}")
+        return upload_status(session)
+
+    async def get_upload(self, upload_id: str, current_user: UserInDB) -> UploadStatus:
+        db = await self._get_db()
+        session = await db.upload_sessions.find_one({"_id": upload_id, "user_id": str(current_user.id)})
+        if session is None:
+            raise HTTPException(status_code=404, detail="Upload not found or expired")
+        return upload_status(session)
+
+    async def append_chunk(self, upload_id: str, offset: int, chunks: AsyncIterator[bytes],
+                           current_user: UserInDB) -> UploadStatus:
+        """Append a request body at `offset`, which must be the upload's current offset"""
+        session = await self._claim(upload_id, current_user)
+        written = 0
+        try:
+            if session["offset"] != offset:
+                raise HTTPException(status_code=409, detail=f"Upload-Offset should be {session['offset']}")
+            written = await append_chunks(upload_id, offset, session["length"] - offset, chunks)
+        finally:
+            # Record whatever arrived, even from an interrupted body
+            session["offset"] += written
+            session["updated_at"] = datetime.utcnow()
+            await self._release(upload_id, offset=session["offset"], updated_at=session["updated_at"])
+        return upload_status(session)
+
+    async def finalize_upload(self, upload_id: str, crop_type: str, current_user: UserInDB) -> dict:
+        """Run prediction on a complete upload; the session and its file are removed on success"""
+        session = await self._claim(upload_id, current_user)
+        try:
+            if session["offset"] != session["length"]:
+                raise HTTPException(
+                    status_code=409, detail=f"Upload incomplete: {session['offset']} of {session['length']} bytes"
+                )
+            handle = await asyncio.to_thread(open, partial_path(upload_id), "rb")
+            try:
+                upload = UploadFile(
+                    file=handle, size=session["length"], filename=session["filename"],
+                    headers=Headers({"content-type": session["content_type"]})
+                )
+                result = await self.disease_controller.predict_disease([upload], crop_type, current_user)
+            finally:
+                await asyncio.to_thread(handle.close)
+        except BaseException:
+            # Leave the upload in place so finalizing can be retried
+            await self._release(upload_id)
+            raise
+
+        db = await self._get_db()
+        await db.upload_sessions.delete_one({"_id": upload_id})
+        await remove_partial(upload_id)
+        return result
+
+    async def delete_upload(self, upload_id: str, current_user: UserInDB):
+        """Abandon an upload"""
+        await self._claim(upload_id, current_user)
+        db = await self._get_db()
+        await db.upload_sessions.delete_one({"_id": upload_id})
+        await remove_partial(upload_id)
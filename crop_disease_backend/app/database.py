@@ -1,9 +1,12 @@
 # database.py
-from motor.motor_asyncio import AsyncIOMotorClient, AsyncIOMotorDatabase
+from motor.motor_asyncio import AsyncIOMotorClient, AsyncIOMotorDatabase, AsyncIOMotorCollection
 from pymongo.errors import ConnectionFailure, ServerSelectionTimeoutError
+from pymongo.read_preferences import Primary, PrimaryPreferred, Secondary, SecondaryPreferred, Nearest
 from app.config import settings
+from app.utils.metrics import PoolMetricsListener
 import logging
 from typing import Optional
+from datetime import datetime
 import asyncio
 
 logger = logging.getLogger(__name__)
@@ -12,11 +15,67 @@ class Database:
     client: Optional[AsyncIOMotorClient] = None
     database: Optional[AsyncIOMotorDatabase] = None
     connected: bool = False
+    # Maintained by the background heartbeat, never by request handlers
+    last_heartbeat: Optional[datetime] = None
+    last_error: Optional[str] = None
+    consecutive_failures: int = 0
+    heartbeat_task: Optional[asyncio.Task] = None
 
 database = Database()
 
+_READ_PREFERENCE_MODES = {
+    "primary": Primary,
+    "primaryPreferred": PrimaryPreferred,
+    "secondary": Secondary,
+    "secondaryPreferred": SecondaryPreferred,
+    "nearest": Nearest
+}
+
+def validate_read_preferences():
+    """Fail with a clear message on a misspelled read preference, before any query runs"""
+    for name in ("MONGO_READ_PREFERENCE", "ANALYTICS_READ_PREFERENCE"):
+        value = getattr(settings, name)
+        if value not in _READ_PREFERENCE_MODES:
+            raise ValueError(f"{name}={value!r} is not a read preference; "
+                             f"use one of {', '.join(_READ_PREFERENCE_MODES)}")
+
+def get_client_options() -> dict:
+    """Motor client options built from settings"""
+    validate_read_preferences()
+    options = {
+        "serverSelectionTimeoutMS": settings.MONGO_SERVER_SELECTION_TIMEOUT_MS,
+        "connectTimeoutMS": settings.MONGO_CONNECT_TIMEOUT_MS,
+        "socketTimeoutMS": settings.MONGO_SOCKET_TIMEOUT_MS,
+        "maxPoolSize": settings.MONGO_MAX_POOL_SIZE,
+        "minPoolSize": settings.MONGO_MIN_POOL_SIZE,
+        "readPreference": settings.MONGO_READ_PREFERENCE,
+        "event_listeners": [PoolMetricsListener()]
+    }
+    if settings.MONGO_MAX_IDLE_TIME_MS:
+        options["maxIdleTimeMS"] = settings.MONGO_MAX_IDLE_TIME_MS
+    if settings.MONGO_WAIT_QUEUE_TIMEOUT_MS:
+        options["waitQueueTimeoutMS"] = settings.MONGO_WAIT_QUEUE_TIMEOUT_MS
+    if settings.MONGO_COMPRESSORS:
+        options["compressors"] = settings.MONGO_COMPRESSORS
+    return options
+
+async def _connect_to_memory_backend():
+    """Use the in-process stand-in instead of a MongoDB server"""
+    from app.testing.memory_db import MemoryClient
+    
+    database.client = MemoryClient()
+    database.database = database.client[settings.DATABASE_NAME]
+    database.connected = True
+    logger.warning("Using in-memory database backend - data is not persisted")
+    await create_indexes()
+    return True
+
 async def connect_to_mongo():
     """Create database connection with retry logic"""
+    validate_read_preferences()
+    if settings.DATABASE_BACKEND == "memory":
+        return await _connect_to_memory_backend()
+    
     max_retries = 3
     retry_delay = 2
     
@@ -24,15 +83,8 @@ async def connect_to_mongo():
         try:
             logger.info(f"Attempting to connect to MongoDB (attempt {attempt + 1}/{max_retries})")
             
-            # Create client with timeout settings
-            database.client = AsyncIOMotorClient(
-                settings.MONGODB_URL,
-                serverSelectionTimeoutMS=5000,  # 5 second timeout
-                connectTimeoutMS=5000,
-                socketTimeoutMS=5000,
-                maxPoolSize=10,
-                minPoolSize=1
-            )
+            # Create client with pool / timeout settings
+            database.client = AsyncIOMotorClient(settings.MONGODB_URL, **get_client_options())
             
             # Test connection
             await database.client.admin.command('ping')
@@ -69,16 +121,63 @@ async def close_mongo_connection():
         database.connected = False
         logger.info("MongoDB connection closed")
 
+class ReadRouting:
+    """Where a read may be served from"""
+    # Read-your-write paths: always the primary
+    PRIMARY = "primary"
+    # Analytics and list views: may lag behind by up to ANALYTICS_MAX_STALENESS_SECONDS
+    ANALYTICS = "analytics"
+
+def _analytics_read_preference():
+    mode = _READ_PREFERENCE_MODES[settings.ANALYTICS_READ_PREFERENCE]
+    if mode is Primary:
+        return Primary()
+    return mode(max_staleness=settings.ANALYTICS_MAX_STALENESS_SECONDS)
+
+def get_collection(name: str, routing: str = ReadRouting.PRIMARY) -> AsyncIOMotorCollection:
+    """Get a collection whose reads are routed according to `routing`"""
+    db = get_database()
+    if routing == ReadRouting.ANALYTICS:
+        return db.get_collection(name, read_preference=_analytics_read_preference())
+    return db.get_collection(name, read_preference=Primary())
+
 def get_database() -> AsyncIOMotorDatabase:
     """Get database instance with proper error handling"""
     if not database.connected or database.database is None:
         raise ConnectionError("Database connection not available. Please ensure MongoDB is running and properly configured.")
     return database.database
 
+async def ensure_ttl_index(collection: AsyncIOMotorCollection, field: str, seconds: int):
+    """
+    Index `field`, expiring documents `seconds` after its value (0 = never).
+    A changed retention replaces the existing index on the same key.
+    """
+    name = f"{field}_1"
+    current = (await collection.index_information()).get(name)
+    expected = seconds or None
+    if current is not None and current.get("expireAfterSeconds") == expected:
+        return
+    if current is not None:
+        await collection.drop_index(name)
+    if expected:
+        await collection.create_index(field, expireAfterSeconds=expected)
+    else:
+        await collection.create_index(field)
+    logger.info(f"Retention on {collection.name}.{field}: {f'{seconds}s' if expected else 'unlimited'}")
+
+def retention_policies() -> dict:
+    """Collection -> seconds documents are kept after created_at (0 = forever)"""
+    day = 24 * 3600
+    return {
+        "diagnoses": settings.DIAGNOSIS_RETENTION_DAYS * day,
+        "advisories": settings.ADVISORY_RETENTION_DAYS * day
+    }
+
 async def create_indexes():
     """Create database indexes for better performance"""
     try:
-        if not database.connected or not database.database:
+        # Motor databases do not support truth testing
+        if not database.connected or database.database is None:
             return
             
         db = database.database
@@ -93,28 +192,114 @@ async def create_indexes():
         # Diagnosis collection indexes
         try:
             await db.diagnoses.create_index("user_id")
-            await db.diagnoses.create_index("created_at")
+            # Reference counting and orphan collection look diagnoses up by image
+            await db.diagnoses.create_index("image_key")
+            await db.diagnoses.create_index("image_keys")
         except Exception as e:
             logger.warning(f"Error creating diagnosis indexes (may already exist): {e}")
         
+        # Retention (TTL) indexes on created_at
+        for name, seconds in retention_policies().items():
+            try:
+                await ensure_ttl_index(db[name], "created_at", seconds)
+            except Exception as e:
+                logger.warning(f"Error applying retention to {name}: {e}")
+        
+        # Abandoned resumable uploads expire after their last chunk
+        try:
+            await ensure_ttl_index(db.upload_sessions, "updated_at", settings.UPLOAD_SESSION_TTL_MINUTES * 60)
+        except Exception as e:
+            logger.warning(f"Error applying expiry to upload_sessions: {e}")
+        
+        try:
+            await ensure_ttl_index(db.idempotency_keys, "created_at", settings.IDEMPOTENCY_KEY_TTL_HOURS * 3600)
+        except Exception as e:
+            logger.warning(f"Error applying expiry to idempotency_keys: {e}")
+        
+        # Rotated refresh tokens only need remembering until they expire
+        try:
+            await ensure_ttl_index(db.used_refresh_tokens, "created_at", settings.REFRESH_TOKEN_EXPIRE_DAYS * 86400)
+        except Exception as e:
+            logger.warning(f"Error applying expiry to used_refresh_tokens: {e}")
+        
         logger.info("Database indexes created successfully")
     except Exception as e:
         logger.error(f"Error creating indexes: {e}")
 
 async def ensure_connection():
-    """Ensure database connection is active"""
+    """
+    Ensure database connection is active.
+    Reads the health state kept by the heartbeat; performs no I/O.
+    """
+    return is_database_connected()
+
+async def _heartbeat_once() -> bool:
+    """Ping the server (or connect if no client exists yet) and record the result"""
     try:
-        if not database.connected or database.database is None:
-            logger.info("Database not connected, attempting to connect...")
+        if database.client is None:
             await connect_to_mongo()
+            if not database.connected:
+                raise ConnectionError("MongoDB connection attempts failed")
         else:
-            # Test if connection is still alive
-            if database.client is not None:
-                await database.client.admin.command('ping')
+            # The driver reconnects by itself; a ping only tells us when it has
+            await database.client.admin.command('ping')
+            if not database.connected:
+                logger.info("MongoDB connection restored")
+            if database.database is None:
+                # Startup connection failed but the server is reachable now
+                database.database = database.client[settings.DATABASE_NAME]
+                database.connected = True
+                await create_indexes()
+            database.connected = True
+        
+        database.last_heartbeat = datetime.utcnow()
+        database.last_error = None
+        database.consecutive_failures = 0
+        return True
     except Exception as e:
-        logger.error(f"Database connection test failed: {e}")
-        # Try to reconnect
-        await connect_to_mongo()
+        if database.connected:
+            logger.error(f"MongoDB heartbeat failed: {e}")
+        database.connected = False
+        database.last_error = str(e)
+        database.consecutive_failures += 1
+        return False
+
+async def _heartbeat_loop():
+    """Keep the cached health state fresh, backing off while the server is down"""
+    while True:
+        if await _heartbeat_once():
+            delay = settings.MONGO_HEARTBEAT_INTERVAL_SECONDS
+        else:
+            delay = min(
+                settings.MONGO_HEARTBEAT_INTERVAL_SECONDS * 2 ** database.consecutive_failures,
+                settings.MONGO_HEARTBEAT_MAX_BACKOFF_SECONDS
+            )
+        await asyncio.sleep(delay)
+
+def start_heartbeat():
+    """Start the background heartbeat task (idempotent)"""
+    if database.heartbeat_task is None or database.heartbeat_task.done():
+        database.heartbeat_task = asyncio.create_task(_heartbeat_loop())
+
+async def stop_heartbeat():
+    """Stop the background heartbeat task"""
+    task = database.heartbeat_task
+    database.heartbeat_task = None
+    if task is not None:
+        task.cancel()
+        try:
+            await task
+        except asyncio.CancelledError:
+            pass
+
+def get_database_health() -> dict:
+    """Cached database health as last observed by the heartbeat"""
+    return {
+        "connected": is_database_connected(),
+        "last_heartbeat": database.last_heartbeat.isoformat() if database.last_heartbeat else None,
+        "consecutive_failures": database.consecutive_failures,
+        "last_error": database.last_error
+    }
 
 def is_database_connected() -> bool:
     """Check if database is connected"""
@@ -1,15 +1,30 @@
 # main.py
-from fastapi import FastAPI, Request
+from fastapi import FastAPI, Header, Request
 from fastapi.middleware.cors import CORSMiddleware
 from fastapi.middleware.trustedhost import TrustedHostMiddleware
-from fastapi.staticfiles import StaticFiles
 from fastapi.responses import JSONResponse
+import asyncio
 import logging
 import os
+import secrets
+from typing import Optional
 
-from app.database import connect_to_mongo, close_mongo_connection, ensure_connection, is_database_connected
-from app.routes import auth, disease, advisory, dashboard
+from app.database import (
+    connect_to_mongo, close_mongo_connection, is_database_connected,
+    start_heartbeat, stop_heartbeat, get_database_health
+)
+from app.routes import auth, disease, advisory, dashboard, images, uploads
 from app.controllers.advisory_controller import AdvisoryController
+from app.controllers.risk_controller import run_risk_forecast_scheduler
+from app.utils.weather_utils import close_weather_client
+from app.utils.metrics import metrics
+from app.utils.bulk_writer import bulk_writer
+from app.utils.mongo_utils import MongoJSONResponse
+from app.utils.compression import CompressionMiddleware
+from app.utils.image_storage import image_executor
+from app.utils.retention import run_retention_scheduler
+from app.utils.storage import close_image_store
+from app.utils.detection import fallback_providers, get_provider, provider_info
 from app.config import settings
 
 # Configure logging
@@ -25,6 +40,7 @@ app = FastAPI(
     title="Crop Disease Detection API",
     description="AI-powered API for crop disease detection and farmer advisory system using Kindwise and Gemini AI",
     version="2.0.0",
+    default_response_class=MongoJSONResponse,
     docs_url="/docs" if not settings.is_production else None,  # Disable docs in production
     redoc_url="/redoc" if not settings.is_production else None,
     openapi_url="/openapi.json" if not settings.is_production else None
@@ -41,21 +57,32 @@ app.add_middleware(
     CORSMiddleware,
     allow_origins=settings.ALLOWED_ORIGINS,
     allow_credentials=True,
-    allow_methods=["GET", "POST", "PUT", "DELETE", "OPTIONS"],
+    allow_methods=["GET", "HEAD", "POST", "PUT", "PATCH", "DELETE", "OPTIONS"],
     allow_headers=["*"],
     max_age=3600,  # Cache preflight requests for 1 hour
+    # Upload-* and Location drive resumable uploads
+    expose_headers=["ETag", "Location", "Tus-Resumable", "Upload-Offset", "Upload-Length", "Upload-Expires",
+                    "Idempotent-Replayed"],
+)
+
+# Compress JSON responses for clients on metered connections
+app.add_middleware(
+    CompressionMiddleware,
+    minimum_size=settings.COMPRESSION_MINIMUM_SIZE,
+    gzip_level=settings.COMPRESSION_GZIP_LEVEL,
+    brotli_quality=settings.COMPRESSION_BROTLI_QUALITY
 )
 
-# Mount static files
-uploads_dir = os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "uploads")
-os.makedirs(os.path.join(uploads_dir, "images"), exist_ok=True)
-app.mount("/uploads", StaticFiles(directory=uploads_dir), name="uploads")
+
+background_tasks = []
 
 # Include routers
 app.include_router(auth.router)
 app.include_router(disease.router)
 app.include_router(advisory.router)
 app.include_router(dashboard.router)
+app.include_router(images.router)
+app.include_router(uploads.router)
 
 @app.on_event("startup")
 async def startup_event():
@@ -68,8 +95,9 @@ async def startup_event():
             logger.error("SECRET_KEY not set!")
             raise ValueError("SECRET_KEY environment variable is required")
         
-        # Try to connect to MongoDB
+        # Try to connect to MongoDB; the heartbeat keeps retrying if this fails
         db_connected = await connect_to_mongo()
+        start_heartbeat()
         
         if db_connected:
             # Initialize minimal default advisories (optional since we use Gemini)
@@ -82,12 +110,25 @@ async def startup_event():
         else:
             logger.warning("MongoDB not available - running in fallback mode")
         
+        # Run once the heartbeat has connected; one worker does each pass per interval
+        if settings.RISK_FORECAST_INTERVAL_MINUTES > 0:
+            background_tasks.append(asyncio.create_task(run_risk_forecast_scheduler()))
+        if settings.IMAGE_GC_INTERVAL_MINUTES > 0:
+            background_tasks.append(asyncio.create_task(run_retention_scheduler()))
+        
         # Check API configurations
         if settings.KINDWISE_API_KEY and settings.KINDWISE_API_KEY != "your-kindwise-api-key-here":
             logger.info("✓ Kindwise API configured")
         else:
             logger.warning("⚠ Kindwise API key not configured - using mock predictions")
         
+        # Unknown provider names fail here rather than on the first prediction
+        fallbacks = fallback_providers()
+        for name in filter(None, (settings.DETECTION_PROVIDER, settings.DETECTION_PROVISIONAL_PROVIDER, *fallbacks)):
+            get_provider(name)
+        logger.info(f"✓ Disease detection via {settings.DETECTION_PROVIDER}"
+                    + (f" (fallback: {', '.join(fallbacks)})" if fallbacks else ""))
+        
         if settings.GEMINI_API_KEY and settings.GEMINI_API_KEY != "your-gemini-api-key-here":
             logger.info("✓ Gemini AI configured for advisory generation")
         else:
@@ -103,7 +144,15 @@ async def startup_event():
 async def shutdown_event():
     """Clean up database connection"""
     try:
+        for task in background_tasks:
+            task.cancel()
+        await stop_heartbeat()
+        # Flush queued writes before the connection goes away
+        await bulk_writer.close()
         await close_mongo_connection()
+        await close_weather_client()
+        await close_image_store()
+        image_executor.shutdown(wait=False)
         logger.info("Application shutdown completed")
     except Exception as e:
         logger.error(f"Shutdown error: {e}")
@@ -149,9 +198,9 @@ async def root():
 async def health_check():
     """Health check endpoint with detailed status"""
     try:
-        db_connected = is_database_connected()
-        if db_connected:
-            await ensure_connection()
+        # Served from the heartbeat's cached state; no database round trip
+        db_health = get_database_health()
+        db_connected = db_health["connected"]
         
         gemini_status = "configured" if settings.GEMINI_API_KEY and settings.GEMINI_API_KEY != "your-gemini-api-key-here" else "not_configured"
         kindwise_status = "configured" if settings.KINDWISE_API_KEY and settings.KINDWISE_API_KEY != "your-kindwise-api-key-here" else "not_configured"
@@ -167,7 +216,9 @@ async def health_check():
         if not settings.is_production:
             response["services"] = {
                 "database": "connected" if db_connected else "disconnected",
+                "database_heartbeat": db_health,
                 "kindwise_api": kindwise_status,
+                "detection_provider": settings.DETECTION_PROVIDER,
                 "gemini_ai": gemini_status,
                 "weather_api": "configured" if settings.WEATHER_API_KEY else "not_configured"
             }
@@ -199,6 +250,13 @@ async def api_info():
             "purpose": "Disease detection from crop images",
             "fallback": "Mock predictions available when not configured"
         },
+        "detection": {
+            "provider": settings.DETECTION_PROVIDER,
+            "fallback": fallback_providers(),
+            "timeout_seconds": settings.DETECTION_TIMEOUT_SECONDS or None,
+            "provisional": settings.DETECTION_PROVISIONAL_PROVIDER or None,
+            "providers": provider_info()
+        },
         "gemini_ai": {
             "configured": bool(settings.GEMINI_API_KEY and settings.GEMINI_API_KEY != "your-gemini-api-key-here"),
             "model": settings.GEMINI_MODEL,
@@ -210,4 +268,16 @@ async def api_info():
             "purpose": "Weather-based agricultural advice",
             "fallback": "Dummy weather data available when not configured"
         }
-    }
\ No newline at end of file
+    }
+
+@app.get("/metrics")
+async def get_metrics(authorization: Optional[str] = Header(None)):
+    """Runtime metrics (MongoDB pool usage, check-out wait times, ...)"""
+    if not settings.METRICS_ENABLED:
+        return JSONResponse(status_code=404, content={"detail": "Metrics disabled"})
+    if settings.METRICS_TOKEN and not secrets.compare_digest(
+        (authorization or "").encode(), f"Bearer {settings.METRICS_TOKEN}".encode()
+    ):
+        return JSONResponse(status_code=401, content={"detail": "Metrics token required"},
+                            headers={"WWW-Authenticate": "Bearer"})
+    return metrics.snapshot()
\ No newline at end of file
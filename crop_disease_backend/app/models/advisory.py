@@ -36,4 +36,22 @@ class WeatherAdvice(BaseModel):
     planting_advice: str
     irrigation_advice: str
     pest_risk: str
-    humidity_advice: str = ""
\ No newline at end of file
+    humidity_advice: str = ""
+
+class BulkWeatherRequest(BaseModel):
+    regions: List[str] = Field(..., min_length=1, max_length=100)
+
+class BulkWeatherAdvice(BaseModel):
+    """
+    Columnar weather advice: entry i of every list belongs to regions[i].
+    Bands index into temperature_advice / humidity_advice; None means the
+    weather for that region was unavailable.
+    """
+    regions: List[str]
+    temperature: List[Optional[float]]
+    humidity: List[Optional[float]]
+    weather_condition: List[Optional[str]]
+    temperature_band: List[Optional[int]]
+    humidity_band: List[Optional[int]]
+    temperature_advice: List[Dict[str, str]]
+    humidity_advice: List[Dict[str, str]]
\ No newline at end of file
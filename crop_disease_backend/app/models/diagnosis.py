@@ -1,6 +1,6 @@
 # diagnosis.py
 from pydantic import BaseModel, Field
-from typing import Optional, Dict, Any
+from typing import Optional, Dict, Any, List
 from datetime import datetime
 from bson import ObjectId
 from app.models.user import PyObjectId
@@ -18,10 +18,16 @@ class DiagnosisInDB(BaseModel):
     crop_type: str
     image_path: str
     image_url: str
+    # Storage key (sharded path relative to the images directory)
+    image_key: Optional[str] = None
+    # Every photo of a multi-photo diagnosis, image_key first
+    image_keys: Optional[List[str]] = None
     predicted_disease: str
     confidence_score: float
     advisory: Optional[Dict[str, Any]] = None
     api_response: Optional[Dict[str, Any]] = None
+    # When the photo was taken, for captures synced later (batch predict)
+    captured_at: Optional[datetime] = None
     created_at: datetime = Field(default_factory=datetime.utcnow)
 
     class Config:
@@ -33,6 +39,7 @@ class DiagnosisResponse(BaseModel):
     id: str
     crop_type: str
     image_url: str
+    thumbnail_url: Optional[str] = None
     predicted_disease: str
     confidence_score: float
     advisory: Optional[Dict[str, Any]] = None
@@ -44,4 +51,23 @@ class PredictionResult(BaseModel):
     confidence_score: float
     crop_type: str
     advisory: Dict[str, Any]
-    api_response: Optional[Dict[str, Any]] = None
\ No newline at end of file
+    api_response: Optional[Dict[str, Any]] = None
+
+class DiagnosisBatchDelete(BaseModel):
+    """Diagnoses to delete: explicit ids, a filter, or ids restricted by a filter"""
+    ids: Optional[List[str]] = None
+    crop_type: Optional[str] = None
+    predicted_disease: Optional[str] = None
+    created_before: Optional[datetime] = None
+    created_after: Optional[datetime] = None
+
+class DiagnosisDeleteStatus(BaseModel):
+    id: str
+    # deleted | not_found | invalid_id
+    status: str
+
+class DiagnosisBatchDeleteResult(BaseModel):
+    deleted_count: int
+    results: List[DiagnosisDeleteStatus]
+    # A filter matched more than one batch; repeat the request to continue
+    has_more: bool = False
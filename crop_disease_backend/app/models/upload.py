@@ -0,0 +1,29 @@
+# upload.py
+from pydantic import BaseModel, Field
+from typing import Optional
+from datetime import datetime
+from uuid import uuid4
+
+class UploadSessionInDB(BaseModel):
+    """A resumable upload in progress; the bytes live in a partial file"""
+    id: str = Field(default_factory=lambda: uuid4().hex, alias="_id")
+    user_id: str
+    filename: str
+    content_type: str
+    length: int
+    offset: int = 0
+    # Set while a request writes to or finalizes the upload
+    locked_at: Optional[datetime] = None
+    created_at: datetime = Field(default_factory=datetime.utcnow)
+    # Sessions expire UPLOAD_SESSION_TTL_MINUTES after the last chunk
+    updated_at: datetime = Field(default_factory=datetime.utcnow)
+
+    class Config:
+        validate_by_name = True
+
+class UploadStatus(BaseModel):
+    id: str
+    location: str
+    length: int
+    offset: int
+    expires_at: datetime
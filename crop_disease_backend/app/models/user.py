@@ -23,7 +23,7 @@ class PyObjectId(ObjectId):
         return ObjectId(v)
 
     def __str__(self):
-        return str(super())
+        return ObjectId.__str__(self)
 
 class UserCreate(BaseModel):
     name: str = Field(..., min_length=2, max_length=100)
@@ -44,6 +44,7 @@ class UserInDB(BaseModel):
     region: str
     hashed_password: str
     is_active: bool = True
+    token_version: int = 0
     created_at: datetime = Field(default_factory=datetime.utcnow)
     updated_at: datetime = Field(default_factory=datetime.utcnow)
 
@@ -64,6 +65,18 @@ class UserResponse(BaseModel):
 class Token(BaseModel):
     access_token: str
     token_type: str
+    refresh_token: Optional[str] = None
+
+class RefreshRequest(BaseModel):
+    refresh_token: str
 
 class TokenData(BaseModel):
-    email: Optional[str] = None
\ No newline at end of file
+    email: Optional[str] = None
+
+class TokenPrincipal(BaseModel):
+    """Authenticated caller as described by signed token claims (no DB lookup)"""
+    id: str
+    email: EmailStr
+    region: str
+    is_active: bool = True
+    token_version: int = 0
\ No newline at end of file
@@ -1,33 +1,66 @@
 # advisory.py
-from fastapi import APIRouter, Depends, Query, HTTPException
+from fastapi import APIRouter, Depends, Header, Query, HTTPException, Request
 from typing import Optional, List
-from app.models.advisory import WeatherAdvice
-from app.models.user import UserInDB
+from app.models.advisory import WeatherAdvice, BulkWeatherRequest, BulkWeatherAdvice
+from app.models.user import TokenPrincipal
 from app.controllers.advisory_controller import AdvisoryController
-from app.utils.auth_utils import get_current_active_user
+from app.controllers.risk_controller import RiskController
+from app.utils.auth_utils import get_current_principal
 from app.utils.gemini_utils import GeminiAPI
+from app.utils.mongo_utils import MongoJSONResponse
+from app.utils.http_cache import cached_response, etag_for_documents
+from app.utils.idempotency import idempotent, replay_headers, request_fingerprint
+from datetime import datetime
 import logging
 
 router = APIRouter(prefix="/advisory", tags=["advisory"])
 advisory_controller = AdvisoryController()
+risk_controller = RiskController()
 gemini_api = GeminiAPI()
 logger = logging.getLogger(__name__)
 
 @router.get("/weather", response_model=Optional[WeatherAdvice])
 async def get_weather_advice(
     region: Optional[str] = Query(None, description="Region name (uses user's region if not provided)"),
-    current_user: UserInDB = Depends(get_current_active_user)
+    current_user: TokenPrincipal = Depends(get_current_principal)
 ):
     """Get weather-based agricultural advice"""
     target_region = region or current_user.region
     return await advisory_controller.get_weather_advice(target_region)
 
+@router.post("/weather/bulk", response_model=BulkWeatherAdvice)
+async def get_bulk_weather_advice(
+    request: BulkWeatherRequest,
+    current_user: TokenPrincipal = Depends(get_current_principal)
+):
+    """Get weather-based advice for many regions in one columnar response"""
+    return await advisory_controller.get_bulk_weather_advice(request.regions)
+
+@router.get("/risk")
+async def get_risk_forecast(
+    region: Optional[str] = Query(None, description="Region name (uses user's region if not provided)"),
+    crop_type: Optional[str] = Query(None, description="Only return risks for this crop"),
+    current_user: TokenPrincipal = Depends(get_current_principal)
+):
+    """Get precomputed weather-driven disease risk scores for a region"""
+    target_region = region or current_user.region
+    try:
+        forecast = await risk_controller.get_risk_forecast(target_region, crop_type)
+    except Exception as e:
+        logger.error(f"Error getting risk forecast: {e}")
+        raise HTTPException(status_code=500, detail=f"Failed to get risk forecast: {str(e)}")
+    
+    if not forecast:
+        raise HTTPException(status_code=404, detail=f"No risk forecast available for {target_region}")
+    return forecast
+
 @router.get("/disease/{disease_name}")
 async def get_disease_advisory(
+    request: Request,
     disease_name: str,
     crop_type: str = Query("General", description="Crop type"),
     regenerate: bool = Query(False, description="Force regenerate advisory using AI"),
-    current_user: UserInDB = Depends(get_current_active_user)
+    current_user: TokenPrincipal = Depends(get_current_principal)
 ):
     """
     Get detailed advisory for a specific disease
@@ -40,10 +73,10 @@ async def get_disease_advisory(
             advisory = await advisory_controller.get_advisory_by_disease(disease_name, crop_type)
             if advisory:
                 logger.info(f"Returning existing advisory for {disease_name} on {crop_type}")
-                return {
+                return cached_response(request, etag_for_documents([advisory]), {
                     "source": "database",
                     "advisory": advisory
-                }
+                })
         
         # Generate new advisory using Gemini
         logger.info(f"Generating new advisory for {disease_name} on {crop_type}")
@@ -57,11 +90,12 @@ async def get_disease_advisory(
         # Save to database
         advisory_id = await advisory_controller.create_advisory(advisory)
         
-        return {
+        # create_advisory adds the new ObjectId to the dict
+        return MongoJSONResponse({
             "source": "ai_generated",
             "advisory": advisory,
             "saved": advisory_id is not None
-        }
+        })
         
     except Exception as e:
         logger.error(f"Error getting disease advisory: {e}")
@@ -69,16 +103,17 @@ async def get_disease_advisory(
 
 @router.get("/list")
 async def list_advisories(
+    request: Request,
     limit: int = Query(50, ge=1, le=100, description="Number of advisories to return"),
-    current_user: UserInDB = Depends(get_current_active_user)
+    current_user: TokenPrincipal = Depends(get_current_principal)
 ):
     """Get list of all available advisories"""
     try:
         advisories = await advisory_controller.get_all_advisories(limit=limit)
-        return {
+        return cached_response(request, etag_for_documents(advisories, limit), {
             "count": len(advisories),
             "advisories": advisories
-        }
+        })
     except Exception as e:
         logger.error(f"Error listing advisories: {e}")
         raise HTTPException(status_code=500, detail=f"Failed to list advisories: {str(e)}")
@@ -87,46 +122,54 @@ async def list_advisories(
 async def regenerate_advisory(
     disease_name: str = Query(..., description="Disease name"),
     crop_type: str = Query(..., description="Crop type"),
-    current_user: UserInDB = Depends(get_current_active_user)
+    idempotency_key: Optional[str] = Header(None, description="Retries with the same key return the first result"),
+    current_user: TokenPrincipal = Depends(get_current_principal)
 ):
     """
     Regenerate advisory for a disease using Gemini AI
-    This will create a new advisory or update existing one
+    This will create a new advisory or update existing one.
+    With an Idempotency-Key, a retry waits for or replays the first result.
     """
     try:
-        logger.info(f"Regenerating advisory for {disease_name} on {crop_type}")
-        
-        # Generate new advisory
-        advisory = gemini_api.generate_advisory(
-            disease_name=disease_name,
-            crop_type=crop_type,
-            confidence_score=1.0,
-            kindwise_response=None
+        result, replayed = await idempotent(
+            "regenerate", idempotency_key, str(current_user.id), request_fingerprint(disease_name, crop_type),
+            lambda: _regenerate_advisory(disease_name, crop_type)
         )
-        
-        # Check if advisory exists and update, otherwise create
-        existing = await advisory_controller.get_advisory_by_disease(disease_name, crop_type)
-        
-        if existing:
-            # Update existing
-            from datetime import datetime
-            advisory['updated_at'] = datetime.utcnow()
-            success = await advisory_controller.update_advisory(disease_name, crop_type, advisory)
-            action = "updated" if success else "failed_to_update"
-        else:
-            # Create new
-            from datetime import datetime
-            advisory['created_at'] = datetime.utcnow()
-            advisory_id = await advisory_controller.create_advisory(advisory)
-            action = "created" if advisory_id else "failed_to_create"
-        
-        return {
-            "action": action,
-            "disease_name": disease_name,
-            "crop_type": crop_type,
-            "advisory": advisory
-        }
-        
+        return MongoJSONResponse(result, headers=replay_headers(replayed))
+    except HTTPException:
+        raise
     except Exception as e:
         logger.error(f"Error regenerating advisory: {e}")
-        raise HTTPException(status_code=500, detail=f"Failed to regenerate advisory: {str(e)}")
\ No newline at end of file
+        raise HTTPException(status_code=500, detail=f"Failed to regenerate advisory: {str(e)}")
+
+async def _regenerate_advisory(disease_name: str, crop_type: str) -> dict:
+    logger.info(f"Regenerating advisory for {disease_name} on {crop_type}")
+    
+    # Generate new advisory
+    advisory = gemini_api.generate_advisory(
+        disease_name=disease_name,
+        crop_type=crop_type,
+        confidence_score=1.0,
+        kindwise_response=None
+    )
+    
+    # Check if advisory exists and update, otherwise create
+    existing = await advisory_controller.get_advisory_by_disease(disease_name, crop_type)
+    
+    if existing:
+        # Update existing
+        advisory['updated_at'] = datetime.utcnow()
+        success = await advisory_controller.update_advisory(disease_name, crop_type, advisory)
+        action = "updated" if success else "failed_to_update"
+    else:
+        # Create new
+        advisory['created_at'] = datetime.utcnow()
+        advisory_id = await advisory_controller.create_advisory(advisory)
+        action = "created" if advisory_id else "failed_to_create"
+    
+    return {
+        "action": action,
+        "disease_name": disease_name,
+        "crop_type": crop_type,
+        "advisory": advisory
+    }
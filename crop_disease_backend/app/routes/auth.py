@@ -1,8 +1,8 @@
 # auth.py
 from fastapi import APIRouter, HTTPException, Depends
-from app.models.user import UserCreate, UserLogin, UserResponse, Token
+from app.models.user import UserCreate, UserLogin, UserResponse, Token, RefreshRequest, TokenPrincipal
 from app.controllers.auth_controller import AuthController
-from app.utils.auth_utils import get_current_active_user
+from app.utils.auth_utils import get_current_active_user, get_current_principal, revoke_user_tokens
 from app.models.user import UserInDB
 
 router = APIRouter(prefix="/auth", tags=["authentication"])
@@ -12,17 +12,8 @@ auth_controller = AuthController()
 async def register(user_data: UserCreate):
     """Register a new farmer"""
     try:
-        user = await auth_controller.register_user(user_data)
-        
-        # Auto-login after registration
-        login_data = UserLogin(email=user_data.email, password=user_data.password)
-        token = await auth_controller.login_user(login_data)
-        
-        return {
-            "user": user,
-            "access_token": token.access_token,
-            "token_type": token.token_type
-        }
+        # Registration returns the token directly (auto-login)
+        return await auth_controller.register_and_login(user_data)
     except Exception as e:
         raise HTTPException(status_code=400, detail=str(e))
 
@@ -30,37 +21,28 @@ async def register(user_data: UserCreate):
 async def login(login_data: UserLogin):
     """Login farmer and get access token"""
     try:
-        token = await auth_controller.login_user(login_data)
-        
-        # Get user data
-        from app.database import get_database
-        db = get_database()
-        user = await db.users.find_one({"email": login_data.email})
-        
-        if user:
-            user_response = UserResponse(
-                id=str(user["_id"]),
-                name=user["name"],
-                email=user["email"],
-                phone_number=user["phone_number"],
-                region=user["region"],
-                is_active=user["is_active"],
-                created_at=user["created_at"]
-            )
-            
-            return {
-                "user": user_response,
-                "access_token": token.access_token,
-                "token_type": token.token_type
-            }
-        else:
-            raise HTTPException(status_code=404, detail="User not found")
-            
+        return await auth_controller.login(login_data)
     except HTTPException:
         raise
     except Exception as e:
         raise HTTPException(status_code=400, detail=str(e))
 
+@router.post("/refresh", response_model=dict)
+async def refresh_token(refresh_data: RefreshRequest):
+    """Exchange a refresh token for a new access / refresh token pair"""
+    try:
+        return await auth_controller.refresh(refresh_data.refresh_token)
+    except HTTPException:
+        raise
+    except Exception as e:
+        raise HTTPException(status_code=400, detail=str(e))
+
+@router.post("/revoke", response_model=dict)
+async def revoke_tokens(current_user: TokenPrincipal = Depends(get_current_principal)):
+    """Sign out everywhere by invalidating all previously issued tokens"""
+    token_version = await revoke_user_tokens(current_user.id)
+    return {"detail": "All tokens revoked", "token_version": token_version}
+
 @router.get("/me", response_model=UserResponse)
 async def get_current_user_info(current_user: UserInDB = Depends(get_current_active_user)):
     """Get current user information"""
@@ -1,10 +1,17 @@
 # disease.py
-from fastapi import APIRouter, Depends, UploadFile, File, Form, HTTPException, Query
-from app.models.diagnosis import PredictionResult
-from app.models.user import UserInDB
-from app.controllers.disease_controller import DiseaseController
-from app.utils.auth_utils import get_current_active_user
-from typing import List
+from fastapi import APIRouter, BackgroundTasks, Depends, UploadFile, File, Form, Header, HTTPException, Query, Request
+from app.models.diagnosis import PredictionResult, DiagnosisBatchDelete, DiagnosisBatchDeleteResult
+from app.models.user import UserInDB, TokenPrincipal
+from app.controllers.disease_controller import DiseaseController, sign_prediction
+from app.config import settings
+from app.utils.auth_utils import get_current_active_user, get_current_principal
+from app.utils.mongo_utils import MongoJSONResponse, dumps_mongo
+from app.utils.http_cache import cached_response, etag_for_documents
+from app.utils.image_delivery import url_expiry
+from app.utils.idempotency import idempotent, replay_headers, request_fingerprint, upload_digest
+from fastapi.responses import StreamingResponse
+from datetime import datetime
+from typing import List, Optional
 import logging
 
 router = APIRouter(prefix="/disease", tags=["disease detection"])
@@ -13,55 +20,108 @@ logger = logging.getLogger(__name__)
 
 @router.post("/predict")
 async def predict_disease(
-    file: UploadFile = File(..., description="Crop image (JPEG/PNG)"),
+    file: Optional[UploadFile] = File(None, description="Crop image (JPEG/PNG)"),
+    files: List[UploadFile] = File(None, description="Several photos of the same plant"),
     crop_type: str = Form(..., description="Type of crop (e.g., tomato, potato)"),
+    idempotency_key: Optional[str] = Header(None, description="Retries with the same key return the first result"),
     current_user: UserInDB = Depends(get_current_active_user)
 ):
     """
-    Upload crop image and get disease prediction
-    - Uses Kindwise API for disease detection
+    Upload crop image(s) and get disease prediction
+    - Uses Kindwise API for disease detection (all photos in one request)
     - Generates comprehensive advisory using Gemini AI
-    - Stores results in database
+    - Stores results in database as one diagnosis
+    - With an Idempotency-Key, a retry waits for or replays the first result
     """
-    if not file.filename:
+    uploads = ([file] if file else []) + (files or [])
+    if not uploads or not all(upload.filename for upload in uploads):
         raise HTTPException(status_code=400, detail="No file uploaded")
+    if len(uploads) > settings.MAX_IMAGES_PER_DIAGNOSIS:
+        raise HTTPException(
+            status_code=400, detail=f"At most {settings.MAX_IMAGES_PER_DIAGNOSIS} images per diagnosis"
+        )
     
     # Validate file type
-    if not file.content_type or not file.content_type.startswith('image/'):
+    if not all(upload.content_type and upload.content_type.startswith('image/') for upload in uploads):
         raise HTTPException(status_code=400, detail="File must be an image")
     
     try:
-        result = await disease_controller.predict_disease(file, crop_type, current_user)
+        fingerprint = None
+        if idempotency_key is not None:
+            fingerprint = request_fingerprint(crop_type, [await upload_digest(upload) for upload in uploads])
+        # Stored without signed URLs, which expire long before the key does;
+        # every response (first or replayed) is signed afresh
+        result, replayed = await idempotent(
+            "predict", idempotency_key, str(current_user.id), fingerprint,
+            lambda: disease_controller.predict_disease(uploads, crop_type, current_user, sign_urls=False)
+        )
         logger.info(f"Disease prediction successful for user {current_user.email}")
-        return result
+        return MongoJSONResponse(sign_prediction(result), headers=replay_headers(replayed))
     except HTTPException:
         raise
     except Exception as e:
         logger.error(f"Disease prediction failed: {e}")
         raise HTTPException(status_code=500, detail=f"Prediction failed: {str(e)}")
 
-@router.get("/history", response_model=List[dict])
+@router.post("/predict/batch")
+async def predict_batch(
+    files: List[UploadFile] = File(..., description="One photo per capture"),
+    crop_type: List[str] = Form(..., description="Crop per photo, or one for the whole batch"),
+    captured_at: List[str] = Form(None, description="ISO 8601 capture time per photo (optional)"),
+    current_user: UserInDB = Depends(get_current_active_user)
+):
+    """
+    Diagnose a bundle of offline captures, one diagnosis per photo.
+    - crop_type and captured_at are given once per photo, in the same order
+      (a single crop_type applies to every photo)
+    - Streams newline-delimited JSON: one line per photo as it finishes
+      (in completion order, with its index), then a summary line
+    """
+    if len(files) > settings.BATCH_PREDICT_MAX_ITEMS:
+        raise HTTPException(status_code=400, detail=f"At most {settings.BATCH_PREDICT_MAX_ITEMS} items per batch")
+    if len(crop_type) == 1:
+        crop_type = crop_type * len(files)
+    captured_at = captured_at or [""] * len(files)
+    if len(crop_type) != len(files) or len(captured_at) != len(files):
+        raise HTTPException(status_code=400, detail="Give crop_type and captured_at once per file")
+    try:
+        captured = [datetime.fromisoformat(value) if value else None for value in captured_at]
+    except ValueError:
+        raise HTTPException(status_code=400, detail="captured_at must be an ISO 8601 timestamp")
+    
+    results = await disease_controller.predict_batch(list(zip(files, crop_type, captured)), current_user)
+    return StreamingResponse(
+        (dumps_mongo(result) + b"\n" async for result in results),
+        media_type="application/x-ndjson"
+    )
+
+@router.get("/history")
 async def get_diagnosis_history(
-    current_user: UserInDB = Depends(get_current_active_user),
+    request: Request,
+    current_user: TokenPrincipal = Depends(get_current_principal),
     limit: int = Query(10, ge=1, le=50, description="Number of diagnoses to return")
 ):
     """Get user's diagnosis history"""
     try:
         history = await disease_controller.get_diagnosis_history(current_user, limit)
-        return history
+        # Diagnoses only change when retention prunes their raw payload, which
+        # stamps updated_at, so ids and change times identify the page; the
+        # signed image URLs change once per expiry window
+        return cached_response(request, etag_for_documents(history, limit, url_expiry()), history)
     except Exception as e:
         logger.error(f"Failed to get diagnosis history: {e}")
         raise HTTPException(status_code=500, detail=f"Failed to get history: {str(e)}")
 
-@router.get("/diagnosis/{diagnosis_id}", response_model=dict)
+@router.get("/diagnosis/{diagnosis_id}")
 async def get_diagnosis_by_id(
+    request: Request,
     diagnosis_id: str,
-    current_user: UserInDB = Depends(get_current_active_user)
+    current_user: TokenPrincipal = Depends(get_current_principal)
 ):
     """Get specific diagnosis by ID with full advisory details"""
     try:
         diagnosis = await disease_controller.get_diagnosis_by_id(diagnosis_id, current_user)
-        return diagnosis
+        return cached_response(request, etag_for_documents([diagnosis], url_expiry()), diagnosis)
     except HTTPException:
         raise
     except Exception as e:
@@ -84,6 +144,25 @@ async def delete_diagnosis(
         logger.error(f"Failed to delete diagnosis: {e}")
         raise HTTPException(status_code=500, detail=f"Failed to delete diagnosis: {str(e)}")
 
+@router.post("/diagnoses/delete", response_model=DiagnosisBatchDeleteResult)
+async def delete_diagnoses(
+    request: DiagnosisBatchDelete,
+    background_tasks: BackgroundTasks,
+    current_user: UserInDB = Depends(get_current_active_user)
+):
+    """
+    Delete many diagnoses at once, by id and/or filter (crop_type,
+    predicted_disease, created_before, created_after). Returns a status per id;
+    filters remove up to DIAGNOSIS_BATCH_DELETE_LIMIT per call (see has_more).
+    """
+    try:
+        return await disease_controller.delete_diagnoses(request, current_user, background_tasks)
+    except HTTPException:
+        raise
+    except Exception as e:
+        logger.error(f"Failed to delete diagnoses: {e}")
+        raise HTTPException(status_code=500, detail=f"Failed to delete diagnoses: {str(e)}")
+
 @router.get("/supported-crops")
 async def get_supported_crops():
     """Get list of supported crop types"""
@@ -99,12 +178,12 @@ async def get_supported_crops():
 
 @router.get("/statistics")
 async def get_disease_statistics(
-    current_user: UserInDB = Depends(get_current_active_user)
+    current_user: TokenPrincipal = Depends(get_current_principal)
 ):
     """Get statistics about detected diseases for the current user"""
     try:
-        from app.database import get_database
-        db = get_database()
+        from app.database import get_collection, ReadRouting
+        diagnoses_collection = get_collection("diagnoses", ReadRouting.ANALYTICS)
         
         # Get disease frequency
         pipeline = [
@@ -119,7 +198,7 @@ async def get_disease_statistics(
         ]
         
         disease_stats = []
-        async for stat in db.diagnoses.aggregate(pipeline):
+        async for stat in diagnoses_collection.aggregate(pipeline):
             disease_stats.append({
                 "disease": stat["_id"],
                 "count": stat["count"],
@@ -129,7 +208,7 @@ async def get_disease_statistics(
         # Get crop frequency
         pipeline[1]["$group"]["_id"] = "$crop_type"
         crop_stats = []
-        async for stat in db.diagnoses.aggregate(pipeline):
+        async for stat in diagnoses_collection.aggregate(pipeline):
             crop_stats.append({
                 "crop": stat["_id"],
                 "count": stat["count"],
@@ -0,0 +1,71 @@
+# images.py
+from fastapi import APIRouter, HTTPException, Query, Request, Response
+from fastapi.responses import FileResponse, RedirectResponse, StreamingResponse
+from datetime import datetime
+import time
+from app.config import settings
+from app.utils.http_cache import compute_etag, is_not_modified
+from app.utils.image_delivery import (
+    ORIGINAL, VARIANT_SIZES, is_valid_key, resolve_image, verify_image_signature
+)
+from app.utils.storage import get_image_store
+import logging
+
+router = APIRouter(prefix="/images", tags=["images"])
+logger = logging.getLogger(__name__)
+
+MEDIA_TYPES = {
+    ".jpg": "image/jpeg",
+    ".jpeg": "image/jpeg",
+    ".png": "image/png",
+    ".webp": "image/webp"
+}
+
+@router.get("/{variant}/{key:path}")
+async def get_image(
+    request: Request,
+    variant: str,
+    key: str,
+    exp: int = Query(..., description="Expiry of the signed URL (unix time)"),
+    sig: str = Query(..., description="URL signature")
+):
+    """
+    Serve an uploaded image or one of its derivatives through a signed URL.
+    URLs are issued by the diagnosis endpoints (image_url, thumbnail_url, preview_url).
+    """
+    if variant != ORIGINAL and variant not in VARIANT_SIZES:
+        raise HTTPException(status_code=404, detail="Unknown image variant")
+    if not is_valid_key(key) or not verify_image_signature(key, variant, exp, sig):
+        raise HTTPException(status_code=403, detail="Invalid or expired image link")
+
+    # Originals never change and derivatives are a pure function of them and the settings
+    etag = compute_etag(key, variant, VARIANT_SIZES.get(variant), settings.IMAGE_DERIVATIVE_QUALITY)
+    headers = {
+        "ETag": etag,
+        "Cache-Control": f"private, max-age={settings.IMAGE_CACHE_MAX_AGE_SECONDS}, immutable"
+    }
+    if is_not_modified(request, etag):
+        return Response(status_code=304, headers=headers)
+
+    store_key = await resolve_image(key, variant)
+    if not store_key:
+        raise HTTPException(status_code=404, detail="Image not found")
+    extension = store_key[store_key.rfind("."):].lower()
+    media_type = MEDIA_TYPES.get(extension, "application/octet-stream")
+    store = get_image_store()
+
+    path = store.local_path(store_key)
+    if path:
+        return FileResponse(path, media_type=media_type, headers=headers)
+
+    # Object stores serve the bytes themselves. Presigning from the start of the
+    # current window yields the same URL for the whole window, so it stays cacheable.
+    window = settings.IMAGE_URL_TTL_SECONDS
+    window_start = int(time.time()) // window * window
+    presigned = None
+    if settings.STORAGE_REDIRECT_DOWNLOADS:
+        presigned = store.presign(store_key, 2 * window, issued_at=datetime.utcfromtimestamp(window_start))
+    if presigned:
+        remaining = window_start + window - int(time.time())
+        return RedirectResponse(presigned, status_code=307, headers={"Cache-Control": f"private, max-age={remaining}"})
+    return StreamingResponse(store.stream(store_key), media_type=media_type, headers=headers)
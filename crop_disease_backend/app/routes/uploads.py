@@ -0,0 +1,90 @@
+# uploads.py
+from fastapi import APIRouter, Depends, Form, Header, HTTPException, Request, Response
+from app.controllers.upload_controller import UploadController
+from app.models.upload import UploadStatus
+from app.models.user import UserInDB
+from app.utils.auth_utils import get_current_active_user
+from app.utils.mongo_utils import MongoJSONResponse
+from app.utils.resumable_uploads import parse_upload_metadata
+from typing import Optional
+import logging
+
+router = APIRouter(prefix="/uploads", tags=["resumable uploads"])
+upload_controller = UploadController()
+logger = logging.getLogger(__name__)
+
+TUS_VERSION = "1.0.0"
+CHUNK_CONTENT_TYPE = "application/offset+octet-stream"
+
+def tus_headers(status: UploadStatus) -> dict:
+    return {
+        "Tus-Resumable": TUS_VERSION,
+        "Upload-Offset": str(status.offset),
+        "Upload-Length": str(status.length),
+        "Upload-Expires": status.expires_at.strftime("%a, %d %b %Y %H:%M:%S GMT"),
+        "Cache-Control": "no-store"
+    }
+
+@router.post("", status_code=201)
+async def create_upload(
+    upload_length: int = Header(..., description="Size of the whole file in bytes"),
+    upload_metadata: Optional[str] = Header(None, description="tus metadata: filename and filetype, base64-encoded"),
+    current_user: UserInDB = Depends(get_current_active_user)
+):
+    """
+    Start a resumable upload (tus creation). Send the file with PATCH to the
+    returned Location, resuming from HEAD's Upload-Offset after a dropped
+    connection, then POST to {Location}/finalize to get the prediction.
+    """
+    metadata = parse_upload_metadata(upload_metadata)
+    status = await upload_controller.create_upload(
+        upload_length, metadata.get("filename"), metadata.get("filetype"), current_user
+    )
+    return MongoJSONResponse(status, status_code=201, headers={**tus_headers(status), "Location": status.location})
+
+@router.head("/{upload_id}")
+async def get_upload_offset(upload_id: str, current_user: UserInDB = Depends(get_current_active_user)):
+    """Bytes received so far (Upload-Offset)"""
+    status = await upload_controller.get_upload(upload_id, current_user)
+    return Response(status_code=200, headers=tus_headers(status))
+
+@router.get("/{upload_id}", response_model=UploadStatus)
+async def get_upload(upload_id: str, current_user: UserInDB = Depends(get_current_active_user)):
+    """Upload progress as JSON, for clients that cannot read HEAD responses"""
+    return await upload_controller.get_upload(upload_id, current_user)
+
+@router.patch("/{upload_id}", status_code=204)
+async def append_chunk(
+    upload_id: str,
+    request: Request,
+    upload_offset: int = Header(..., description="Offset the chunk starts at; must match the server's"),
+    current_user: UserInDB = Depends(get_current_active_user)
+):
+    """Append the request body at Upload-Offset. The body is streamed to disk, never buffered."""
+    if request.headers.get("content-type") != CHUNK_CONTENT_TYPE:
+        raise HTTPException(status_code=415, detail=f"Content-Type must be {CHUNK_CONTENT_TYPE}")
+    status = await upload_controller.append_chunk(upload_id, upload_offset, request.stream(), current_user)
+    return Response(status_code=204, headers=tus_headers(status))
+
+@router.post("/{upload_id}/finalize")
+async def finalize_upload(
+    upload_id: str,
+    crop_type: str = Form(..., description="Type of crop (e.g., tomato, potato)"),
+    current_user: UserInDB = Depends(get_current_active_user)
+):
+    """Run disease prediction on a completed upload (same response as /disease/predict)"""
+    try:
+        result = await upload_controller.finalize_upload(upload_id, crop_type, current_user)
+        logger.info(f"Finalized upload {upload_id} for user {current_user.email}")
+        return MongoJSONResponse(result)
+    except HTTPException:
+        raise
+    except Exception as e:
+        logger.error(f"Finalizing upload failed: {e}")
+        raise HTTPException(status_code=500, detail=f"Prediction failed: {str(e)}")
+
+@router.delete("/{upload_id}", status_code=204)
+async def delete_upload(upload_id: str, current_user: UserInDB = Depends(get_current_active_user)):
+    """Abandon an upload and discard its bytes (tus termination)"""
+    await upload_controller.delete_upload(upload_id, current_user)
+    return Response(status_code=204, headers={"Tus-Resumable": TUS_VERSION})
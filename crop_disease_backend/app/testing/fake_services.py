@@ -0,0 +1,219 @@
+# fake_services.py
+"""
+Deterministic local stand-ins for the Kindwise, Gemini and OpenWeather APIs.
+
+Run with:
+    python -m app.testing.fake_services --port 9100 --latency-ms 300 --error-rate 0.01
+
+and point the backend at it:
+    KINDWISE_API_KEY=fake KINDWISE_API_URL=http://127.0.0.1:9100/kindwise/api/v1
+    GEMINI_API_KEY=fake GEMINI_API_ENDPOINT=http://127.0.0.1:9100/gemini
+    WEATHER_API_KEY=fake WEATHER_API_URL=http://127.0.0.1:9100/weather
+
+Responses depend only on the request content, so the same image, disease or
+region always yields the same answer. Latency follows a log-normal
+distribution around a configurable median; errors and timeouts are injected
+at configurable rates from a seeded generator.
+"""
+import argparse
+import asyncio
+import hashlib
+import json
+import os
+import random
+import re
+from typing import Dict, Optional
+from fastapi import FastAPI, Request
+from fastapi.responses import JSONResponse
+from pydantic import BaseModel
+
+SERVICES = ("kindwise", "gemini", "weather")
+
+DISEASES = [
+    ("Early_Blight", "Fungal disease causing concentric brown rings on older leaves."),
+    ("Late_Blight", "Water mould causing dark, greasy lesions that spread quickly in wet weather."),
+    ("Bacterial_Spot", "Bacterial infection producing small dark water-soaked spots."),
+    ("Leaf_Mold", "Fungal disease with yellow patches above and olive mould below."),
+    ("Powdery_Mildew", "White powdery fungal growth on leaf surfaces."),
+    ("Common_Rust", "Orange-brown pustules on both leaf surfaces."),
+    ("Healthy", "No disease symptoms detected.")
+]
+
+CONDITIONS = ["Clear", "Clouds", "Rain", "Drizzle", "Mist"]
+
+class ServiceBehavior(BaseModel):
+    """Latency and failure profile of one fake service"""
+    latency_median_ms: float = 50.0
+    # Log-normal shape parameter; 0 gives a constant latency
+    latency_sigma: float = 0.5
+    error_rate: float = 0.0
+    timeout_rate: float = 0.0
+    # How long a "timed out" request hangs before answering
+    timeout_seconds: float = 60.0
+
+def behavior_from_env(service: str, default: ServiceBehavior) -> ServiceBehavior:
+    """Per-service overrides, e.g. FAKE_KINDWISE_LATENCY_MS=800"""
+    prefix = f"FAKE_{service.upper()}_"
+    return ServiceBehavior(
+        latency_median_ms=float(os.getenv(prefix + "LATENCY_MS", default.latency_median_ms)),
+        latency_sigma=float(os.getenv(prefix + "LATENCY_SIGMA", default.latency_sigma)),
+        error_rate=float(os.getenv(prefix + "ERROR_RATE", default.error_rate)),
+        timeout_rate=float(os.getenv(prefix + "TIMEOUT_RATE", default.timeout_rate)),
+        timeout_seconds=float(os.getenv(prefix + "TIMEOUT_SECONDS", default.timeout_seconds))
+    )
+
+def _digest(*parts: str) -> int:
+    return int(hashlib.sha256("\x00".join(parts).encode()).hexdigest()[:12], 16)
+
+def fake_identification(images: list) -> dict:
+    """Kindwise-shaped identification result derived from the image content"""
+    seed = _digest(*images)
+    ranked = sorted(DISEASES, key=lambda d: _digest(str(seed), d[0]))
+    top_probability = 0.55 + (seed % 400) / 1000  # 0.55 - 0.95
+    suggestions = []
+    remaining = 1.0
+    for i, (name, description) in enumerate(ranked[:3]):
+        probability = round(top_probability if i == 0 else remaining / 2, 4)
+        remaining -= probability
+        suggestions.append({
+            "id": f"fake-{name.lower()}",
+            "name": name,
+            "probability": probability,
+            "similar_images": [],
+            "details": {"description": description}
+        })
+    return {
+        "access_token": f"fake-{seed:x}",
+        "status": "COMPLETED",
+        "result": {
+            "disease": {"suggestions": suggestions},
+            "plant_details": {"common_names": ["Unknown Plant"]}
+        }
+    }
+
+def fake_advisory(prompt: str) -> dict:
+    """Advisory JSON in the structure the Gemini prompt asks for"""
+    disease = re.search(r"Disease Detected: (.+)", prompt)
+    crop = re.search(r"Crop Type: (.+)", prompt)
+    disease_name = disease.group(1).strip() if disease else "Unknown"
+    crop_type = crop.group(1).strip() if crop else "General"
+    severity = ["mild", "moderate", "severe"][_digest(disease_name, crop_type) % 3]
+    return {
+        "disease_name": disease_name,
+        "crop_type": crop_type,
+        "severity": severity,
+        "description": f"{disease_name} affects {crop_type}. This advisory was produced by a local fake service.",
+        "symptoms": [f"Symptom {i} of {disease_name}" for i in range(1, 5)],
+        "treatment_steps": [
+            {"step": i, "description": f"Treatment step {i} for {disease_name}", "materials_needed": ["Sprayer"]}
+            for i in range(1, 4)
+        ],
+        "recommended_pesticide": "Copper-based fungicide",
+        "recommended_fertilizer": "Balanced NPK fertilizer",
+        "prevention_tips": [f"Prevention tip {i}" for i in range(1, 6)],
+        "estimated_recovery_time": "2-3 weeks",
+        "organic_alternatives": "Neem oil spray",
+        "when_to_seek_help": "If symptoms spread after two treatments"
+    }
+
+def fake_weather(region: str) -> dict:
+    """OpenWeather-shaped current weather derived from the region name"""
+    seed = _digest(region.strip().lower())
+    return {
+        "name": region,
+        "main": {
+            "temp": round(5 + (seed % 3500) / 100, 1),  # 5 - 40 C
+            "humidity": 20 + (seed // 3500) % 80  # 20 - 99 %
+        },
+        "weather": [{"main": CONDITIONS[seed % len(CONDITIONS)]}]
+    }
+
+def create_app(behaviors: Optional[Dict[str, ServiceBehavior]] = None, seed: int = 0) -> FastAPI:
+    """Build the fake-services application"""
+    behaviors = behaviors or {service: ServiceBehavior() for service in SERVICES}
+    rng = random.Random(seed)
+    app = FastAPI(title="Fake external services")
+    app.state.behaviors = behaviors
+    app.state.request_counts = {service: 0 for service in SERVICES}
+
+    async def simulate(service: str) -> Optional[JSONResponse]:
+        """Apply latency and inject failures; returns an error response if one was drawn"""
+        behavior = app.state.behaviors[service]
+        app.state.request_counts[service] += 1
+        draw = rng.random()
+        if draw < behavior.timeout_rate:
+            await asyncio.sleep(behavior.timeout_seconds)
+            return JSONResponse(status_code=504, content={"error": "simulated timeout"})
+        latency = behavior.latency_median_ms * rng.lognormvariate(0, behavior.latency_sigma) \
+            if behavior.latency_sigma > 0 else behavior.latency_median_ms
+        await asyncio.sleep(latency / 1000)
+        if draw < behavior.timeout_rate + behavior.error_rate:
+            return JSONResponse(status_code=503, content={"error": "simulated failure"})
+        return None
+
+    @app.post("/kindwise/api/v1/identification")
+    async def identification(request: Request):
+        failure = await simulate("kindwise")
+        if failure:
+            return failure
+        payload = await request.json()
+        return JSONResponse(status_code=201, content=fake_identification(payload.get("images", [])))
+
+    @app.post("/gemini/{version}/models/{model_action}")
+    async def generate_content(version: str, model_action: str, request: Request):
+        failure = await simulate("gemini")
+        if failure:
+            return failure
+        payload = await request.json()
+        prompt = " ".join(
+            part.get("text", "")
+            for content in payload.get("contents", [])
+            for part in content.get("parts", [])
+        )
+        return {
+            "candidates": [{
+                "content": {"parts": [{"text": json.dumps(fake_advisory(prompt))}], "role": "model"},
+                "finishReason": "STOP",
+                "index": 0
+            }]
+        }
+
+    @app.get("/weather")
+    async def weather(q: str):
+        failure = await simulate("weather")
+        if failure:
+            return failure
+        return fake_weather(q)
+
+    @app.get("/stats")
+    async def stats():
+        return {"requests": app.state.request_counts}
+
+    return app
+
+def main():
+    import uvicorn
+
+    parser = argparse.ArgumentParser(description="Run fake Kindwise / Gemini / weather services")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=9100)
+    parser.add_argument("--latency-ms", type=float, default=50.0, help="Median latency for every service")
+    parser.add_argument("--latency-sigma", type=float, default=0.5, help="Log-normal spread of latency")
+    parser.add_argument("--error-rate", type=float, default=0.0)
+    parser.add_argument("--timeout-rate", type=float, default=0.0)
+    parser.add_argument("--timeout-seconds", type=float, default=60.0)
+    parser.add_argument("--seed", type=int, default=0)
+    args = parser.parse_args()
+
+    default = ServiceBehavior(
+        latency_median_ms=args.latency_ms,
+        latency_sigma=args.latency_sigma,
+        error_rate=args.error_rate,
+        timeout_rate=args.timeout_rate,
+        timeout_seconds=args.timeout_seconds
+    )
+    behaviors = {service: behavior_from_env(service, default) for service in SERVICES}
+    uvicorn.run(create_app(behaviors, seed=args.seed), host=args.host, port=args.port, log_level="warning")
+
+if __name__ == "__main__":
+    main()
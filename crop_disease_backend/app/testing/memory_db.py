@@ -0,0 +1,780 @@
+# memory_db.py
+"""
+In-process stand-in for the subset of Motor used by this application.
+
+Selected with DATABASE_BACKEND=memory. Data lives in Python dicts for the
+lifetime of the process; it exists so the API can be exercised and
+load-tested without a MongoDB server, not as a general-purpose database.
+"""
+import copy
+import re
+from datetime import datetime
+from typing import Any, Dict, Iterable, List, Optional, Tuple
+from bson import ObjectId
+from pymongo import InsertOne, UpdateOne, UpdateMany, ReplaceOne, DeleteOne, DeleteMany, ReturnDocument
+from pymongo.errors import BulkWriteError, DuplicateKeyError, OperationFailure
+
+_MISSING = object()
+
+# ---------------------------------------------------------------------------
+# Field access and query matching
+# ---------------------------------------------------------------------------
+
+def _get_path(doc: Any, path: str) -> Any:
+    """Resolve a dotted path; lists are traversed element-wise like MongoDB"""
+    value = doc
+    for part in path.split("."):
+        if isinstance(value, dict):
+            value = value.get(part, _MISSING)
+        elif isinstance(value, list) and part.isdigit():
+            index = int(part)
+            value = value[index] if index < len(value) else _MISSING
+        elif isinstance(value, list):
+            values = [_get_path(item, part) for item in value if isinstance(item, dict)]
+            value = [v for v in values if v is not _MISSING] or _MISSING
+        else:
+            return _MISSING
+        if value is _MISSING:
+            return _MISSING
+    return value
+
+def _set_path(doc: Dict[str, Any], path: str, value: Any):
+    parts = path.split(".")
+    for part in parts[:-1]:
+        doc = doc.setdefault(part, {})
+    doc[parts[-1]] = value
+
+def _unset_path(doc: Dict[str, Any], path: str):
+    parts = path.split(".")
+    for part in parts[:-1]:
+        doc = doc.get(part)
+        if not isinstance(doc, dict):
+            return
+    doc.pop(parts[-1], None)
+
+def _sort_key(value: Any) -> Tuple[int, Any]:
+    """Total order across types, roughly following BSON comparison order"""
+    if value is _MISSING or value is None:
+        return (0, 0)
+    if isinstance(value, bool):
+        return (5, value)
+    if isinstance(value, (int, float)):
+        return (1, value)
+    if isinstance(value, str):
+        return (2, value)
+    if isinstance(value, dict):
+        return (3, str(value))
+    if isinstance(value, list):
+        return (4, str(value))
+    if isinstance(value, ObjectId):
+        return (6, str(value))
+    if isinstance(value, datetime):
+        return (7, value)
+    return (8, str(value))
+
+def _compare(a: Any, b: Any) -> Optional[int]:
+    ka, kb = _sort_key(a), _sort_key(b)
+    if ka[0] != kb[0]:
+        return None
+    return (ka > kb) - (ka < kb)
+
+def _values_equal(value: Any, expected: Any) -> bool:
+    if value is _MISSING:
+        return expected is None
+    if isinstance(value, list) and not isinstance(expected, list):
+        return any(_values_equal(v, expected) for v in value)
+    return value == expected
+
+def _match_operator(value: Any, operator: str, operand: Any, condition: Dict[str, Any]) -> bool:
+    candidates = value if isinstance(value, list) else [value]
+    if operator == "$eq":
+        return _values_equal(value, operand)
+    if operator == "$ne":
+        return not _values_equal(value, operand)
+    if operator == "$in":
+        return any(_values_equal(value, o) for o in operand)
+    if operator == "$nin":
+        return not any(_values_equal(value, o) for o in operand)
+    if operator == "$exists":
+        return (value is not _MISSING) == bool(operand)
+    if operator in ("$gt", "$gte", "$lt", "$lte"):
+        for candidate in candidates:
+            result = _compare(candidate, operand)
+            if result is None:
+                continue
+            if (operator == "$gt" and result > 0) or (operator == "$gte" and result >= 0) \
+                    or (operator == "$lt" and result < 0) or (operator == "$lte" and result <= 0):
+                return True
+        return False
+    if operator == "$regex":
+        flags = re.IGNORECASE if "i" in condition.get("$options", "") else 0
+        pattern = re.compile(operand, flags) if isinstance(operand, str) else operand
+        return any(isinstance(c, str) and pattern.search(c) for c in candidates)
+    if operator == "$options":
+        return True
+    if operator == "$not":
+        return not _match_condition(value, operand)
+    if operator == "$size":
+        return isinstance(value, list) and len(value) == operand
+    raise OperationFailure(f"Unsupported query operator in memory backend: {operator}")
+
+def _match_condition(value: Any, condition: Any) -> bool:
+    if isinstance(condition, dict) and condition and all(k.startswith("$") for k in condition):
+        return all(_match_operator(value, op, operand, condition) for op, operand in condition.items())
+    if isinstance(condition, re.Pattern):
+        return _match_operator(value, "$regex", condition, {})
+    return _values_equal(value, condition)
+
+def matches(doc: Dict[str, Any], query: Optional[Dict[str, Any]], variables: Optional[Dict[str, Any]] = None) -> bool:
+    """Whether a document satisfies a MongoDB query document"""
+    for key, condition in (query or {}).items():
+        if key == "$and":
+            if not all(matches(doc, q, variables) for q in condition):
+                return False
+        elif key == "$or":
+            if not any(matches(doc, q, variables) for q in condition):
+                return False
+        elif key == "$nor":
+            if any(matches(doc, q, variables) for q in condition):
+                return False
+        elif key == "$expr":
+            if not evaluate(condition, doc, variables):
+                return False
+        elif not _match_condition(_get_path(doc, key), condition):
+            return False
+    return True
+
+# ---------------------------------------------------------------------------
+# Aggregation expressions
+# ---------------------------------------------------------------------------
+
+def evaluate(expression: Any, doc: Dict[str, Any], variables: Optional[Dict[str, Any]] = None) -> Any:
+    """Evaluate an aggregation expression against a document"""
+    if isinstance(expression, str) and expression.startswith("$$"):
+        name, _, path = expression[2:].partition(".")
+        value = (variables or {}).get(name, _MISSING)
+        return _get_path(value, path) if path and value is not _MISSING else value
+    if isinstance(expression, str) and expression.startswith("$"):
+        value = _get_path(doc, expression[1:])
+        return None if value is _MISSING else value
+    if isinstance(expression, list):
+        return [evaluate(e, doc, variables) for e in expression]
+    if isinstance(expression, dict):
+        if len(expression) == 1:
+            operator, operand = next(iter(expression.items()))
+            if operator.startswith("$"):
+                return _evaluate_operator(operator, operand, doc, variables)
+        return {k: evaluate(v, doc, variables) for k, v in expression.items()}
+    return expression
+
+def _evaluate_operator(operator: str, operand: Any, doc: Dict[str, Any], variables: Optional[Dict[str, Any]]) -> Any:
+    args = operand if isinstance(operand, list) else [operand]
+    values = [evaluate(a, doc, variables) for a in args]
+    if operator == "$literal":
+        return operand
+    if operator == "$toLower":
+        return (values[0] or "").lower() if values[0] is not None else ""
+    if operator == "$toUpper":
+        return (values[0] or "").upper() if values[0] is not None else ""
+    if operator == "$toString":
+        return None if values[0] is None else str(values[0])
+    if operator == "$toObjectId":
+        return None if values[0] is None else ObjectId(values[0])
+    if operator == "$eq":
+        return values[0] == values[1]
+    if operator == "$ne":
+        return values[0] != values[1]
+    if operator in ("$gt", "$gte", "$lt", "$lte"):
+        result = _compare(values[0], values[1])
+        return result is not None and {
+            "$gt": result > 0, "$gte": result >= 0, "$lt": result < 0, "$lte": result <= 0
+        }[operator]
+    if operator == "$and":
+        return all(values)
+    if operator == "$or":
+        return any(values)
+    if operator == "$in":
+        return values[0] in (values[1] or [])
+    if operator == "$add":
+        return sum(v for v in values if v is not None)
+    if operator == "$subtract":
+        return values[0] - values[1]
+    if operator == "$multiply":
+        result = 1
+        for v in values:
+            result *= v
+        return result
+    if operator == "$divide":
+        return values[0] / values[1]
+    if operator == "$ifNull":
+        return next((v for v in values if v is not None), None)
+    if operator == "$size":
+        return len(values[0] or [])
+    raise OperationFailure(f"Unsupported expression operator in memory backend: {operator}")
+
+class _Accumulator:
+    def __init__(self, operator: str, expression: Any):
+        self.operator = operator
+        self.expression = expression
+        self.values: List[Any] = []
+
+    def add(self, doc: Dict[str, Any]):
+        self.values.append(evaluate(self.expression, doc))
+
+    def result(self) -> Any:
+        values = self.values
+        numbers = [v for v in values if isinstance(v, (int, float)) and not isinstance(v, bool)]
+        if self.operator == "$sum":
+            return sum(numbers)
+        if self.operator == "$avg":
+            return sum(numbers) / len(numbers) if numbers else None
+        if self.operator == "$min":
+            present = [v for v in values if v is not None]
+            return min(present, key=_sort_key) if present else None
+        if self.operator == "$max":
+            present = [v for v in values if v is not None]
+            return max(present, key=_sort_key) if present else None
+        if self.operator == "$first":
+            return values[0] if values else None
+        if self.operator == "$last":
+            return values[-1] if values else None
+        if self.operator == "$push":
+            return list(values)
+        if self.operator == "$addToSet":
+            unique = []
+            for v in values:
+                if v not in unique:
+                    unique.append(v)
+            return unique
+        raise OperationFailure(f"Unsupported accumulator in memory backend: {self.operator}")
+
+# ---------------------------------------------------------------------------
+# Projection, sorting and updates
+# ---------------------------------------------------------------------------
+
+def project(doc: Dict[str, Any], projection: Optional[Dict[str, Any]]) -> Dict[str, Any]:
+    if not projection:
+        return doc
+    include_id = projection.get("_id", 1)
+    fields = {k: v for k, v in projection.items() if k != "_id"}
+    if fields and all(not v for v in fields.values()):
+        result = copy.deepcopy(doc)
+        for key in fields:
+            _unset_path(result, key)
+        if not include_id:
+            result.pop("_id", None)
+        return result
+
+    result: Dict[str, Any] = {}
+    if include_id and "_id" in doc:
+        result["_id"] = doc["_id"]
+    for key, spec in fields.items():
+        if spec in (1, True):
+            value = _get_path(doc, key)
+            if value is not _MISSING:
+                _set_path(result, key, copy.deepcopy(value))
+        elif spec not in (0, False):
+            _set_path(result, key, evaluate(spec, doc))
+    return result
+
+def _normalize_sort(key_or_list: Any, direction: Optional[int] = None) -> List[Tuple[str, int]]:
+    if isinstance(key_or_list, str):
+        return [(key_or_list, direction or 1)]
+    if isinstance(key_or_list, dict):
+        return list(key_or_list.items())
+    return list(key_or_list)
+
+def sort_documents(docs: List[Dict[str, Any]], spec: List[Tuple[str, int]]) -> List[Dict[str, Any]]:
+    for key, direction in reversed(spec):
+        docs = sorted(docs, key=lambda d: _sort_key(_get_path(d, key)), reverse=direction < 0)
+    return docs
+
+def apply_update(doc: Dict[str, Any], update: Dict[str, Any], inserting: bool = False):
+    if not any(k.startswith("$") for k in update):
+        # Replacement document
+        _id = doc.get("_id")
+        doc.clear()
+        doc.update(copy.deepcopy(update))
+        if _id is not None:
+            doc["_id"] = _id
+        return
+
+    for operator, fields in update.items():
+        if operator == "$setOnInsert" and not inserting:
+            continue
+        for path, value in fields.items():
+            if operator in ("$set", "$setOnInsert"):
+                _set_path(doc, path, copy.deepcopy(value))
+            elif operator == "$unset":
+                _unset_path(doc, path)
+            elif operator == "$inc":
+                current = _get_path(doc, path)
+                _set_path(doc, path, (0 if current is _MISSING else current) + value)
+            elif operator == "$push":
+                current = _get_path(doc, path)
+                items = value["$each"] if isinstance(value, dict) and "$each" in value else [value]
+                _set_path(doc, path, ([] if current is _MISSING else current) + copy.deepcopy(items))
+            elif operator == "$addToSet":
+                current = _get_path(doc, path)
+                current = [] if current is _MISSING else current
+                items = value["$each"] if isinstance(value, dict) and "$each" in value else [value]
+                _set_path(doc, path, current + [i for i in items if i not in current])
+            elif operator == "$pull":
+                current = _get_path(doc, path)
+                if isinstance(current, list):
+                    _set_path(doc, path, [i for i in current if not _match_condition(i, value)])
+            elif operator == "$max":
+                current = _get_path(doc, path)
+                if current is _MISSING or _sort_key(value) > _sort_key(current):
+                    _set_path(doc, path, value)
+            elif operator == "$min":
+                current = _get_path(doc, path)
+                if current is _MISSING or _sort_key(value) < _sort_key(current):
+                    _set_path(doc, path, value)
+            else:
+                raise OperationFailure(f"Unsupported update operator in memory backend: {operator}")
+
+def _upsert_seed(query: Dict[str, Any]) -> Dict[str, Any]:
+    """Equality fields of a query become fields of an upserted document"""
+    seed: Dict[str, Any] = {}
+    for key, condition in query.items():
+        if key.startswith("$"):
+            continue
+        if isinstance(condition, dict) and any(k.startswith("$") for k in condition):
+            if "$eq" in condition:
+                _set_path(seed, key, condition["$eq"])
+            continue
+        _set_path(seed, key, copy.deepcopy(condition))
+    return seed
+
+# ---------------------------------------------------------------------------
+# Result objects (attribute-compatible with pymongo.results)
+# ---------------------------------------------------------------------------
+
+class InsertOneResult:
+    def __init__(self, inserted_id):
+        self.inserted_id = inserted_id
+        self.acknowledged = True
+
+class InsertManyResult:
+    def __init__(self, inserted_ids):
+        self.inserted_ids = inserted_ids
+        self.acknowledged = True
+
+class UpdateResult:
+    def __init__(self, matched_count, modified_count, upserted_id=None):
+        self.matched_count = matched_count
+        self.modified_count = modified_count
+        self.upserted_id = upserted_id
+        self.acknowledged = True
+
+class DeleteResult:
+    def __init__(self, deleted_count):
+        self.deleted_count = deleted_count
+        self.acknowledged = True
+
+class BulkWriteResult:
+    def __init__(self, counts: Dict[str, int], upserted_ids: Dict[int, Any]):
+        self.inserted_count = counts["inserted"]
+        self.matched_count = counts["matched"]
+        self.modified_count = counts["modified"]
+        self.deleted_count = counts["deleted"]
+        self.upserted_count = len(upserted_ids)
+        self.upserted_ids = upserted_ids
+        self.acknowledged = True
+
+# ---------------------------------------------------------------------------
+# Cursors, collections, databases
+# ---------------------------------------------------------------------------
+
+class MemoryCursor:
+    """Async cursor over a snapshot of documents (find / aggregate)"""
+    def __init__(self, producer):
+        self._producer = producer
+        self._sort: List[Tuple[str, int]] = []
+        self._skip = 0
+        self._limit = 0
+        self._results: Optional[List[Dict[str, Any]]] = None
+
+    def sort(self, key_or_list, direction=None):
+        self._sort.extend(_normalize_sort(key_or_list, direction))
+        return self
+
+    def skip(self, count: int):
+        self._skip = count
+        return self
+
+    def limit(self, count: int):
+        self._limit = count
+        return self
+
+    def _materialize(self) -> List[Dict[str, Any]]:
+        if self._results is None:
+            docs = self._producer(self._sort)
+            docs = docs[self._skip:]
+            if self._limit:
+                docs = docs[:self._limit]
+            self._results = docs
+        return self._results
+
+    def __aiter__(self):
+        self._iter = iter(self._materialize())
+        return self
+
+    async def __anext__(self):
+        try:
+            return next(self._iter)
+        except StopIteration:
+            raise StopAsyncIteration
+
+    async def to_list(self, length: Optional[int] = None):
+        docs = self._materialize()
+        return list(docs if length is None else docs[:length])
+
+class MemoryCollection:
+    def __init__(self, database: "MemoryDatabase", name: str):
+        self.database = database
+        self.name = name
+        self.read_preference = None
+
+    @property
+    def _docs(self) -> Dict[Any, Dict[str, Any]]:
+        return self.database._store.setdefault(self.name, {})
+
+    @property
+    def _indexes(self) -> Dict[str, Dict[str, Any]]:
+        return self.database._indexes.setdefault(self.name, {})
+
+    def with_options(self, **kwargs) -> "MemoryCollection":
+        return self
+
+    def _find(self, query: Optional[Dict[str, Any]]) -> List[Dict[str, Any]]:
+        query = query or {}
+        if set(query) == {"_id"} and not isinstance(query["_id"], dict):
+            doc = self._docs.get(query["_id"])
+            return [doc] if doc is not None else []
+        return [doc for doc in self._docs.values() if matches(doc, query)]
+
+    def _check_unique(self, doc: Dict[str, Any], ignore_id: Any = _MISSING):
+        for index in self._indexes.values():
+            if not index.get("unique"):
+                continue
+            keys = [k for k, _ in index["key"]]
+            values = [_get_path(doc, k) for k in keys]
+            if index.get("sparse") and all(v is _MISSING for v in values):
+                continue
+            for other in self._docs.values():
+                if other.get("_id") == ignore_id:
+                    continue
+                if [_get_path(other, k) for k in keys] == values:
+                    raise DuplicateKeyError(
+                        f"E11000 duplicate key error collection: {self.name} index: {index['name']}",
+                        11000
+                    )
+
+    def _insert(self, document: Dict[str, Any]) -> Any:
+        if "_id" not in document:
+            document["_id"] = ObjectId()
+        if document["_id"] in self._docs:
+            raise DuplicateKeyError(f"E11000 duplicate key error collection: {self.name} index: _id_", 11000)
+        stored = copy.deepcopy(document)
+        self._check_unique(stored)
+        self._docs[stored["_id"]] = stored
+        return stored["_id"]
+
+    def _update(self, query, update, upsert=False, multi=False) -> UpdateResult:
+        targets = self._find(query)
+        if not multi:
+            targets = targets[:1]
+        if not targets:
+            if not upsert:
+                return UpdateResult(0, 0)
+            doc = _upsert_seed(query)
+            apply_update(doc, update, inserting=True)
+            return UpdateResult(0, 0, upserted_id=self._insert(doc))
+
+        modified = 0
+        for doc in targets:
+            updated = copy.deepcopy(doc)
+            apply_update(updated, update)
+            if updated != doc:
+                self._check_unique(updated, ignore_id=doc["_id"])
+                self._docs[doc["_id"]] = updated
+                modified += 1
+        return UpdateResult(len(targets), modified)
+
+    def _delete(self, query, multi=False) -> DeleteResult:
+        targets = self._find(query)
+        if not multi:
+            targets = targets[:1]
+        for doc in targets:
+            self._docs.pop(doc["_id"], None)
+        return DeleteResult(len(targets))
+
+    async def find_one(self, filter=None, projection=None, *args, sort=None, **kwargs):
+        docs = self._find(filter)
+        if sort:
+            docs = sort_documents(docs, _normalize_sort(sort))
+        if not docs:
+            return None
+        return project(copy.deepcopy(docs[0]), projection)
+
+    def find(self, filter=None, projection=None, *args, **kwargs) -> MemoryCursor:
+        def produce(sort_spec):
+            docs = self._find(filter)
+            if sort_spec:
+                docs = sort_documents(docs, sort_spec)
+            return [project(copy.deepcopy(d), projection) for d in docs]
+        cursor = MemoryCursor(produce)
+        if kwargs.get("sort"):
+            cursor.sort(kwargs["sort"])
+        if kwargs.get("limit"):
+            cursor.limit(kwargs["limit"])
+        return cursor
+
+    async def insert_one(self, document, *args, **kwargs) -> InsertOneResult:
+        return InsertOneResult(self._insert(document))
+
+    async def insert_many(self, documents, ordered=True, *args, **kwargs) -> InsertManyResult:
+        await self.bulk_write([InsertOne(d) for d in documents], ordered=ordered)
+        return InsertManyResult([d["_id"] for d in documents])
+
+    async def update_one(self, filter, update, upsert=False, *args, **kwargs) -> UpdateResult:
+        return self._update(filter, update, upsert=upsert)
+
+    async def update_many(self, filter, update, upsert=False, *args, **kwargs) -> UpdateResult:
+        return self._update(filter, update, upsert=upsert, multi=True)
+
+    async def replace_one(self, filter, replacement, upsert=False, *args, **kwargs) -> UpdateResult:
+        return self._update(filter, replacement, upsert=upsert)
+
+    async def find_one_and_update(self, filter, update, projection=None, upsert=False,
+                                  return_document=ReturnDocument.BEFORE, *args, sort=None, **kwargs):
+        docs = self._find(filter)
+        if sort:
+            docs = sort_documents(docs, _normalize_sort(sort))
+        before = copy.deepcopy(docs[0]) if docs else None
+        if before is None:
+            if not upsert:
+                return None
+            result = self._update(filter, update, upsert=True)
+            after = self._docs[result.upserted_id]
+        else:
+            self._update({"_id": before["_id"]}, update)
+            after = self._docs.get(before["_id"])
+        doc = after if return_document == ReturnDocument.AFTER else before
+        return project(copy.deepcopy(doc), projection) if doc is not None else None
+
+    async def find_one_and_delete(self, filter, projection=None, *args, **kwargs):
+        docs = self._find(filter)
+        if not docs:
+            return None
+        doc = self._docs.pop(docs[0]["_id"])
+        return project(doc, projection)
+
+    async def delete_one(self, filter, *args, **kwargs) -> DeleteResult:
+        return self._delete(filter)
+
+    async def delete_many(self, filter, *args, **kwargs) -> DeleteResult:
+        return self._delete(filter, multi=True)
+
+    async def count_documents(self, filter, *args, **kwargs) -> int:
+        return len(self._find(filter))
+
+    async def estimated_document_count(self, *args, **kwargs) -> int:
+        return len(self._docs)
+
+    async def distinct(self, key, filter=None, *args, **kwargs) -> List[Any]:
+        values: List[Any] = []
+        for doc in self._find(filter):
+            value = _get_path(doc, key)
+            for v in (value if isinstance(value, list) else [value]):
+                if v is not _MISSING and v not in values:
+                    values.append(v)
+        return values
+
+    async def bulk_write(self, requests: Iterable[Any], ordered=True, *args, **kwargs) -> BulkWriteResult:
+        counts = {"inserted": 0, "matched": 0, "modified": 0, "deleted": 0}
+        upserted: Dict[int, Any] = {}
+        errors: List[Dict[str, Any]] = []
+        for index, request in enumerate(requests):
+            try:
+                if isinstance(request, InsertOne):
+                    self._insert(request._doc)
+                    counts["inserted"] += 1
+                elif isinstance(request, (UpdateOne, UpdateMany, ReplaceOne)):
+                    result = self._update(
+                        request._filter, request._doc, upsert=request._upsert,
+                        multi=isinstance(request, UpdateMany)
+                    )
+                    counts["matched"] += result.matched_count
+                    counts["modified"] += result.modified_count
+                    if result.upserted_id is not None:
+                        upserted[index] = result.upserted_id
+                elif isinstance(request, (DeleteOne, DeleteMany)):
+                    counts["deleted"] += self._delete(
+                        request._filter, multi=isinstance(request, DeleteMany)
+                    ).deleted_count
+                else:
+                    raise OperationFailure(f"Unsupported bulk operation: {request!r}")
+            except DuplicateKeyError as e:
+                errors.append({"index": index, "code": 11000, "errmsg": str(e)})
+                if ordered:
+                    break
+        if errors:
+            raise BulkWriteError({
+                "writeErrors": errors,
+                "nInserted": counts["inserted"],
+                "nMatched": counts["matched"],
+                "nModified": counts["modified"],
+                "nRemoved": counts["deleted"],
+                "upserted": [{"index": i, "_id": _id} for i, _id in upserted.items()]
+            })
+        return BulkWriteResult(counts, upserted)
+
+    def aggregate(self, pipeline: List[Dict[str, Any]], *args, **kwargs) -> MemoryCursor:
+        def produce(sort_spec):
+            docs = run_pipeline(self.database, copy.deepcopy(list(self._docs.values())), pipeline)
+            return sort_documents(docs, sort_spec) if sort_spec else docs
+        return MemoryCursor(produce)
+
+    async def create_index(self, keys, *args, **kwargs) -> str:
+        key = _normalize_sort(keys, 1)
+        name = kwargs.get("name") or "_".join(f"{k}_{d}" for k, d in key)
+        self._indexes[name] = {
+            "key": key,
+            "name": name,
+            "unique": bool(kwargs.get("unique")),
+            "sparse": bool(kwargs.get("sparse")),
+            "expireAfterSeconds": kwargs.get("expireAfterSeconds")
+        }
+        return name
+
+    async def drop_index(self, name, *args, **kwargs):
+        self._indexes.pop(name, None)
+
+    async def index_information(self) -> Dict[str, Any]:
+        info = {"_id_": {"key": [("_id", 1)]}}
+        for name, index in self._indexes.items():
+            info[name] = {k: v for k, v in index.items() if k != "name" and v not in (None, False)}
+        return info
+
+    async def drop(self, *args, **kwargs):
+        self.database._store.pop(self.name, None)
+        self.database._indexes.pop(self.name, None)
+
+def run_pipeline(database: "MemoryDatabase", docs: List[Dict[str, Any]], pipeline: List[Dict[str, Any]],
+                 variables: Optional[Dict[str, Any]] = None) -> List[Dict[str, Any]]:
+    """Run the supported aggregation stages over a list of documents"""
+    for stage in pipeline:
+        (name, spec), = stage.items()
+        if name == "$match":
+            docs = [d for d in docs if matches(d, spec, variables)]
+        elif name == "$project":
+            docs = [project(d, spec) for d in docs]
+        elif name == "$addFields" or name == "$set":
+            for d in docs:
+                for key, expression in spec.items():
+                    _set_path(d, key, evaluate(expression, d, variables))
+        elif name == "$sort":
+            docs = sort_documents(docs, _normalize_sort(spec))
+        elif name == "$skip":
+            docs = docs[spec:]
+        elif name == "$limit":
+            docs = docs[:spec]
+        elif name == "$count":
+            docs = [{spec: len(docs)}]
+        elif name == "$unwind":
+            path = spec if isinstance(spec, str) else spec["path"]
+            keep_empty = isinstance(spec, dict) and spec.get("preserveNullAndEmptyArrays")
+            field = path[1:]
+            unwound = []
+            for d in docs:
+                value = _get_path(d, field)
+                if isinstance(value, list) and value:
+                    for item in value:
+                        copy_doc = copy.deepcopy(d)
+                        _set_path(copy_doc, field, item)
+                        unwound.append(copy_doc)
+                elif keep_empty:
+                    unwound.append(d)
+                elif value is not _MISSING and value is not None and not isinstance(value, list):
+                    unwound.append(d)
+            docs = unwound
+        elif name == "$group":
+            groups: Dict[str, Tuple[Any, Dict[str, _Accumulator]]] = {}
+            for d in docs:
+                key = evaluate(spec["_id"], d, variables)
+                marker = repr(key)
+                if marker not in groups:
+                    groups[marker] = (key, {
+                        field: _Accumulator(*next(iter(acc.items())))
+                        for field, acc in spec.items() if field != "_id"
+                    })
+                for accumulator in groups[marker][1].values():
+                    accumulator.add(d)
+            docs = [
+                {"_id": key, **{field: acc.result() for field, acc in accumulators.items()}}
+                for key, accumulators in groups.values()
+            ]
+        elif name == "$lookup":
+            foreign = list(database[spec["from"]]._docs.values())
+            for d in docs:
+                if "localField" in spec:
+                    local = _get_path(d, spec["localField"])
+                    joined = [copy.deepcopy(f) for f in foreign
+                              if _values_equal(_get_path(f, spec["foreignField"]), None if local is _MISSING else local)]
+                else:
+                    let = {k: evaluate(v, d, variables) for k, v in spec.get("let", {}).items()}
+                    joined = run_pipeline(database, copy.deepcopy(foreign), spec.get("pipeline", []), let)
+                d[spec["as"]] = joined
+        else:
+            raise OperationFailure(f"Unsupported aggregation stage in memory backend: {name}")
+    return docs
+
+class MemoryDatabase:
+    def __init__(self, client: "MemoryClient", name: str):
+        self.client = client
+        self.name = name
+        self._store: Dict[str, Dict[Any, Dict[str, Any]]] = {}
+        self._indexes: Dict[str, Dict[str, Dict[str, Any]]] = {}
+        self._collections: Dict[str, MemoryCollection] = {}
+
+    def get_collection(self, name: str, *args, **kwargs) -> MemoryCollection:
+        if name not in self._collections:
+            self._collections[name] = MemoryCollection(self, name)
+        return self._collections[name]
+
+    def __getitem__(self, name: str) -> MemoryCollection:
+        return self.get_collection(name)
+
+    def __getattr__(self, name: str) -> MemoryCollection:
+        if name.startswith("_"):
+            raise AttributeError(name)
+        return self.get_collection(name)
+
+    async def list_collection_names(self, *args, **kwargs) -> List[str]:
+        return [name for name, docs in self._store.items() if docs]
+
+    async def command(self, command, *args, **kwargs) -> Dict[str, Any]:
+        name = command if isinstance(command, str) else next(iter(command))
+        if name == "ping":
+            return {"ok": 1.0}
+        raise OperationFailure(f"Unsupported command in memory backend: {name}")
+
+class MemoryClient:
+    """Stand-in for AsyncIOMotorClient"""
+    def __init__(self, *args, **kwargs):
+        self._databases: Dict[str, MemoryDatabase] = {}
+        self.admin = self["admin"]
+
+    def __getitem__(self, name: str) -> MemoryDatabase:
+        if name not in self._databases:
+            self._databases[name] = MemoryDatabase(self, name)
+        return self._databases[name]
+
+    def get_database(self, name: str, *args, **kwargs) -> MemoryDatabase:
+        return self[name]
+
+    def close(self):
+        pass
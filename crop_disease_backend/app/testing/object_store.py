@@ -0,0 +1,219 @@
+# object_store.py
+"""
+Minimal S3-compatible object store for running the S3 image backend locally.
+
+Run with:
+    python -m app.testing.object_store --port 9200 --access-key test --secret-key testsecret
+
+and point the backend at it:
+    STORAGE_BACKEND=s3 S3_ENDPOINT_URL=http://127.0.0.1:9200 S3_BUCKET=images
+    S3_ACCESS_KEY_ID=test S3_SECRET_ACCESS_KEY=testsecret
+
+Supports path-style PUT / GET / HEAD / DELETE of objects and ListObjectsV2
+(GET /<bucket>?list-type=2), and verifies SigV4
+header signatures and presigned query signatures (including expiry), so
+signing bugs fail here the way they would against a real store. Buckets are
+created on first write. Objects live in memory unless --data-dir is given.
+"""
+import argparse
+import datetime
+import hashlib
+import os
+from typing import Dict, List, Optional, Tuple
+from urllib.parse import quote
+from xml.sax.saxutils import escape
+from fastapi import FastAPI, Request, Response
+from app.utils.sigv4 import sigv4_signature
+
+class MemoryObjects:
+    """bucket/key -> (bytes, content type, cache control, last modified)"""
+    def __init__(self):
+        self.objects: Dict[str, Tuple[bytes, str, Optional[str], datetime.datetime]] = {}
+
+    def put(self, name: str, data: bytes, content_type: str, cache_control: Optional[str]):
+        self.objects[name] = (data, content_type, cache_control, datetime.datetime.utcnow())
+
+    def get(self, name: str):
+        return self.objects.get(name)
+
+    def delete(self, name: str):
+        self.objects.pop(name, None)
+
+    def list(self, prefix: str) -> List[Tuple[str, int, datetime.datetime]]:
+        """(name, size, last modified) of objects whose name starts with prefix, sorted by name"""
+        entries = []
+        for name in list(self.objects):
+            found = self.get(name) if name.startswith(prefix) else None
+            if found is not None:
+                entries.append((name, len(found[0]), found[3]))
+        return sorted(entries)
+
+class DiskObjects(MemoryObjects):
+    """Objects as files under a directory; metadata is kept in memory only"""
+    def __init__(self, root: str):
+        super().__init__()
+        self.root = root
+
+    def _path(self, name: str) -> str:
+        return os.path.join(self.root, *name.split("/"))
+
+    def put(self, name, data, content_type, cache_control):
+        path = self._path(name)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        with open(path, "wb") as f:
+            f.write(data)
+        self.objects[name] = (b"", content_type, cache_control, datetime.datetime.utcnow())
+
+    def get(self, name):
+        path = self._path(name)
+        if not os.path.exists(path):
+            return None
+        with open(path, "rb") as f:
+            data = f.read()
+        modified = datetime.datetime.utcfromtimestamp(os.path.getmtime(path))
+        _, content_type, cache_control, _ = self.objects.get(name, (b"", "application/octet-stream", None, None))
+        return data, content_type, cache_control, modified
+
+    def delete(self, name):
+        path = self._path(name)
+        if os.path.exists(path):
+            os.remove(path)
+        self.objects.pop(name, None)
+
+def _error(status: int, code: str) -> Response:
+    body = f'<?xml version="1.0" encoding="UTF-8"?><Error><Code>{code}</Code></Error>'
+    return Response(status_code=status, content=body, media_type="application/xml")
+
+def create_app(access_key: str = "test", secret_key: str = "testsecret", region: str = "us-east-1",
+               data_dir: Optional[str] = None) -> FastAPI:
+    """Build the object-store application"""
+    app = FastAPI(title="Fake S3 object store")
+    store = DiskObjects(data_dir) if data_dir else MemoryObjects()
+    app.state.store = store
+    app.state.request_counts = {}
+
+    def authorize(request: Request, body: bytes) -> Optional[Response]:
+        """Check a header or presigned SigV4 signature; returns an error response on failure"""
+        path = quote(request.url.path, safe="/-_.~")
+        query = dict(request.query_params)
+        if "X-Amz-Signature" in query:
+            provided = query.pop("X-Amz-Signature")
+            amz_date = query.get("X-Amz-Date", "")
+            try:
+                issued = datetime.datetime.strptime(amz_date, "%Y%m%dT%H%M%SZ")
+                expires = int(query.get("X-Amz-Expires", "0"))
+            except ValueError:
+                return _error(403, "AuthorizationQueryParametersError")
+            if datetime.datetime.utcnow() > issued + datetime.timedelta(seconds=expires):
+                return _error(403, "AccessDenied")
+            if not query.get("X-Amz-Credential", "").startswith(f"{access_key}/"):
+                return _error(403, "InvalidAccessKeyId")
+            signed = query.get("X-Amz-SignedHeaders", "host").split(";")
+            headers = {name: request.headers.get(name, "") for name in signed}
+            payload_hash = "UNSIGNED-PAYLOAD"
+        else:
+            authorization = request.headers.get("authorization", "")
+            if not authorization.startswith("AWS4-HMAC-SHA256 "):
+                return _error(403, "AccessDenied")
+            fields = dict(part.strip().split("=", 1) for part in authorization[len("AWS4-HMAC-SHA256 "):].split(","))
+            if not fields.get("Credential", "").startswith(f"{access_key}/"):
+                return _error(403, "InvalidAccessKeyId")
+            provided = fields.get("Signature", "")
+            amz_date = request.headers.get("x-amz-date", "")
+            payload_hash = request.headers.get("x-amz-content-sha256", "")
+            if payload_hash != "UNSIGNED-PAYLOAD" and payload_hash != hashlib.sha256(body).hexdigest():
+                return _error(400, "XAmzContentSHA256Mismatch")
+            headers = {name: request.headers.get(name, "") for name in fields.get("SignedHeaders", "").split(";")}
+
+        expected, _ = sigv4_signature(secret_key, region, amz_date, request.method, path, query, headers, payload_hash)
+        if expected != provided:
+            return _error(403, "SignatureDoesNotMatch")
+        return None
+
+    @app.get("/stats")
+    async def stats():
+        return {"objects": len(store.objects), "requests": app.state.request_counts}
+
+    @app.get("/{bucket}")
+    async def list_objects(bucket: str, request: Request):
+        """ListObjectsV2; the continuation token is the last key of the previous page"""
+        failure = authorize(request, b"")
+        if failure:
+            return failure
+        app.state.request_counts["LIST"] = app.state.request_counts.get("LIST", 0) + 1
+        params = request.query_params
+        prefix = params.get("prefix", "")
+        max_keys = int(params.get("max-keys", "1000"))
+        after = params.get("continuation-token", "")
+        matching = [
+            (name[len(bucket) + 1:], size, modified)
+            for name, size, modified in store.list(f"{bucket}/{prefix}")
+            if name[len(bucket) + 1:] > after
+        ]
+        page, truncated = matching[:max_keys], len(matching) > max_keys
+        contents = "".join(
+            f"<Contents><Key>{escape(key)}</Key><LastModified>{modified.strftime('%Y-%m-%dT%H:%M:%S.000Z')}"
+            f"</LastModified><Size>{size}</Size></Contents>"
+            for key, size, modified in page
+        )
+        token = f"<NextContinuationToken>{escape(page[-1][0])}</NextContinuationToken>" if truncated else ""
+        body = (
+            '<?xml version="1.0" encoding="UTF-8"?>'
+            '<ListBucketResult xmlns="http://s3.amazonaws.com/doc/2006-03-01/">'
+            f"<Name>{escape(bucket)}</Name><Prefix>{escape(prefix)}</Prefix><KeyCount>{len(page)}</KeyCount>"
+            f"<MaxKeys>{max_keys}</MaxKeys><IsTruncated>{str(truncated).lower()}</IsTruncated>{token}{contents}"
+            "</ListBucketResult>"
+        )
+        return Response(content=body, media_type="application/xml")
+
+    @app.api_route("/{bucket}/{key:path}", methods=["PUT", "GET", "HEAD", "DELETE"])
+    async def object_handler(bucket: str, key: str, request: Request):
+        body = await request.body()
+        failure = authorize(request, body)
+        if failure:
+            return failure
+        method = request.method
+        app.state.request_counts[method] = app.state.request_counts.get(method, 0) + 1
+        name = f"{bucket}/{key}"
+
+        if method == "PUT":
+            store.put(name, body, request.headers.get("content-type", "application/octet-stream"),
+                      request.headers.get("cache-control"))
+            return Response(status_code=200, headers={"ETag": f'"{hashlib.md5(body).hexdigest()}"'})
+        if method == "DELETE":
+            store.delete(name)
+            return Response(status_code=204)
+
+        found = store.get(name)
+        if found is None:
+            return _error(404, "NoSuchKey") if method == "GET" else Response(status_code=404)
+        data, content_type, cache_control, modified = found
+        headers = {
+            "ETag": f'"{hashlib.md5(data).hexdigest()}"',
+            "Content-Length": str(len(data)),
+            "Last-Modified": modified.strftime("%a, %d %b %Y %H:%M:%S GMT")
+        }
+        if cache_control:
+            headers["Cache-Control"] = cache_control
+        if method == "HEAD":
+            return Response(status_code=200, headers=headers, media_type=content_type)
+        return Response(content=data, media_type=content_type, headers=headers)
+
+    return app
+
+def main():
+    import uvicorn
+
+    parser = argparse.ArgumentParser(description="Run a local S3-compatible object store")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=9200)
+    parser.add_argument("--access-key", default="test")
+    parser.add_argument("--secret-key", default="testsecret")
+    parser.add_argument("--region", default="us-east-1")
+    parser.add_argument("--data-dir", help="Keep objects on disk instead of in memory")
+    args = parser.parse_args()
+    app = create_app(args.access_key, args.secret_key, args.region, args.data_dir)
+    uvicorn.run(app, host=args.host, port=args.port, log_level="warning")
+
+if __name__ == "__main__":
+    main()
@@ -1,22 +1,29 @@
 # app/utils/auth_utils.py - Enhanced version with better security
 
 from datetime import datetime, timedelta
-from typing import Optional
+from typing import Any, Dict, Optional, Tuple
 from jose import JWTError, jwt
 from passlib.context import CryptContext
 from fastapi import HTTPException, status, Depends
 from fastapi.security import HTTPBearer, HTTPAuthorizationCredentials
 from app.config import settings
 from app.database import get_database
-from app.models.user import UserInDB, TokenData
+from app.models.user import UserInDB, TokenData, TokenPrincipal
 from bson import ObjectId
+from pymongo import ReturnDocument
+from pymongo.errors import DuplicateKeyError
 import logging
+import time
+import uuid
 
 logger = logging.getLogger(__name__)
 
 pwd_context = CryptContext(schemes=["bcrypt"], deprecated="auto")
 security = HTTPBearer()
 
+# user_id -> (token_version, is_active, expires_at)
+_token_state_cache: Dict[str, Tuple[int, bool, float]] = {}
+
 def verify_password(plain_password: str, hashed_password: str) -> bool:
     """Verify a password against its hash"""
     try:
@@ -29,7 +36,19 @@ def get_password_hash(password: str) -> str:
     """Hash a password"""
     return pwd_context.hash(password)
 
-def create_access_token(data: dict, expires_delta: Optional[timedelta] = None):
+def build_token_claims(user: Dict[str, Any]) -> Dict[str, Any]:
+    """
+    Claims signed into tokens so read paths can authorize without a DB lookup
+    """
+    return {
+        "sub": user["email"],
+        "uid": str(user["_id"]),
+        "region": user.get("region", ""),
+        "active": user.get("is_active", True),
+        "ver": user.get("token_version", 0)
+    }
+
+def create_access_token(data: dict, expires_delta: Optional[timedelta] = None, token_type: str = "access"):
     """Create JWT access token"""
     to_encode = data.copy()
     
@@ -41,7 +60,7 @@ def create_access_token(data: dict, expires_delta: Optional[timedelta] = None):
     to_encode.update({
         "exp": expire,
         "iat": datetime.utcnow(),  # Issued at
-        "type": "access"  # Token type
+        "type": token_type  # Token type
     })
     
     try:
@@ -54,8 +73,32 @@ def create_access_token(data: dict, expires_delta: Optional[timedelta] = None):
             detail="Could not create access token"
         )
 
-async def get_current_user(credentials: HTTPAuthorizationCredentials = Depends(security)):
-    """Get current authenticated user"""
+def create_refresh_token(data: dict, expires_delta: Optional[timedelta] = None):
+    """Create long-lived JWT refresh token; its jti lets it be used only once"""
+    return create_access_token(
+        {**data, "jti": uuid.uuid4().hex},
+        expires_delta=expires_delta or timedelta(days=settings.REFRESH_TOKEN_EXPIRE_DAYS),
+        token_type="refresh"
+    )
+
+async def consume_refresh_token(payload: Dict[str, Any]) -> bool:
+    """
+    Mark a refresh token as used (rotation). Returns False if it was used
+    before. Used ids are kept until the token would have expired anyway.
+    """
+    db = get_database()
+    try:
+        await db.used_refresh_tokens.insert_one({
+            "_id": payload.get("jti") or f"{payload.get('uid')}:{payload.get('iat')}",
+            "user_id": payload.get("uid"),
+            "created_at": datetime.utcnow()
+        })
+        return True
+    except DuplicateKeyError:
+        return False
+
+def decode_token(token: str, expected_type: str = "access") -> Dict[str, Any]:
+    """Decode and verify a token, raising 401 on any problem"""
     credentials_exception = HTTPException(
         status_code=status.HTTP_401_UNAUTHORIZED,
         detail="Could not validate credentials",
@@ -63,24 +106,11 @@ async def get_current_user(credentials: HTTPAuthorizationCredentials = Depends(s
     )
     
     try:
-        # Decode and verify token
         payload = jwt.decode(
-            credentials.credentials, 
-            settings.SECRET_KEY, 
+            token,
+            settings.SECRET_KEY,
             algorithms=[settings.ALGORITHM]
         )
-        
-        email: str = payload.get("sub")
-        if email is None:
-            raise credentials_exception
-        
-        # Verify token type
-        token_type = payload.get("type")
-        if token_type != "access":
-            raise credentials_exception
-        
-        token_data = TokenData(email=email)
-        
     except jwt.ExpiredSignatureError:
         raise HTTPException(
             status_code=status.HTTP_401_UNAUTHORIZED,
@@ -94,6 +124,60 @@ async def get_current_user(credentials: HTTPAuthorizationCredentials = Depends(s
         logger.error(f"Token validation error: {e}")
         raise credentials_exception
     
+    if payload.get("sub") is None or payload.get("type") != expected_type:
+        raise credentials_exception
+    
+    return payload
+
+def invalidate_token_state(user_id: str) -> None:
+    """Drop the cached token version / active flag for a user"""
+    _token_state_cache.pop(user_id, None)
+
+async def get_token_state(user_id: str) -> Optional[Tuple[int, bool]]:
+    """
+    Current (token_version, is_active) for a user, served from a short TTL cache
+    """
+    cached = _token_state_cache.get(user_id)
+    now = time.monotonic()
+    if cached and cached[2] > now:
+        return cached[0], cached[1]
+    
+    db = get_database()
+    user = await db.users.find_one(
+        {"_id": ObjectId(user_id)},
+        {"token_version": 1, "is_active": 1}
+    )
+    if user is None:
+        invalidate_token_state(user_id)
+        return None
+    
+    state = (user.get("token_version", 0), user.get("is_active", True))
+    _token_state_cache[user_id] = (*state, now + settings.TOKEN_VERSION_CACHE_TTL_SECONDS)
+    return state
+
+async def revoke_user_tokens(user_id: str) -> int:
+    """Invalidate every token issued to a user by bumping their token version"""
+    db = get_database()
+    user = await db.users.find_one_and_update(
+        {"_id": ObjectId(user_id)},
+        {"$inc": {"token_version": 1}, "$set": {"updated_at": datetime.utcnow()}},
+        projection={"token_version": 1},
+        return_document=ReturnDocument.AFTER
+    )
+    invalidate_token_state(user_id)
+    return user.get("token_version", 0) if user else 0
+
+async def get_current_user(credentials: HTTPAuthorizationCredentials = Depends(security)):
+    """Get current authenticated user"""
+    credentials_exception = HTTPException(
+        status_code=status.HTTP_401_UNAUTHORIZED,
+        detail="Could not validate credentials",
+        headers={"WWW-Authenticate": "Bearer"},
+    )
+    
+    payload = decode_token(credentials.credentials)
+    token_data = TokenData(email=payload.get("sub"))
+    
     try:
         db = get_database()
         user = await db.users.find_one({"email": token_data.email})
@@ -101,6 +185,10 @@ async def get_current_user(credentials: HTTPAuthorizationCredentials = Depends(s
         if user is None:
             raise credentials_exception
         
+        # Tokens issued before a revocation carry an outdated version
+        if "ver" in payload and payload["ver"] != user.get("token_version", 0):
+            raise credentials_exception
+        
         user["_id"] = str(user["_id"])
         return UserInDB(**user)
         
@@ -117,6 +205,53 @@ async def get_current_active_user(current_user: UserInDB = Depends(get_current_u
         )
     return current_user
 
+async def get_current_principal(credentials: HTTPAuthorizationCredentials = Depends(security)) -> TokenPrincipal:
+    """
+    Get the active caller from token claims alone.
+    Only the token version is checked, through a small TTL cache; tokens
+    issued without claims fall back to a full user lookup.
+    """
+    credentials_exception = HTTPException(
+        status_code=status.HTTP_401_UNAUTHORIZED,
+        detail="Could not validate credentials",
+        headers={"WWW-Authenticate": "Bearer"},
+    )
+    
+    payload = decode_token(credentials.credentials)
+    
+    if "uid" not in payload:
+        user = await get_current_active_user(await get_current_user(credentials))
+        return TokenPrincipal(
+            id=str(user.id),
+            email=user.email,
+            region=user.region,
+            is_active=user.is_active,
+            token_version=user.token_version
+        )
+    
+    try:
+        state = await get_token_state(payload["uid"])
+    except Exception as e:
+        logger.error(f"Token state lookup error: {e}")
+        raise credentials_exception
+    
+    if state is None or state[0] != payload.get("ver", 0):
+        raise credentials_exception
+    
+    if not payload.get("active", True) or not state[1]:
+        raise HTTPException(
+            status_code=status.HTTP_403_FORBIDDEN,
+            detail="Inactive user account"
+        )
+    
+    return TokenPrincipal(
+        id=payload["uid"],
+        email=payload["sub"],
+        region=payload.get("region", ""),
+        is_active=True,
+        token_version=state[0]
+    )
+
 def validate_password_strength(password: str) -> tuple[bool, str]:
     """
     Validate password strength
@@ -135,4 +270,4 @@ def validate_password_strength(password: str) -> tuple[bool, str]:
     if not (has_upper and has_lower and has_digit):
         return False, "Password must contain uppercase, lowercase, and numeric characters"
     
-    return True, ""
\ No newline at end of file
+    return True, ""
@@ -0,0 +1,110 @@
+# bulk_writer.py
+import asyncio
+from typing import Any, Dict, List, Optional, Tuple, Union
+from pymongo import InsertOne, UpdateOne, ReplaceOne, DeleteOne
+from pymongo.errors import BulkWriteError
+from app.config import settings
+from app.database import get_database
+from app.utils.metrics import metrics
+import logging
+
+logger = logging.getLogger(__name__)
+
+WriteOperation = Union[InsertOne, UpdateOne, ReplaceOne, DeleteOne]
+
+class BulkWriter:
+    """
+    Write-behind batching of MongoDB writes.
+
+    Operations submitted by concurrent requests are queued per collection
+    and sent as one unordered bulk_write when the batch is full or the
+    flush window elapses. Each submit() returns a future that resolves
+    once the server acknowledged that operation (or fails with its error).
+    """
+    def __init__(self, max_batch_size: int, flush_interval: float):
+        self.max_batch_size = max(1, max_batch_size)
+        self.flush_interval = flush_interval
+        self._pending: Dict[str, List[Tuple[WriteOperation, asyncio.Future]]] = {}
+        self._timers: Dict[str, asyncio.TimerHandle] = {}
+        self._flushes: set = set()
+        self._closed = False
+    
+    def submit(self, collection: str, operation: WriteOperation) -> asyncio.Future:
+        """Queue a write; the returned future resolves when it is acknowledged"""
+        if self._closed:
+            raise RuntimeError("Bulk writer is closed")
+        
+        loop = asyncio.get_running_loop()
+        future = loop.create_future()
+        queue = self._pending.setdefault(collection, [])
+        queue.append((operation, future))
+        
+        if len(queue) >= self.max_batch_size or self.flush_interval <= 0:
+            self._schedule_flush(collection)
+        elif collection not in self._timers:
+            self._timers[collection] = loop.call_later(
+                self.flush_interval, self._schedule_flush, collection
+            )
+        return future
+    
+    async def insert(self, collection: str, document: Dict[str, Any]) -> Any:
+        """Insert a document through the batch and wait for acknowledgement"""
+        await self.submit(collection, InsertOne(document))
+        return document.get("_id")
+    
+    def _schedule_flush(self, collection: str):
+        task = asyncio.ensure_future(self._flush_collection(collection))
+        self._flushes.add(task)
+        task.add_done_callback(self._flushes.discard)
+    
+    async def _flush_collection(self, collection: str):
+        timer = self._timers.pop(collection, None)
+        if timer is not None:
+            timer.cancel()
+        batch = self._pending.pop(collection, [])
+        if not batch:
+            return
+        
+        operations = [operation for operation, _ in batch]
+        metrics.observe(f"bulk_writer.{collection}.batch_size", len(operations))
+        try:
+            await get_database()[collection].bulk_write(operations, ordered=False)
+            failed: Dict[int, Exception] = {}
+        except BulkWriteError as e:
+            failed = {
+                error["index"]: Exception(error.get("errmsg", "Bulk write error"))
+                for error in e.details.get("writeErrors", [])
+            }
+        except Exception as e:
+            logger.error(f"Bulk write to {collection} failed: {e}")
+            failed = {i: e for i in range(len(batch))}
+        
+        for i, (_, future) in enumerate(batch):
+            if future.done():
+                continue
+            if i in failed:
+                future.set_exception(failed[i])
+            else:
+                future.set_result(None)
+    
+    async def flush(self, collection: Optional[str] = None):
+        """Flush pending writes now (all collections by default)"""
+        collections = [collection] if collection else list(self._pending)
+        await asyncio.gather(*(self._flush_collection(c) for c in collections))
+        if self._flushes:
+            await asyncio.gather(*list(self._flushes), return_exceptions=True)
+    
+    async def close(self):
+        """Flush everything and refuse further writes (graceful shutdown)"""
+        self._closed = True
+        await self.flush()
+
+bulk_writer = BulkWriter(
+    max_batch_size=settings.BULK_WRITE_MAX_BATCH_SIZE,
+    flush_interval=settings.BULK_WRITE_FLUSH_INTERVAL_MS / 1000
+)
+
+def log_write_failure(future: asyncio.Future):
+    """Done-callback for fire-and-forget writes"""
+    if not future.cancelled() and future.exception() is not None:
+        logger.warning(f"Background write failed: {future.exception()}")
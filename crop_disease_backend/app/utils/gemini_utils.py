@@ -11,7 +11,14 @@ class GeminiAPI:
     def __init__(self):
         self.api_key = settings.GEMINI_API_KEY
         if self.api_key:
-            genai.configure(api_key=self.api_key)
+            if settings.GEMINI_API_ENDPOINT:
+                genai.configure(
+                    api_key=self.api_key,
+                    transport="rest",
+                    client_options={"api_endpoint": settings.GEMINI_API_ENDPOINT}
+                )
+            else:
+                genai.configure(api_key=self.api_key)
             self.model = genai.GenerativeModel(settings.GEMINI_MODEL)
         else:
             logger.warning("Gemini API key not configured")
@@ -110,20 +117,8 @@ Return ONLY the JSON object, no additional text."""
             response = self.model.generate_content(prompt)
             
             # Parse the response
-            response_text = response.text.strip()
-            
-            # Remove markdown code blocks if present
-            if response_text.startswith('```json'):
-                response_text = response_text[7:]
-            if response_text.startswith('```'):
-                response_text = response_text[3:]
-            if response_text.endswith('```'):
-                response_text = response_text[:-3]
-            
-            response_text = response_text.strip()
-            
-            # Parse JSON
-            advisory_data = json.loads(response_text)
+            response_text = response.text
+            advisory_data = self._parse_advisory_json(response_text)
             
             # Validate and ensure all required fields are present
             advisory_data = self._validate_advisory_structure(advisory_data, disease_name, crop_type)
@@ -139,6 +134,20 @@ Return ONLY the JSON object, no additional text."""
             logger.error(f"Error generating advisory with Gemini: {e}")
             return self._get_fallback_advisory(disease_name, crop_type)
     
+    def _parse_advisory_json(self, response_text: str) -> Dict[str, Any]:
+        """Strip markdown code fences from a model response and parse the JSON inside"""
+        response_text = response_text.strip()
+        
+        # Remove markdown code blocks if present
+        if response_text.startswith('```json'):
+            response_text = response_text[7:]
+        if response_text.startswith('```'):
+            response_text = response_text[3:]
+        if response_text.endswith('```'):
+            response_text = response_text[:-3]
+        
+        return json.loads(response_text.strip())
+    
     def _validate_advisory_structure(
         self, 
         advisory: Dict[str, Any], 
@@ -0,0 +1,72 @@
+# http_cache.py
+"""
+ETag / If-None-Match support for document endpoints.
+
+ETags are computed from document identity and version (or updated_at /
+created_at) rather than from the rendered body, so a matching request is
+answered with 304 before the document is serialized.
+"""
+import hashlib
+from typing import Any, Dict, Iterable, Optional
+from fastapi import Request, Response
+from app.utils.mongo_utils import MongoJSONResponse
+
+# Clients may keep the body but must revalidate; responses are per user
+CACHE_CONTROL = "private, no-cache"
+
+# Suffixes CompressionMiddleware appends to strong ETags of encoded responses
+ENCODING_SUFFIXES = ("-br", "-gzip")
+
+def document_version(document: Dict[str, Any]) -> str:
+    """Identity plus the best available change marker of a stored document"""
+    marker = document.get("version", document.get("updated_at", document.get("created_at", "")))
+    return f"{document.get('_id', '')}:{marker}"
+
+def compute_etag(*parts: Any) -> str:
+    """Strong ETag over arbitrary key parts"""
+    digest = hashlib.sha1("|".join(str(part) for part in parts).encode()).hexdigest()
+    return f'"{digest[:32]}"'
+
+def etag_for_documents(documents: Iterable[Dict[str, Any]], *extra: Any) -> str:
+    """ETag for a single document or an ordered list of them"""
+    return compute_etag(*extra, *(document_version(doc) for doc in documents))
+
+def _opaque_tag(tag: str) -> str:
+    tag = tag.strip()
+    if tag.startswith("W/"):
+        tag = tag[2:]
+    for suffix in ENCODING_SUFFIXES:
+        if tag.endswith(f'{suffix}"'):
+            return tag[:-len(suffix) - 1] + '"'
+    return tag
+
+def matching_tag(request: Request, etag: str) -> Optional[str]:
+    """
+    The If-None-Match entry that matches etag (weak comparison, as RFC 9110
+    requires), with or without an encoding suffix; None if there is none.
+    """
+    header = request.headers.get("if-none-match")
+    if not header:
+        return None
+    if header.strip() == "*":
+        return etag
+    for tag in header.split(","):
+        if _opaque_tag(tag) == etag:
+            tag = tag.strip()
+            return tag[2:] if tag.startswith("W/") else tag
+    return None
+
+def is_not_modified(request: Request, etag: str) -> bool:
+    """Whether the request's If-None-Match matches etag"""
+    return matching_tag(request, etag) is not None
+
+def cached_response(request: Request, etag: str, content: Any,
+                    headers: Optional[Dict[str, str]] = None) -> Response:
+    """304 if the client already has this version, otherwise the rendered documents with their ETag"""
+    cache_headers = {"ETag": etag, "Cache-Control": CACHE_CONTROL, **(headers or {})}
+    held = matching_tag(request, etag)
+    if held is not None:
+        # Repeat the validator the client holds ("<etag>-br" for a compressed
+        # body); 304s carry no body, so CompressionMiddleware leaves them alone
+        return Response(status_code=304, headers={**cache_headers, "ETag": held})
+    return MongoJSONResponse(content, headers=cache_headers)
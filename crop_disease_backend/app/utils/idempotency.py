@@ -0,0 +1,135 @@
+# idempotency.py
+"""
+Idempotency-Key support for endpoints that call paid external APIs.
+
+The first request with a key claims it in the `idempotency_keys` collection
+(TTL-indexed on created_at, IDEMPOTENCY_KEY_TTL_HOURS) together with a
+fingerprint of the request. A retry with the same key and fingerprint
+
+- waits for the result while the first request is still running, and
+- replays the stored response once it has finished,
+
+so Kindwise / Gemini are called and diagnoses inserted once per key. A key
+reused for a different request is rejected. Failed requests release the key
+so the client can retry them; a claim whose request died (no result after
+IDEMPOTENCY_LOCK_SECONDS) is taken over by the next retry.
+"""
+import asyncio
+import hashlib
+from datetime import datetime, timedelta
+from typing import Any, Awaitable, Callable, Optional, Tuple
+from fastapi import HTTPException, UploadFile
+from pymongo.errors import DuplicateKeyError
+from app.config import settings
+from app.database import get_database, is_database_connected
+import logging
+
+logger = logging.getLogger(__name__)
+
+MAX_KEY_LENGTH = 255
+REPLAY_HEADER = "Idempotent-Replayed"
+
+def request_fingerprint(*parts: Any) -> str:
+    """Digest of everything that makes two requests the same request"""
+    digest = hashlib.sha256()
+    for part in parts:
+        digest.update(repr(part).encode())
+        digest.update(b"\0")
+    return digest.hexdigest()
+
+async def upload_digest(file: UploadFile) -> str:
+    """SHA-256 of an upload's contents; the file is rewound for the handler"""
+    digest = hashlib.sha256()
+    while chunk := await file.read(1024 * 1024):
+        digest.update(chunk)
+    await file.seek(0)
+    return digest.hexdigest()
+
+def replay_headers(replayed: bool) -> dict:
+    return {REPLAY_HEADER: "true"} if replayed else {}
+
+async def _claim(db, record_id: str, fingerprint: str) -> Tuple[Optional[datetime], Optional[dict]]:
+    """
+    Claim the key. Returns (started_at, None) if claimed, where started_at
+    identifies this claim in later writes, else (None, existing record).
+    """
+    now = datetime.utcnow()
+    # MongoDB keeps milliseconds; match the stored value exactly in later filters
+    now = now.replace(microsecond=now.microsecond // 1000 * 1000)
+    try:
+        await db.idempotency_keys.insert_one({
+            "_id": record_id,
+            "fingerprint": fingerprint,
+            "state": "processing",
+            "started_at": now,
+            "created_at": now
+        })
+        return now, None
+    except DuplicateKeyError:
+        pass
+    existing = await db.idempotency_keys.find_one({"_id": record_id})
+    if existing is None:
+        # Released in the meantime; try again
+        return await _claim(db, record_id, fingerprint)
+    if existing["fingerprint"] != fingerprint:
+        raise HTTPException(status_code=422, detail="Idempotency-Key was already used for a different request")
+    if existing["state"] == "processing" and \
+            existing["started_at"] < now - timedelta(seconds=settings.IDEMPOTENCY_LOCK_SECONDS):
+        # The request holding the key never finished; take it over
+        result = await db.idempotency_keys.update_one(
+            {"_id": record_id, "state": "processing", "started_at": existing["started_at"]},
+            {"$set": {"started_at": now}}
+        )
+        if result.modified_count:
+            logger.warning(f"Took over stale idempotency key {record_id}")
+            return now, None
+    return None, existing
+
+async def idempotent(scope: str, key: Optional[str], user_id: str, fingerprint: str,
+                     handler: Callable[[], Awaitable[Any]]) -> Tuple[Any, bool]:
+    """
+    Run `handler` at most once per (scope, user, key). Returns its result and
+    whether the result was replayed from an earlier request.
+    """
+    if key is None or not is_database_connected():
+        return await handler(), False
+    if not key or len(key) > MAX_KEY_LENGTH:
+        raise HTTPException(status_code=400, detail=f"Idempotency-Key must be 1 to {MAX_KEY_LENGTH} characters")
+
+    db = get_database()
+    record_id = f"{scope}:{user_id}:{key}"
+    deadline = asyncio.get_running_loop().time() + settings.IDEMPOTENCY_WAIT_SECONDS
+    delay = 0.05
+    while True:
+        claimed_at, existing = await _claim(db, record_id, fingerprint)
+        if existing is None:
+            break
+        if existing["state"] == "completed":
+            logger.info(f"Replaying response for idempotency key {record_id}")
+            return existing["response"], True
+        # Still running elsewhere: wait for its result
+        if asyncio.get_running_loop().time() >= deadline:
+            raise HTTPException(status_code=409, detail="A request with this Idempotency-Key is still being processed")
+        await asyncio.sleep(delay)
+        delay = min(delay * 2, 1.0)
+
+    # Writes below only touch our own claim, not one that took over a key we held too long
+    claim = {"_id": record_id, "state": "processing", "started_at": claimed_at}
+    try:
+        result = await handler()
+    except BaseException:
+        # Nothing was produced; let a retry run the request again
+        await db.idempotency_keys.delete_one(claim)
+        raise
+    try:
+        stored = await db.idempotency_keys.update_one(
+            claim,
+            {"$set": {"state": "completed", "response": result, "completed_at": datetime.utcnow()}}
+        )
+        if not stored.matched_count:
+            logger.warning(f"Idempotency key {record_id} was taken over before this request finished")
+    except Exception as e:
+        # The result still goes to this client; retries will run the request again
+        logger.error(f"Failed to store response for idempotency key {record_id}: {e}")
+        await db.idempotency_keys.delete_one(claim)
+    return result, False
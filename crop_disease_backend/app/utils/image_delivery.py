@@ -0,0 +1,148 @@
+# image_delivery.py
+"""
+Signed, cacheable image URLs and on-demand derivatives.
+
+Images are addressed by a storage key (see app.utils.storage) and a variant:
+the original upload or a WebP "thumb" / "preview" scaled down to a bounded
+size. URLs carry an expiry and an HMAC signature so <img> tags work without
+an Authorization header while storage locations stay private.
+
+Expiries are rounded up to whole IMAGE_URL_TTL_SECONDS windows: every
+response in the same window hands out the same URL, so browsers and CDNs can
+keep reusing their cached copy. Derivatives are stored next to the originals
+under derivatives/<variant>/ in the same ImageStore.
+"""
+import hashlib
+import hmac
+import io
+import os
+import re
+import time
+from typing import Any, Dict, List, Optional
+from urllib.parse import urlencode
+from PIL import Image, ImageOps
+from app.config import settings
+from app.utils.image_storage import IMMUTABLE_CACHE_CONTROL, run_in_image_executor
+from app.utils.storage import get_image_store
+
+ORIGINAL = "original"
+# Longest edge in pixels per derivative
+VARIANT_SIZES = {
+    "thumb": settings.IMAGE_THUMBNAIL_SIZE,
+    "preview": settings.IMAGE_PREVIEW_SIZE
+}
+
+# Derivatives of "ab/cd/x.jpg" live at "derivatives/<variant>/ab/cd/x.webp"
+DERIVATIVES_PREFIX = "derivatives/"
+
+# Keys are generated server-side: path segments of safe characters, no "..", one extension
+_KEY_PATTERN = re.compile(r"^(?:[A-Za-z0-9_-]+/)*[A-Za-z0-9_-]+\.[A-Za-z0-9]+$")
+
+# Separate the URL-signing key from the JWT key even though both derive from SECRET_KEY
+_SIGNING_KEY = hashlib.sha256(b"image-url:" + settings.SECRET_KEY.encode()).digest()
+
+def is_valid_key(key: str) -> bool:
+    return bool(_KEY_PATTERN.match(key))
+
+def image_key(document: Dict[str, Any]) -> Optional[str]:
+    """Storage key of a diagnosis image (older documents only record the file name)"""
+    if document.get("image_key"):
+        return document["image_key"]
+    source = document.get("image_path") or document.get("image_url")
+    return os.path.basename(source) if source else None
+
+def diagnosis_image_keys(document: Dict[str, Any]) -> List[str]:
+    """All images of a diagnosis; multi-photo diagnoses list them in image_keys"""
+    if document.get("image_keys"):
+        return document["image_keys"]
+    key = image_key(document)
+    return [key] if key else []
+
+def url_expiry(now: Optional[float] = None) -> int:
+    """Expiry shared by all URLs issued in the current window (valid for one to two windows)"""
+    window = settings.IMAGE_URL_TTL_SECONDS
+    now = time.time() if now is None else now
+    return (int(now) // window + 2) * window
+
+def sign_image(key: str, variant: str, expires: int) -> str:
+    message = f"{key}\n{variant}\n{expires}".encode()
+    return hmac.new(_SIGNING_KEY, message, hashlib.sha256).hexdigest()[:32]
+
+def verify_image_signature(key: str, variant: str, expires: int, signature: str) -> bool:
+    """Signature is genuine and not yet expired"""
+    if expires < time.time():
+        return False
+    return hmac.compare_digest(sign_image(key, variant, expires), signature)
+
+def signed_image_url(key: str, variant: str = ORIGINAL, expires: Optional[int] = None) -> str:
+    expires = expires or url_expiry()
+    query = urlencode({"exp": expires, "sig": sign_image(key, variant, expires)})
+    return f"/images/{variant}/{key}?{query}"
+
+def add_image_urls(document: Dict[str, Any], expires: Optional[int] = None) -> Dict[str, Any]:
+    """
+    Replace the stored image path with signed original, thumbnail and preview
+    URLs (in place); multi-photo diagnoses also get one entry per photo in `images`.
+    """
+    key = image_key(document)
+    if not key:
+        return document
+    expires = expires or url_expiry()
+    document["image_url"] = signed_image_url(key, ORIGINAL, expires)
+    document["thumbnail_url"] = signed_image_url(key, "thumb", expires)
+    document["preview_url"] = signed_image_url(key, "preview", expires)
+    if document.get("image_keys"):
+        document["images"] = [
+            {
+                "image_url": signed_image_url(k, ORIGINAL, expires),
+                "thumbnail_url": signed_image_url(k, "thumb", expires),
+                "preview_url": signed_image_url(k, "preview", expires)
+            }
+            for k in document["image_keys"]
+        ]
+    return document
+
+def derivative_key(key: str, variant: str) -> str:
+    """Store key of a cached derivative; cannot collide with sharded or legacy original keys"""
+    stem, _ = os.path.splitext(key)
+    return f"{DERIVATIVES_PREFIX}{variant}/{stem}.webp"
+
+def render_derivative(data: bytes, max_size: int, quality: int) -> bytes:
+    """WebP copy of an image bounded to max_size on its longest edge. Blocking."""
+    with Image.open(io.BytesIO(data)) as image:
+        image.draft("RGB", (max_size, max_size))
+        # Honour phone camera rotation; thumbnails are shown without the EXIF data
+        image = ImageOps.exif_transpose(image)
+        if image.mode not in ("RGB", "RGBA"):
+            image = image.convert("RGBA" if "A" in image.getbands() else "RGB")
+        image.thumbnail((max_size, max_size), Image.Resampling.LANCZOS)
+        buffer = io.BytesIO()
+        image.save(buffer, format="WEBP", quality=quality, method=4)
+    return buffer.getvalue()
+
+async def resolve_image(key: str, variant: str) -> Optional[str]:
+    """
+    Store key of the requested variant, rendering and storing it on first use.
+    Returns None if the original is gone.
+    """
+    store = get_image_store()
+    if variant == ORIGINAL:
+        return key if await store.exists(key) else None
+    target = derivative_key(key, variant)
+    if await store.exists(target):
+        return target
+    source = await store.get(key)
+    if source is None:
+        return None
+    # Concurrent first requests may render the same derivative; the result is identical
+    rendered = await run_in_image_executor(
+        render_derivative, source, VARIANT_SIZES[variant], settings.IMAGE_DERIVATIVE_QUALITY
+    )
+    await store.put(target, rendered, content_type="image/webp", cache_control=IMMUTABLE_CACHE_CONTROL)
+    return target
+
+async def delete_derivatives(key: str) -> None:
+    """Remove cached derivatives of an image that is being deleted"""
+    store = get_image_store()
+    for variant in VARIANT_SIZES:
+        await store.delete(derivative_key(key, variant))
@@ -0,0 +1,310 @@
+# image_storage.py
+"""
+Content-addressed storage for uploaded images.
+
+Uploads are optionally transcoded to a size-bounded WebP or JPEG, then written
+to the configured ImageStore under a key sharded by the SHA-256 of the upload
+(ab/cd/abcd....webp), so no directory or prefix grows beyond a few hundred
+entries. Identical uploads share one object. The `images` collection is the
+manifest: one document per stored key with sizes, dimensions and a reference
+count of the diagnoses using it. An unreferenced image's entry is marked while
+its object is deleted; an upload of the same content meanwhile waits for the
+delete and writes the object again.
+
+Decoding and encoding run on a dedicated thread pool so they neither block the
+event loop nor compete with the default executor.
+"""
+import asyncio
+import hashlib
+import io
+import logging
+import os
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime, timedelta
+from typing import Any, Callable, Dict, List, Optional, Tuple
+from fastapi import HTTPException, UploadFile
+from PIL import Image, ImageOps
+from pydantic import BaseModel
+from pymongo import ReturnDocument, UpdateOne
+from pymongo.errors import DuplicateKeyError
+from app.config import settings
+from app.database import get_database
+from app.utils.image_utils import validate_image
+from app.utils.storage import get_image_store
+
+logger = logging.getLogger(__name__)
+
+image_executor = ThreadPoolExecutor(max_workers=settings.IMAGE_WORKERS, thread_name_prefix="image")
+
+# IMAGE_STORE_FORMAT -> (PIL format, extension)
+STORE_FORMATS = {
+    "webp": ("WEBP", ".webp"),
+    "jpeg": ("JPEG", ".jpg")
+}
+
+# Encoder effort: WebP method 1 is ~3x faster than the default 4 for ~5% larger files;
+# optimized Huffman tables shrink JPEGs ~10% for a few milliseconds
+ENCODER_OPTIONS = {
+    "WEBP": {"method": 1},
+    "JPEG": {"optimize": True}
+}
+
+MEDIA_TYPES = {
+    "JPEG": "image/jpeg",
+    "PNG": "image/png",
+    "WEBP": "image/webp"
+}
+
+# Keys are content hashes, so stored objects never change
+IMMUTABLE_CACHE_CONTROL = "private, max-age=31536000, immutable"
+
+# A manifest entry marked for deletion longer ago than this belongs to a process that died
+DELETE_MARK_SECONDS = 30
+
+class StoredImage(BaseModel):
+    """Result of storing an upload"""
+    key: str
+    size: int
+    original_size: int
+    width: int
+    height: int
+    format: str
+    deduplicated: bool = False
+
+async def run_in_image_executor(func: Callable, *args) -> Any:
+    """Run CPU-bound image work on the image thread pool"""
+    return await asyncio.get_running_loop().run_in_executor(image_executor, func, *args)
+
+def shard_key(digest: str, extension: str) -> str:
+    """Two levels of 256-way fan-out keep directories small at millions of files"""
+    return f"{digest[:2]}/{digest[2:4]}/{digest}{extension}"
+
+def transcode(data: bytes, store_format: str, max_dimension: int, quality: int) -> Tuple[bytes, str, int, int]:
+    """
+    Re-encode an upload, bounded to max_dimension on its longest edge.
+    Returns (bytes, PIL format, width, height); the original bytes are kept
+    when they are already small enough and re-encoding would not shrink them.
+    """
+    pil_format, _ = STORE_FORMATS[store_format]
+    with Image.open(io.BytesIO(data)) as image:
+        source_format = image.format
+        # Let the JPEG decoder skip detail we are about to throw away
+        image.draft("RGB", (max_dimension, max_dimension))
+        ImageOps.exif_transpose(image, in_place=True)
+        needs_resize = max(image.size) > max_dimension
+        if needs_resize:
+            # Pillow's bicubic downscale is antialiased and ~35% cheaper than Lanczos on 12 MP photos
+            image.thumbnail((max_dimension, max_dimension), Image.Resampling.BICUBIC)
+        keep_alpha = pil_format == "WEBP" and "A" in image.getbands()
+        if image.mode not in ("RGB", "RGBA") or (image.mode == "RGBA" and not keep_alpha):
+            image = image.convert("RGBA" if keep_alpha else "RGB")
+        buffer = io.BytesIO()
+        image.save(buffer, format=pil_format, quality=quality, **ENCODER_OPTIONS[pil_format])
+        width, height = image.size
+
+    encoded = buffer.getvalue()
+    if not needs_resize and len(encoded) >= len(data) and source_format == pil_format:
+        return data, source_format, width, height
+    return encoded, pil_format, width, height
+
+def prepare_image(data: bytes, original_extension: str) -> Tuple[StoredImage, bytes]:
+    """Transcode (if configured) and derive the storage key of an upload. Blocking."""
+    digest = hashlib.sha256(data).hexdigest()
+    store_format = settings.IMAGE_STORE_FORMAT
+    if store_format in STORE_FORMATS:
+        try:
+            stored, pil_format, width, height = transcode(
+                data, store_format, settings.IMAGE_MAX_DIMENSION, settings.IMAGE_QUALITY
+            )
+        except Exception as e:
+            raise HTTPException(status_code=400, detail=f"Error processing image: {str(e)}")
+        extension = STORE_FORMATS[store_format][1] if pil_format == STORE_FORMATS[store_format][0] else original_extension
+    else:
+        try:
+            with Image.open(io.BytesIO(data)) as image:
+                width, height = image.size
+                pil_format = image.format
+        except Exception as e:
+            raise HTTPException(status_code=400, detail=f"Error processing image: {str(e)}")
+        stored, extension = data, original_extension
+
+    info = StoredImage(
+        key=shard_key(digest, extension),
+        size=len(stored),
+        original_size=len(data),
+        width=width,
+        height=height,
+        format=pil_format
+    )
+    return info, stored
+
+async def store_image(file: UploadFile, user_id: Optional[str] = None) -> Tuple[StoredImage, bytes]:
+    """Validate, store and register an uploaded image; returns its record and the stored bytes"""
+    validate_image(file)
+    assert file.filename is not None  # Type guard for mypy
+    contents = await file.read()
+    extension = os.path.splitext(file.filename)[1].lower()
+    stored, data = await run_in_image_executor(prepare_image, contents, extension)
+
+    # Take the manifest reference before writing so the orphan collector
+    # (app.utils.retention) never sees a fresh object without one
+    already_registered = False
+    try:
+        db = get_database()
+        now = datetime.utcnow()
+        previous = await db.images.find_one_and_update(
+            {"_id": stored.key},
+            {
+                "$setOnInsert": {
+                    "size": stored.size,
+                    "original_size": stored.original_size,
+                    "width": stored.width,
+                    "height": stored.height,
+                    "format": stored.format,
+                    "uploaded_by": user_id,
+                    "created_at": now
+                },
+                "$set": {"last_referenced_at": now},
+                "$inc": {"ref_count": 1}
+            },
+            projection={"deleting_at": 1},
+            upsert=True
+        )
+        already_registered = previous is not None
+        if previous is not None and "deleting_at" in previous:
+            # The last reference was just released and the object is being deleted; write it again after that
+            await wait_for_delete(stored.key, previous["deleting_at"])
+            already_registered = False
+    except Exception as e:
+        # The file is usable without its manifest entry; the collector reconciles later
+        logger.warning(f"Failed to record image {stored.key} in manifest: {e}")
+
+    store = get_image_store()
+    stored.deduplicated = already_registered and await store.exists(stored.key)
+    if not stored.deduplicated:
+        await store.put(
+            stored.key, data,
+            content_type=MEDIA_TYPES.get(stored.format, "application/octet-stream"),
+            cache_control=IMMUTABLE_CACHE_CONTROL
+        )
+
+    logger.info(
+        f"Stored image {stored.key}: {stored.original_size} -> {stored.size} bytes"
+        f"{' (duplicate)' if stored.deduplicated else ''}"
+    )
+    return stored, data
+
+async def store_images(files: List[UploadFile], user_id: Optional[str] = None) -> List[Tuple[StoredImage, bytes]]:
+    """
+    Store several uploads concurrently, all or nothing. A photo repeated in
+    the same request is kept once, holding a single reference.
+    """
+    results = await asyncio.gather(*(store_image(f, user_id) for f in files), return_exceptions=True)
+    stored = [r for r in results if not isinstance(r, BaseException)]
+    failure = next((r for r in results if isinstance(r, BaseException)), None)
+    duplicates = []
+    unique: Dict[str, Tuple[StoredImage, bytes]] = {}
+    for info, data in stored:
+        if info.key in unique or failure is not None:
+            duplicates.append(info.key)
+        else:
+            unique[info.key] = (info, data)
+    for key in duplicates:
+        try:
+            await release_image(key)
+        except Exception as e:
+            logger.warning(f"Failed to release image {key}: {e}")
+    if failure is not None:
+        raise failure
+    return list(unique.values())
+
+async def wait_for_delete(key: str, marked_at: datetime):
+    """Wait until the delete that marked the manifest entry at `marked_at` has finished"""
+    db = get_database()
+    deadline = marked_at + timedelta(seconds=DELETE_MARK_SECONDS)
+    delay = 0.02
+    while datetime.utcnow() < deadline:
+        if await db.images.find_one({"_id": key, "deleting_at": marked_at}, {"_id": 1}) is None:
+            return
+        await asyncio.sleep(delay)
+        delay = min(delay * 2, 0.5)
+    logger.warning(f"Delete of image {key} marked at {marked_at} never finished; storing it again")
+
+async def delete_unreferenced(key: str, guard: Optional[Dict[str, Any]] = None) -> bool:
+    """
+    Delete an image nothing references: the object, then its manifest entry.
+    `guard` is the entry state that counts as unreferenced (default
+    ref_count <= 0). The entry is marked while the object is deleted, so a
+    store_image of the same content waits and writes the object again instead
+    of registering an object about to disappear. Returns True if the object
+    was deleted.
+    """
+    db = get_database()
+    now = datetime.utcnow()
+    # MongoDB keeps milliseconds; match the stored value exactly in later filters
+    now = now.replace(microsecond=now.microsecond // 1000 * 1000)
+    unmarked = {"$or": [
+        {"deleting_at": {"$exists": False}},
+        {"deleting_at": {"$lt": now - timedelta(seconds=DELETE_MARK_SECONDS)}}
+    ]}
+    try:
+        # Images stored before the manifest existed have no entry; a marked placeholder stands in for it
+        entry = await db.images.find_one_and_update(
+            {"_id": key, "$and": [guard or {"ref_count": {"$lte": 0}}, unmarked]},
+            {"$set": {"deleting_at": now}, "$setOnInsert": {"ref_count": 0}},
+            projection={"ref_count": 1},
+            upsert=guard is None,
+            return_document=ReturnDocument.AFTER
+        )
+    except DuplicateKeyError:
+        # Referenced again, or another caller is deleting it
+        return False
+    if entry is None:
+        return False
+
+    mark = {"_id": key, "deleting_at": now}
+    try:
+        await get_image_store().delete(key)
+    finally:
+        # A store_image that took a reference meanwhile changed ref_count; it keeps the entry
+        removed = await db.images.delete_one({**mark, "ref_count": entry.get("ref_count", 0)})
+        if removed.deleted_count == 0:
+            await db.images.update_one(mark, {"$unset": {"deleting_at": ""}})
+    return True
+
+async def release_image(key: str) -> bool:
+    """
+    Drop one reference to a stored image; the object and manifest entry are
+    removed with the last reference. Returns True if the object was deleted.
+    """
+    db = get_database()
+    entry = await db.images.find_one_and_update(
+        {"_id": key},
+        {"$inc": {"ref_count": -1}},
+        return_document=ReturnDocument.AFTER
+    )
+    if entry is not None and entry.get("ref_count", 0) > 0:
+        return False
+    return await delete_unreferenced(key)
+
+async def release_images(references: Dict[str, int]) -> List[str]:
+    """
+    Drop many references (key -> count) in one bulk write. Returns the keys
+    left without references; remove them with purge_images.
+    """
+    if not references:
+        return []
+    db = get_database()
+    await db.images.bulk_write(
+        [UpdateOne({"_id": key}, {"$inc": {"ref_count": -count}}) for key, count in references.items()],
+        ordered=False
+    )
+    entries = await db.images.find({"_id": {"$in": list(references)}}, {"ref_count": 1}).to_list(length=None)
+    remaining = {entry["_id"]: entry.get("ref_count", 0) for entry in entries}
+    # Keys without a manifest entry predate it and belonged to one diagnosis only
+    return [key for key in references if remaining.get(key, 0) <= 0]
+
+async def purge_images(keys: List[str]) -> List[str]:
+    """Delete unreferenced images found by release_images; returns the keys actually removed"""
+    # Keys referenced again in the meantime are skipped
+    return [key for key in keys if await delete_unreferenced(key)]
@@ -1,11 +1,14 @@
 # image_utils.py
 import os
-import uuid
-from typing import Tuple
+from typing import IO, Tuple, Union
 from PIL import Image
 from fastapi import HTTPException, UploadFile
 from app.config import settings
 
+# A relative UPLOAD_DIR is taken from the backend package, regardless of the working directory
+BACKEND_DIR = os.path.abspath(os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", ".."))
+IMAGES_DIR = os.path.join(BACKEND_DIR, settings.UPLOAD_DIR)
+
 def validate_image(file: UploadFile) -> None:
     """Validate uploaded image file"""
     # Check file extension
@@ -33,31 +36,7 @@ def validate_image(file: UploadFile) -> None:
             detail=f"File size too large. Maximum size: {settings.MAX_FILE_SIZE / 1024 / 1024}MB"
         )
 
-async def save_image(file: UploadFile) -> Tuple[str, str]:
-    """Save uploaded image and return file path and URL"""
-    validate_image(file)
-    
-    # Always use the backend's uploads/images directory (absolute path)
-    backend_dir = os.path.dirname(os.path.abspath(__file__))
-    uploads_dir = os.path.join(backend_dir, "..", "..", "uploads", "images")
-    os.makedirs(uploads_dir, exist_ok=True)
-    # Generate unique filename
-    assert file.filename is not None  # Type guard for mypy
-    file_extension = os.path.splitext(file.filename)[1].lower()
-    unique_filename = f"{uuid.uuid4()}{file_extension}"
-    file_path = os.path.join(uploads_dir, unique_filename)
-    
-    # Save file
-    contents = await file.read()
-    with open(file_path, "wb") as f:
-        f.write(contents)
-    
-    # Create URL (adjust based on your server setup)
-    file_url = f"/uploads/images/{unique_filename}"
-    
-    return file_path, file_url
-
-def preprocess_image(image_path: str, target_size: Tuple[int, int] = (224, 224)) -> Image.Image:
+def preprocess_image(image_path: Union[str, IO[bytes]], target_size: Tuple[int, int] = (224, 224)) -> Image.Image:
     """Preprocess image for ML model"""
     try:
         image = Image.open(image_path)
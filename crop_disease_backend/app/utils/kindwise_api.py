@@ -1,8 +1,9 @@
 # kindwise_api.py
 import requests
 import base64
+import hashlib
 import json
-from typing import Dict, Any, Optional, Tuple
+from typing import Dict, Any, List, Optional, Sequence, Tuple, Union
 from PIL import Image
 import io
 import logging
@@ -13,12 +14,16 @@ logger = logging.getLogger(__name__)
 class KindwiseAPI:
     def __init__(self):
         self.api_key = settings.KINDWISE_API_KEY
-        self.base_url = "https://crop.kindwise.com/api/v1"
+        self.base_url = settings.KINDWISE_API_URL.rstrip("/")
         self.headers = {
             "Api-Key": self.api_key,
             "Content-Type": "application/json"
         }
     
+    @property
+    def is_configured(self) -> bool:
+        return bool(self.api_key) and self.api_key != "your-kindwise-api-key-here"
+    
     def encode_image(self, image: Image.Image) -> str:
         """Convert PIL image to base64 string"""
         try:
@@ -42,21 +47,34 @@ class KindwiseAPI:
             logger.error(f"Error encoding image: {e}")
             raise
     
-    def predict_disease(self, image: Image.Image, crop_type: Optional[str] = None) -> Tuple[str, float, Dict[str, Any]]:
+    def predict_disease(self, image: Union[Image.Image, Sequence[Image.Image]],
+                        crop_type: Optional[str] = None) -> Tuple[str, float, Dict[str, Any]]:
         """Predict disease using Kindwise API or return mock data if API key not available"""
+        images = [image] if isinstance(image, Image.Image) else list(image)
+        if not self.is_configured:
+            return self.identify([], crop_type)
+        return self.identify([self.encode_image(i) for i in images], crop_type)
+    
+    def identify(self, encoded_images: List[str], crop_type: Optional[str] = None,
+                 fallback: bool = True, timeout: float = 30) -> Tuple[str, float, Dict[str, Any]]:
+        """
+        One identification request for several base64 photos of the same plant
+        (see encode_image); Kindwise returns a single aggregated result.
+        Without `fallback`, failures raise instead of returning mock data.
+        `timeout` bounds the connection and each read, in seconds.
+        """
         
         # If no API key is provided, return mock data for testing
-        if not self.api_key or self.api_key == "your-kindwise-api-key-here":
+        if not self.is_configured:
+            if not fallback:
+                raise RuntimeError("Kindwise API key not configured")
             logger.warning("Using mock data - Kindwise API key not configured")
-            return self._get_mock_prediction(crop_type)
+            return self._get_mock_prediction(crop_type, encoded_images)
         
         try:
-            # Encode image
-            image_base64 = self.encode_image(image)
-            
             # Prepare request payload
             payload = {
-                "images": [image_base64],
+                "images": encoded_images,
                 "similar_images": True
             }
             
@@ -65,7 +83,7 @@ class KindwiseAPI:
                 f"{self.base_url}/identification",
                 headers=self.headers,
                 json=payload,
-                timeout=30
+                timeout=timeout
             )
             
             if response.status_code not in (200, 201):
@@ -76,17 +94,12 @@ class KindwiseAPI:
             result = response.json()
             
             # Parse the response
-            if not result.get("result") or not result["result"].get("disease"):
-                logger.warning("No disease results found, using mock data")
-                return self._get_mock_prediction(crop_type)
+            if not result.get("result") or not result["result"].get("disease") \
+                    or not result["result"]["disease"].get("suggestions"):
+                raise ValueError("Kindwise returned no disease suggestions")
             
             classification = result["result"]["disease"]
             
-            # Get the best match
-            if not classification.get("suggestions"):
-                logger.warning("No disease suggestions found, using mock data")
-                return self._get_mock_prediction(crop_type)
-            
             suggestions = classification["suggestions"]
             best_match = max(suggestions, key=lambda s: s.get("probability", 0.0))
             disease_name = best_match.get("name", "Unknown Disease")
@@ -105,45 +118,22 @@ class KindwiseAPI:
             
         except requests.exceptions.RequestException as e:
             logger.error(f"Network error during Kindwise API call: {e}")
-            return self._get_mock_prediction(crop_type)
+            if not fallback:
+                raise
+            return self._get_mock_prediction(crop_type, encoded_images)
         except Exception as e:
             logger.error(f"Error in disease prediction: {e}")
-            return self._get_mock_prediction(crop_type)
+            if not fallback:
+                raise
+            return self._get_mock_prediction(crop_type, encoded_images)
     
-    def _get_mock_prediction(self, crop_type: Optional[str] = None) -> Tuple[str, float, Dict[str, Any]]:
-        """Return mock prediction data for testing purposes"""
-        import random
-        
-        # Mock diseases based on crop type
-        crop_diseases = {
-            "tomato": ["Early_Blight", "Late_Blight", "Bacterial_Spot", "Leaf_Mold"],
-            "potato": ["Early_Blight", "Late_Blight", "Common_Scab", "Black_Scurf"],
-            "pepper": ["Bacterial_Spot", "Anthracnose", "Phytophthora_Blight"],
-            "corn": ["Northern_Corn_Leaf_Blight", "Gray_Leaf_Spot", "Common_Rust"],
-            "wheat": ["Stripe_Rust", "Leaf_Rust", "Powdery_Mildew"],
-            "rice": ["Blast", "Brown_Spot", "Bacterial_Leaf_Blight"],
-        }
-        
-        # Default diseases if crop type not found
-        default_diseases = ["Early_Blight", "Bacterial_Spot", "Leaf_Spot", "Powdery_Mildew"]
-        
-        diseases = crop_diseases.get(crop_type or "unknown", default_diseases)
-        disease_name = random.choice(diseases)
-        confidence = random.uniform(0.75, 0.95)  # High confidence for demo
-        
-        disease_info = {
-            "disease_name": disease_name,
-            "confidence": confidence,
-            "similar_images": [],
-            "plant_details": {
-                "common_names": [crop_type] if crop_type else ["Unknown Plant"],
-                "description": f"Mock analysis for {crop_type or 'unknown crop'}"
-            },
-            "mock_data": True,
-            "note": "This is mock data for demonstration. Configure KINDWISE_API_KEY for real predictions."
-        }
+    def _get_mock_prediction(self, crop_type: Optional[str] = None,
+                             encoded_images: Sequence[str] = ()) -> Tuple[str, float, Dict[str, Any]]:
+        """Deterministic mock prediction for testing purposes (same photos, same answer)"""
+        from app.utils.detection import fixture_prediction
         
-        return disease_name, confidence, disease_info
+        digest = hashlib.sha256("".join(encoded_images).encode()).hexdigest()
+        return fixture_prediction(digest, crop_type)
     
     def get_disease_details(self, disease_name: str) -> Dict[str, Any]:
         """Get detailed information about a specific disease"""
@@ -0,0 +1,362 @@
+# local_classifier.py
+"""
+CPU-only disease classifier: a fast first pass and an offline fallback.
+
+Photos are reduced to colour and texture histograms (joint hue/saturation,
+value, gradient magnitude; square-rooted so dot products compare them like
+the Hellinger distance) and classified against labelled examples from our
+own diagnoses by distance-weighted k nearest neighbours, or by nearest class
+centroid (LOCAL_CLASSIFIER_METHOD). Only NumPy and Pillow are needed; a
+model is one .npz file, loaded once per worker, and one classification
+takes a few milliseconds.
+
+Concurrent requests are classified together, the way app.utils.bulk_writer
+batches writes: feature vectors queue for up to
+LOCAL_CLASSIFIER_BATCH_WINDOW_MS (or LOCAL_CLASSIFIER_MAX_BATCH vectors) and
+are scored with one matrix product.
+
+Train from diagnoses labelled by a remote provider with:
+    python -m app.utils.local_classifier --output models/local_classifier.npz
+"""
+import argparse
+import asyncio
+import io
+import json
+import logging
+import os
+import sys
+from datetime import datetime
+from typing import Any, Dict, List, Optional, Tuple
+import numpy as np
+from PIL import Image
+from app.config import settings
+from app.utils.detection import DetectionProvider
+from app.utils.image_storage import run_in_image_executor
+from app.utils.metrics import metrics
+
+logger = logging.getLogger(__name__)
+
+# Bumped whenever extract_features changes; models of another version are refused
+FEATURE_VERSION = 1
+FEATURE_SIZE = 96
+HUE_BINS, SATURATION_BINS, VALUE_BINS, GRADIENT_BINS = 18, 4, 8, 8
+GRADIENT_RANGE = 64.0
+# Softmax temperature turning centroid similarities into confidences
+CENTROID_TEMPERATURE = 0.02
+CANDIDATES = 3
+
+# (disease name, confidence, [(candidate, score), ...])
+Classification = Tuple[str, float, List[Tuple[str, float]]]
+
+def extract_features(data: bytes) -> np.ndarray:
+    """Unit-length colour / texture histogram of an encoded photo. Blocking."""
+    with Image.open(io.BytesIO(data)) as image:
+        # JPEGs decode straight at a reduced scale
+        image.draft("RGB", (FEATURE_SIZE * 2, FEATURE_SIZE * 2))
+        image = image.convert("RGB")
+        image.thumbnail((FEATURE_SIZE, FEATURE_SIZE))
+        hsv = np.asarray(image.convert("HSV"), dtype=np.int32)
+        gray = np.asarray(image.convert("L"), dtype=np.float32)
+
+    hue = hsv[..., 0] * HUE_BINS >> 8
+    saturation = hsv[..., 1] * SATURATION_BINS >> 8
+    hue_saturation = np.bincount((hue * SATURATION_BINS + saturation).ravel(),
+                                 minlength=HUE_BINS * SATURATION_BINS)
+    value = np.bincount((hsv[..., 2] * VALUE_BINS >> 8).ravel(), minlength=VALUE_BINS)
+    gradient_y, gradient_x = np.gradient(gray)
+    magnitude = np.minimum(np.hypot(gradient_x, gradient_y), GRADIENT_RANGE - 1e-3)
+    gradient = np.histogram(magnitude, bins=GRADIENT_BINS, range=(0.0, GRADIENT_RANGE))[0]
+
+    parts = [np.sqrt(part / max(part.sum(), 1)) for part in (hue_saturation, value, gradient)]
+    vector = np.concatenate(parts).astype(np.float32)
+    return vector / max(float(np.linalg.norm(vector)), 1e-12)
+
+class LocalModel:
+    """Labelled feature vectors plus per-class centroids"""
+    def __init__(self, features: np.ndarray, labels: np.ndarray, classes: List[str], crops: np.ndarray,
+                 meta: Optional[Dict[str, Any]] = None):
+        self.features = features.astype(np.float32)
+        self.labels = labels.astype(np.int32)
+        self.classes = list(classes)
+        self.crops = crops
+        self.meta = meta or {}
+        centroids = np.zeros((len(self.classes), self.features.shape[1]), dtype=np.float32)
+        np.add.at(centroids, self.labels, self.features)
+        norms = np.linalg.norm(centroids, axis=1, keepdims=True)
+        self.centroids = centroids / np.maximum(norms, 1e-12)
+        # Classes seen per crop, so a tomato photo is never called a rice disease
+        self.crop_classes = {
+            crop: np.isin(np.arange(len(self.classes)), self.labels[self.crops == crop])
+            for crop in set(self.crops.tolist())
+        }
+
+    @classmethod
+    def load(cls, path: str) -> "LocalModel":
+        with np.load(path, allow_pickle=False) as data:
+            meta = json.loads(str(data["meta"]))
+            if meta.get("feature_version") != FEATURE_VERSION:
+                raise ValueError(f"{path} was trained with feature version {meta.get('feature_version')}, "
+                                 f"expected {FEATURE_VERSION}; retrain it")
+            return cls(data["features"], data["labels"], data["classes"].tolist(), data["crops"], meta)
+
+    def save(self, path: str):
+        os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+        with open(path, "wb") as f:
+            np.savez_compressed(
+                f, features=self.features, labels=self.labels, classes=np.array(self.classes),
+                crops=self.crops, meta=np.array(json.dumps({**self.meta, "feature_version": FEATURE_VERSION}))
+            )
+
+    def classify(self, batch: np.ndarray, crop_types: List[Optional[str]], method: str = "knn",
+                 k: int = 7) -> List[Classification]:
+        """Classify a (B, D) batch of feature vectors in one pass. Blocking."""
+        if method == "centroid":
+            scores = self._centroid_scores(batch, crop_types)
+        else:
+            scores = self._knn_scores(batch, crop_types, k)
+        results = []
+        for row in scores:
+            ranked = np.argsort(row)[::-1][:CANDIDATES]
+            candidates = [(self.classes[i], round(float(row[i]), 4)) for i in ranked if row[i] > 0] \
+                or [(self.classes[ranked[0]], 0.0)]
+            results.append((candidates[0][0], candidates[0][1], candidates))
+        return results
+
+    def _allowed(self, crop_type: Optional[str]) -> Optional[np.ndarray]:
+        return self.crop_classes.get((crop_type or "").lower())
+
+    def _knn_scores(self, batch, crop_types, k) -> np.ndarray:
+        similarity = batch @ self.features.T
+        for row, crop_type in enumerate(crop_types):
+            allowed = self._allowed(crop_type)
+            if allowed is not None:
+                similarity[row, ~allowed[self.labels]] = -np.inf
+        k = min(k, self.features.shape[0])
+        nearest = np.argpartition(-similarity, k - 1, axis=1)[:, :k]
+        nearest_similarity = np.take_along_axis(similarity, nearest, axis=1)
+        # Unit vectors: distance = sqrt(2 - 2 cos); closer neighbours get more say
+        weights = 1.0 / (np.sqrt(np.maximum(2 - 2 * nearest_similarity, 0)) + 1e-3)
+        weights[~np.isfinite(nearest_similarity)] = 0
+        votes = np.zeros((batch.shape[0], len(self.classes)), dtype=np.float64)
+        np.add.at(votes, (np.arange(batch.shape[0])[:, None], self.labels[nearest]), weights)
+        return votes / np.maximum(votes.sum(axis=1, keepdims=True), 1e-12)
+
+    def _centroid_scores(self, batch, crop_types) -> np.ndarray:
+        logits = (batch @ self.centroids.T) / CENTROID_TEMPERATURE
+        for row, crop_type in enumerate(crop_types):
+            allowed = self._allowed(crop_type)
+            if allowed is not None:
+                logits[row, ~allowed] = -np.inf
+        logits -= logits.max(axis=1, keepdims=True)
+        probabilities = np.exp(logits)
+        return probabilities / probabilities.sum(axis=1, keepdims=True)
+
+class ClassificationBatcher:
+    """
+    Micro-batching of classifications across concurrent requests.
+    submit() returns a future resolved with the vector's Classification.
+    """
+    def __init__(self, model: LocalModel, max_batch_size: int, window: float):
+        self.model = model
+        self.max_batch_size = max(1, max_batch_size)
+        self.window = window
+        self._pending: List[Tuple[np.ndarray, Optional[str], asyncio.Future]] = []
+        self._timer: Optional[asyncio.TimerHandle] = None
+        self._flushes: set = set()
+
+    def submit(self, features: np.ndarray, crop_type: Optional[str]) -> asyncio.Future:
+        loop = asyncio.get_running_loop()
+        future = loop.create_future()
+        self._pending.append((features, crop_type, future))
+        if len(self._pending) >= self.max_batch_size or self.window <= 0:
+            self._schedule_flush()
+        elif self._timer is None:
+            self._timer = loop.call_later(self.window, self._schedule_flush)
+        return future
+
+    def _schedule_flush(self):
+        if self._timer is not None:
+            self._timer.cancel()
+            self._timer = None
+        batch, self._pending = self._pending, []
+        if batch:
+            task = asyncio.ensure_future(self._classify(batch))
+            self._flushes.add(task)
+            task.add_done_callback(self._flushes.discard)
+
+    async def _classify(self, batch):
+        metrics.observe("detection.local.batch_size", len(batch))
+        try:
+            results = await run_in_image_executor(
+                self.model.classify, np.stack([features for features, _, _ in batch]),
+                [crop_type for _, crop_type, _ in batch], settings.LOCAL_CLASSIFIER_METHOD, settings.LOCAL_CLASSIFIER_K
+            )
+        except Exception as e:
+            for _, _, future in batch:
+                if not future.done():
+                    future.set_exception(e)
+            return
+        for (_, _, future), result in zip(batch, results):
+            if not future.done():
+                future.set_result(result)
+
+class LocalClassifierProvider(DetectionProvider):
+    name = "local"
+    description = "CPU colour/texture histogram classifier trained on past diagnoses"
+    default_latency_ms = 10.0
+
+    def __init__(self):
+        self.model: Optional[LocalModel] = None
+        self.batcher: Optional[ClassificationBatcher] = None
+        path = settings.LOCAL_CLASSIFIER_PATH
+        if path and os.path.exists(path):
+            try:
+                self.model = LocalModel.load(path)
+                self.batcher = ClassificationBatcher(
+                    self.model, settings.LOCAL_CLASSIFIER_MAX_BATCH, settings.LOCAL_CLASSIFIER_BATCH_WINDOW_MS / 1000
+                )
+                logger.info(f"Loaded local classifier {path}: {len(self.model.labels)} samples, "
+                            f"{len(self.model.classes)} diseases")
+            except Exception as e:
+                logger.error(f"Failed to load local classifier {path}: {e}")
+
+    @property
+    def is_configured(self) -> bool:
+        return self.model is not None
+
+    async def predict(self, images, crop_type):
+        if self.batcher is None:
+            raise RuntimeError("No local classifier model; train one with python -m app.utils.local_classifier")
+        features = await asyncio.gather(*(run_in_image_executor(extract_features, data) for data in images))
+        # Several photos of one plant are classified by their mean histogram
+        vector = np.mean(features, axis=0)
+        vector /= max(float(np.linalg.norm(vector)), 1e-12)
+        disease_name, confidence, candidates = await self.batcher.submit(vector, crop_type)
+        return disease_name, confidence, {
+            "disease_name": disease_name,
+            "confidence": confidence,
+            "candidates": [{"name": name, "score": score} for name, score in candidates],
+            "similar_images": [],
+            "plant_details": {},
+            "local_model": {
+                "method": settings.LOCAL_CLASSIFIER_METHOD,
+                "trained_at": self.model.meta.get("trained_at"),
+                "samples": len(self.model.labels)
+            }
+        }
+
+async def load_training_set(db, store, min_confidence: float, max_per_class: int) -> Tuple[List[bytes], List[str], List[str]]:
+    """Photos, disease labels and crops of diagnoses labelled by a remote provider, newest first"""
+    query = {
+        "image_key": {"$exists": True},
+        "confidence_score": {"$gte": min_confidence},
+        # Labels from mock, fixture or local predictions would train the model on itself
+        "api_response.mock_data": {"$ne": True},
+        "api_response.provider": {"$nin": ["fixture", "local"]}
+    }
+    projection = {"image_key": 1, "image_keys": 1, "predicted_disease": 1, "crop_type": 1}
+    samples: Dict[str, Tuple[str, str]] = {}
+    per_class: Dict[str, int] = {}
+    async for diagnosis in db.diagnoses.find(query, projection).sort("created_at", -1):
+        label = diagnosis["predicted_disease"]
+        for key in diagnosis.get("image_keys") or [diagnosis["image_key"]]:
+            if key in samples or per_class.get(label, 0) >= max_per_class:
+                continue
+            samples[key] = (label, (diagnosis.get("crop_type") or "").lower())
+            per_class[label] = per_class.get(label, 0) + 1
+
+    semaphore = asyncio.Semaphore(8)
+
+    async def fetch(key):
+        async with semaphore:
+            try:
+                return await store.get(key)
+            except Exception as e:
+                logger.warning(f"Skipping {key}: {e}")
+                return None
+
+    contents = await asyncio.gather(*(fetch(key) for key in samples))
+    images, labels, crops = [], [], []
+    for data, (label, crop) in zip(contents, samples.values()):
+        if data:
+            images.append(data)
+            labels.append(label)
+            crops.append(crop)
+    return images, labels, crops
+
+def build_model(features: np.ndarray, labels: List[str], crops: List[str], min_samples: int,
+                meta: Optional[Dict[str, Any]] = None) -> LocalModel:
+    """Model over the classes with at least min_samples examples"""
+    counts: Dict[str, int] = {}
+    for label in labels:
+        counts[label] = counts.get(label, 0) + 1
+    classes = sorted(label for label, count in counts.items() if count >= min_samples)
+    if not classes:
+        raise ValueError(f"No disease has {min_samples} or more labelled photos")
+    index = {label: i for i, label in enumerate(classes)}
+    keep = np.array([label in index for label in labels])
+    return LocalModel(
+        features[keep], np.array([index[label] for label in labels if label in index]),
+        classes, np.array(crops)[keep], meta
+    )
+
+def holdout_accuracy(features: np.ndarray, labels: List[str], crops: List[str], min_samples: int,
+                     fraction: float, method: str, k: int) -> Optional[float]:
+    """Accuracy on a seeded random holdout of the labelled photos, None if no split is usable"""
+    rng = np.random.default_rng(0)
+    test = rng.random(len(labels)) < fraction
+    if test.all() or not test.any():
+        return None
+    train_labels = [label for label, held in zip(labels, test) if not held]
+    train_crops = [crop for crop, held in zip(crops, test) if not held]
+    try:
+        model = build_model(features[~test], train_labels, train_crops, min_samples)
+    except ValueError:
+        # No disease keeps min_samples photos once the holdout is taken out
+        return None
+    test_indices = np.flatnonzero(test)
+    predictions = model.classify(features[test], [crops[i] for i in test_indices], method, k)
+    return float(np.mean([predicted == labels[i] for (predicted, _, _), i in zip(predictions, test_indices)]))
+
+async def _main():
+    from app.database import connect_to_mongo, close_mongo_connection, get_database
+    from app.utils.storage import close_image_store, get_image_store
+
+    parser = argparse.ArgumentParser(description="Train the local disease classifier from labelled diagnoses")
+    parser.add_argument("--output", default=settings.LOCAL_CLASSIFIER_PATH)
+    parser.add_argument("--min-confidence", type=float, default=0.5, help="Ignore diagnoses less certain than this")
+    parser.add_argument("--max-per-class", type=int, default=500, help="Newest photos kept per disease")
+    parser.add_argument("--min-samples", type=int, default=3, help="Diseases with fewer photos are left out")
+    parser.add_argument("--holdout", type=float, default=0.2, help="Fraction held out to report accuracy (0 skips)")
+    args = parser.parse_args()
+
+    await connect_to_mongo()
+    try:
+        images, labels, crops = await load_training_set(
+            get_database(), get_image_store(), args.min_confidence, args.max_per_class
+        )
+        features = np.stack(await asyncio.gather(*(run_in_image_executor(extract_features, data) for data in images))) \
+            if images else np.zeros((0, 1), dtype=np.float32)
+        report: Dict[str, Any] = {"photos": len(images)}
+        if args.holdout > 0 and images:
+            for method in ("knn", "centroid"):
+                report[f"holdout_accuracy_{method}"] = holdout_accuracy(
+                    features, labels, crops, args.min_samples, args.holdout, method, settings.LOCAL_CLASSIFIER_K
+                )
+        try:
+            model = build_model(features, labels, crops, args.min_samples, {
+                "trained_at": datetime.utcnow().isoformat(),
+                "min_confidence": args.min_confidence
+            })
+        except ValueError as e:
+            print(f"{e} ({len(images)} usable diagnoses); nothing written")
+            sys.exit(1)
+        model.save(args.output)
+        report.update(output=args.output, samples=len(model.labels), diseases=len(model.classes))
+        print(json.dumps(report, indent=2))
+    finally:
+        await close_image_store()
+        await close_mongo_connection()
+
+if __name__ == "__main__":
+    asyncio.run(_main())
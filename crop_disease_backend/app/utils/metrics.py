@@ -0,0 +1,127 @@
+# metrics.py
+import threading
+import time
+from collections import deque
+from typing import Any, Deque, Dict
+from pymongo import monitoring
+import logging
+
+logger = logging.getLogger(__name__)
+
+class Summary:
+    """Count / sum / max plus percentiles over the most recent samples"""
+    def __init__(self, window: int = 1024):
+        self.count = 0
+        self.total = 0.0
+        self.max = 0.0
+        self.samples: Deque[float] = deque(maxlen=window)
+    
+    def observe(self, value: float):
+        self.count += 1
+        self.total += value
+        self.max = max(self.max, value)
+        self.samples.append(value)
+    
+    def snapshot(self) -> Dict[str, Any]:
+        ordered = sorted(self.samples)
+        
+        def percentile(p: float) -> float:
+            if not ordered:
+                return 0.0
+            return ordered[min(len(ordered) - 1, int(p * len(ordered)))]
+        
+        return {
+            "count": self.count,
+            "avg": self.total / self.count if self.count else 0.0,
+            "max": self.max,
+            "p50": percentile(0.50),
+            "p95": percentile(0.95),
+            "p99": percentile(0.99)
+        }
+
+class MetricsRegistry:
+    """Minimal in-process metrics store (thread-safe; pymongo listeners run off the event loop)"""
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._counters: Dict[str, int] = {}
+        self._gauges: Dict[str, float] = {}
+        self._summaries: Dict[str, Summary] = {}
+    
+    def increment(self, name: str, value: int = 1):
+        with self._lock:
+            self._counters[name] = self._counters.get(name, 0) + value
+    
+    def set_gauge(self, name: str, value: float):
+        with self._lock:
+            self._gauges[name] = value
+    
+    def add_gauge(self, name: str, delta: float):
+        with self._lock:
+            self._gauges[name] = self._gauges.get(name, 0) + delta
+    
+    def observe(self, name: str, value: float):
+        with self._lock:
+            summary = self._summaries.get(name)
+            if summary is None:
+                summary = self._summaries[name] = Summary()
+            summary.observe(value)
+    
+    def snapshot(self) -> Dict[str, Any]:
+        with self._lock:
+            return {
+                "counters": dict(self._counters),
+                "gauges": dict(self._gauges),
+                "summaries": {name: s.snapshot() for name, s in self._summaries.items()}
+            }
+
+metrics = MetricsRegistry()
+
+class PoolMetricsListener(monitoring.ConnectionPoolListener):
+    """Publishes MongoDB connection pool events as metrics"""
+    def __init__(self, registry: MetricsRegistry = metrics):
+        self.registry = registry
+        # Check-out start times, per thread (each check-out happens on one thread)
+        self._local = threading.local()
+    
+    def pool_created(self, event):
+        self.registry.increment("mongo.pool.created")
+    
+    def pool_ready(self, event):
+        pass
+    
+    def pool_cleared(self, event):
+        self.registry.increment("mongo.pool.cleared")
+    
+    def pool_closed(self, event):
+        self.registry.increment("mongo.pool.closed")
+    
+    def connection_created(self, event):
+        self.registry.increment("mongo.connections.created")
+        self.registry.add_gauge("mongo.connections.open", 1)
+    
+    def connection_ready(self, event):
+        pass
+    
+    def connection_closed(self, event):
+        self.registry.increment("mongo.connections.closed")
+        self.registry.add_gauge("mongo.connections.open", -1)
+    
+    def connection_check_out_started(self, event):
+        self._local.started = time.perf_counter()
+    
+    def _observe_wait(self):
+        started = getattr(self._local, "started", None)
+        if started is not None:
+            self.registry.observe("mongo.checkout.wait_ms", (time.perf_counter() - started) * 1000)
+            self._local.started = None
+    
+    def connection_check_out_failed(self, event):
+        self._observe_wait()
+        self.registry.increment(f"mongo.checkout.failed.{event.reason}")
+    
+    def connection_checked_out(self, event):
+        self._observe_wait()
+        self.registry.add_gauge("mongo.connections.in_use", 1)
+    
+    def connection_checked_in(self, event):
+        self.registry.add_gauge("mongo.connections.in_use", -1)
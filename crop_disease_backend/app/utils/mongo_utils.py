@@ -1,28 +1,35 @@
-from bson import ObjectId
-from app.models.user import PyObjectId
+# mongo_utils.py
+from typing import Any
+import orjson
+from bson import ObjectId, Decimal128
+from fastapi.responses import JSONResponse
+from pydantic import BaseModel
 
-def convert_objectids_to_str(doc):
+# Options shared by every Mongo-backed response; numpy values come from the weather/risk paths
+MONGO_JSON_OPTIONS = orjson.OPT_NON_STR_KEYS | orjson.OPT_SERIALIZE_NUMPY
+
+def mongo_default(value: Any) -> Any:
+    """
+    Fallback for types orjson does not serialize natively.
+    datetime, dict, list and numpy values are handled by orjson itself.
+    """
+    if isinstance(value, ObjectId):
+        return str(value)
+    if isinstance(value, Decimal128):
+        return str(value.to_decimal())
+    if isinstance(value, BaseModel):
+        return value.model_dump(mode="json")
+    raise TypeError(f"Type is not JSON serializable: {type(value).__name__}")
+
+def dumps_mongo(content: Any) -> bytes:
+    """Serialize raw Mongo documents (ObjectId, datetime, nested lists) in a single pass"""
+    return orjson.dumps(content, default=mongo_default, option=MONGO_JSON_OPTIONS)
+
+class MongoJSONResponse(JSONResponse):
     """
-    Recursively convert ObjectId and PyObjectId instances to strings in a document.
-    Handles nested dictionaries and lists to prevent Pydantic serialization warnings.
+    JSON response for raw Mongo documents.
+    Routes return it directly so FastAPI skips jsonable_encoder and the
+    document is written straight from the driver's dicts.
     """
-    if isinstance(doc, dict):
-        result = {}
-        for k, v in doc.items():
-            if isinstance(v, (ObjectId, PyObjectId)):
-                result[k] = str(v)
-            elif isinstance(v, dict):
-                result[k] = convert_objectids_to_str(v)
-            elif isinstance(v, list):
-                result[k] = [convert_objectids_to_str(i) if isinstance(i, (dict, ObjectId, PyObjectId)) 
-                           else str(i) if isinstance(i, (ObjectId, PyObjectId)) else i for i in v]
-            else:
-                result[k] = v
-        return result
-    elif isinstance(doc, (ObjectId, PyObjectId)):
-        return str(doc)
-    elif isinstance(doc, list):
-        return [convert_objectids_to_str(i) if isinstance(i, (dict, ObjectId, PyObjectId)) 
-                else str(i) if isinstance(i, (ObjectId, PyObjectId)) else i for i in doc]
-    else:
-        return doc
\ No newline at end of file
+    def render(self, content: Any) -> bytes:
+        return dumps_mongo(content)
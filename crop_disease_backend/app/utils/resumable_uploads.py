@@ -0,0 +1,111 @@
+# resumable_uploads.py
+"""
+Partial files for resumable (tus-style) uploads.
+
+Each upload session (`upload_sessions` collection, see
+app.controllers.upload_controller) owns one file under RESUMABLE_UPLOAD_DIR.
+Request bodies are appended a chunk at a time, so memory stays constant
+whatever the upload size. Sessions expire through a TTL index; files whose
+session is gone are removed by the retention pass (app.utils.retention).
+"""
+import asyncio
+import base64
+import binascii
+import os
+import time
+from typing import AsyncIterator, List, Optional
+from fastapi import HTTPException
+from starlette.requests import ClientDisconnect
+from app.config import settings
+
+PARTIAL_SUFFIX = ".part"
+
+def partial_path(upload_id: str) -> str:
+    return os.path.join(settings.RESUMABLE_UPLOAD_DIR, f"{upload_id}{PARTIAL_SUFFIX}")
+
+def _open_at(path: str, offset: int):
+    """Open the partial file for writing at `offset`, dropping anything past it"""
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    handle = open(path, "r+b" if os.path.exists(path) else "w+b")
+    # Bytes beyond the recorded offset come from a write that was never acknowledged
+    handle.truncate(offset)
+    handle.seek(offset)
+    return handle
+
+def _close(handle):
+    handle.flush()
+    os.fsync(handle.fileno())
+    handle.close()
+
+async def create_partial(upload_id: str):
+    handle = await asyncio.to_thread(_open_at, partial_path(upload_id), 0)
+    await asyncio.to_thread(_close, handle)
+
+async def append_chunks(upload_id: str, offset: int, max_bytes: int, chunks: AsyncIterator[bytes]) -> int:
+    """
+    Write a request body into the partial file at `offset` as it arrives.
+    Returns the bytes written, fewer than sent if the client went away
+    mid-body (those bytes are kept, so the client resumes after them).
+    A body longer than `max_bytes` is rejected and nothing is kept.
+    """
+    handle = await asyncio.to_thread(_open_at, partial_path(upload_id), offset)
+    written = 0
+    try:
+        async for chunk in chunks:
+            if written + len(chunk) > max_bytes:
+                await asyncio.to_thread(handle.truncate, offset)
+                raise HTTPException(status_code=413, detail="Chunk runs past the declared upload length")
+            await asyncio.to_thread(handle.write, chunk)
+            written += len(chunk)
+    except ClientDisconnect:
+        pass
+    finally:
+        await asyncio.to_thread(_close, handle)
+    return written
+
+async def remove_partial(upload_id: str):
+    path = partial_path(upload_id)
+    if await asyncio.to_thread(os.path.exists, path):
+        await asyncio.to_thread(os.remove, path)
+
+def _stale_partials(older_than: float) -> List[str]:
+    """Upload ids of partial files not written to since `older_than` (unix time)"""
+    try:
+        entries = os.scandir(settings.RESUMABLE_UPLOAD_DIR)
+    except FileNotFoundError:
+        return []
+    with entries:
+        return [
+            entry.name[:-len(PARTIAL_SUFFIX)] for entry in entries
+            if entry.name.endswith(PARTIAL_SUFFIX) and entry.stat().st_mtime < older_than
+        ]
+
+async def sweep_partial_uploads(db, dry_run: bool = False) -> int:
+    """Remove partial files whose session expired or was never recorded; returns how many"""
+    # A session outlives its last write by the TTL, so only older files can be orphans
+    older_than = time.time() - settings.UPLOAD_SESSION_TTL_MINUTES * 60
+    candidates = await asyncio.to_thread(_stale_partials, older_than)
+    removed = 0
+    for start in range(0, len(candidates), settings.IMAGE_GC_BATCH_SIZE):
+        batch = candidates[start:start + settings.IMAGE_GC_BATCH_SIZE]
+        live = set(await db.upload_sessions.distinct("_id", {"_id": {"$in": batch}}))
+        for upload_id in batch:
+            if upload_id in live:
+                continue
+            removed += 1
+            if not dry_run:
+                await remove_partial(upload_id)
+    return removed
+
+def parse_upload_metadata(header: Optional[str]) -> dict:
+    """Decode a tus Upload-Metadata header ("key base64value,key2 base64value2")"""
+    metadata = {}
+    for pair in (header or "").split(","):
+        parts = pair.strip().split(" ", 1)
+        if not parts[0]:
+            continue
+        try:
+            metadata[parts[0]] = base64.b64decode(parts[1]).decode() if len(parts) > 1 else ""
+        except (binascii.Error, UnicodeDecodeError):
+            raise HTTPException(status_code=400, detail=f"Invalid Upload-Metadata value for {parts[0]}")
+    return metadata
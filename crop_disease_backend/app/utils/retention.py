@@ -0,0 +1,224 @@
+# retention.py
+"""
+Retention and orphaned image collection.
+
+TTL indexes (app.database.create_indexes) expire whole documents after
+DIAGNOSIS_RETENTION_DAYS / ADVISORY_RETENTION_DAYS. This module covers what a
+TTL index cannot:
+
+- strip raw provider payloads from diagnoses older than RAW_RESPONSE_RETENTION_DAYS;
+- reconcile the `images` manifest with the diagnoses referencing each key,
+  repairing reference counts and deleting images nothing points at (uploads
+  whose prediction failed, diagnoses expired by TTL);
+- sweep the image store for objects missing from the manifest (files written
+  by older versions, interrupted writes, derivatives of deleted originals);
+- remove partial files of resumable uploads whose session has expired.
+
+Work proceeds in batches of IMAGE_GC_BATCH_SIZE, deletes are limited to
+IMAGE_GC_DELETES_PER_SECOND, and images touched within IMAGE_GC_GRACE_MINUTES
+are left alone so uploads in flight are never collected. The background
+pass runs in one worker at a time (app.utils.scheduling).
+
+Run once by hand with:
+    python -m app.utils.retention --dry-run
+"""
+import argparse
+import asyncio
+import json
+import logging
+import time
+from datetime import datetime, timedelta
+from typing import Dict, List
+from pydantic import BaseModel
+from app.config import settings
+from app.database import get_database
+from app.utils.image_delivery import DERIVATIVES_PREFIX, delete_derivatives
+from app.utils.image_storage import STORE_FORMATS, delete_unreferenced
+from app.utils.resumable_uploads import sweep_partial_uploads
+from app.utils.scheduling import run_periodically
+from app.utils.storage import ImageStore, get_image_store
+
+logger = logging.getLogger(__name__)
+
+# Extensions an original may have; derivatives only record its stem
+ORIGINAL_EXTENSIONS = sorted({extension for _, extension in STORE_FORMATS.values()} | {".jpeg", ".png"})
+
+class RetentionReport(BaseModel):
+    """Outcome of one collection run"""
+    dry_run: bool = False
+    raw_responses_pruned: int = 0
+    manifest_scanned: int = 0
+    ref_counts_repaired: int = 0
+    objects_scanned: int = 0
+    images_deleted: int = 0
+    derivatives_deleted: int = 0
+    partial_uploads_deleted: int = 0
+
+class DeleteRateLimiter:
+    """Spaces deletes evenly so collection never saturates the store"""
+    def __init__(self, per_second: float):
+        self.interval = 1 / per_second if per_second > 0 else 0
+        self.next_slot = 0.0
+
+    async def wait(self):
+        now = time.monotonic()
+        if self.next_slot > now:
+            await asyncio.sleep(self.next_slot - now)
+        self.next_slot = max(now, self.next_slot) + self.interval
+
+def _grace_cutoff() -> datetime:
+    return datetime.utcnow() - timedelta(minutes=settings.IMAGE_GC_GRACE_MINUTES)
+
+async def prune_raw_responses(db, dry_run: bool = False) -> int:
+    """Drop raw provider payloads from old diagnoses; returns the number of diagnoses changed"""
+    if settings.RAW_RESPONSE_RETENTION_DAYS <= 0:
+        return 0
+    query = {
+        "created_at": {"$lt": datetime.utcnow() - timedelta(days=settings.RAW_RESPONSE_RETENTION_DAYS)},
+        "api_response.raw_response": {"$exists": True}
+    }
+    if dry_run:
+        return await db.diagnoses.count_documents(query)
+    # updated_at changes the diagnosis' ETag, so cached copies are revalidated
+    result = await db.diagnoses.update_many(query, {
+        "$unset": {"api_response.raw_response": ""},
+        "$set": {"updated_at": datetime.utcnow()}
+    })
+    return result.modified_count
+
+async def reference_counts(db, keys: List[str]) -> Dict[str, int]:
+    """Number of diagnoses referencing each of `keys` (absent keys have none)"""
+    cursor = db.diagnoses.aggregate([
+        {"$match": {"$or": [{"image_key": {"$in": keys}}, {"image_keys": {"$in": keys}}]}},
+        # Multi-photo diagnoses hold one reference per listed image
+        {"$project": {"key": {"$ifNull": ["$image_keys", ["$image_key"]]}}},
+        {"$unwind": "$key"},
+        {"$match": {"key": {"$in": keys}}},
+        {"$group": {"_id": "$key", "count": {"$sum": 1}}}
+    ])
+    return {row["_id"]: row["count"] for row in await cursor.to_list(length=None)}
+
+async def _delete_image(store: ImageStore, key: str):
+    await store.delete(key)
+    await delete_derivatives(key)
+
+async def reconcile_manifest(db, store: ImageStore, limiter: DeleteRateLimiter, report: RetentionReport):
+    """Correct manifest reference counts and delete images no diagnosis references"""
+    stale = {"$or": [
+        {"last_referenced_at": {"$lt": _grace_cutoff()}},
+        {"last_referenced_at": {"$exists": False}, "created_at": {"$lt": _grace_cutoff()}}
+    ]}
+    last_key = None
+    while True:
+        query = {"$and": [stale, {"_id": {"$gt": last_key}}]} if last_key else stale
+        entries = await db.images.find(query, {"ref_count": 1}).sort("_id", 1).limit(
+            settings.IMAGE_GC_BATCH_SIZE
+        ).to_list(length=None)
+        if not entries:
+            return
+        last_key = entries[-1]["_id"]
+        counts = await reference_counts(db, [entry["_id"] for entry in entries])
+
+        for entry in entries:
+            report.manifest_scanned += 1
+            key, recorded = entry["_id"], entry.get("ref_count", 0)
+            actual = counts.get(key, 0)
+            if actual == recorded:
+                continue
+            if report.dry_run:
+                if actual > 0:
+                    report.ref_counts_repaired += 1
+                else:
+                    report.images_deleted += 1
+                continue
+            # Only act if nobody took or dropped a reference since we read the entry
+            guard = {"$and": [{"_id": key, "ref_count": recorded}, stale]}
+            if actual > 0:
+                result = await db.images.update_one(guard, {"$set": {"ref_count": actual}})
+                report.ref_counts_repaired += result.modified_count
+            else:
+                await limiter.wait()
+                if await delete_unreferenced(key, guard):
+                    await delete_derivatives(key)
+                    report.images_deleted += 1
+
+def _original_candidates(derivative: str) -> List[str]:
+    """Keys the original of a derivative ("derivatives/<variant>/<stem>.webp") may have"""
+    stem = derivative[len(DERIVATIVES_PREFIX):].split("/", 1)[-1].rsplit(".", 1)[0]
+    return [f"{stem}{extension}" for extension in ORIGINAL_EXTENSIONS]
+
+async def sweep_store(db, store: ImageStore, limiter: DeleteRateLimiter, report: RetentionReport):
+    """Delete stored objects that are neither in the manifest nor referenced by a diagnosis"""
+    if await db.diagnoses.find_one({"image_key": {"$exists": False}}, {"_id": 1}):
+        # Older diagnoses only reference their image by path; run migrate_image_storage.py first
+        logger.warning("Skipping image store sweep: diagnoses without image_key exist")
+        return
+
+    cutoff = _grace_cutoff()
+    async for page in store.list_objects():
+        originals, derivatives = [], []
+        for key, modified in page:
+            report.objects_scanned += 1
+            if modified >= cutoff:
+                continue
+            (derivatives if key.startswith(DERIVATIVES_PREFIX) else originals).append(key)
+
+        candidates = originals + [key for derivative in derivatives for key in _original_candidates(derivative)]
+        if not candidates:
+            continue
+        # The lookups are bounded by the page size (LIST_PAGE_SIZE)
+        live = set(await db.images.distinct("_id", {"_id": {"$in": candidates}}))
+        live |= set(await db.diagnoses.distinct("image_key", {"image_key": {"$in": candidates}}))
+        live |= set(await db.diagnoses.distinct("image_keys", {"image_keys": {"$in": candidates}}))
+
+        for key in originals:
+            if key in live:
+                continue
+            report.images_deleted += 1
+            if not report.dry_run:
+                await limiter.wait()
+                await _delete_image(store, key)
+        for key in derivatives:
+            if live.intersection(_original_candidates(key)):
+                continue
+            report.derivatives_deleted += 1
+            if not report.dry_run:
+                await limiter.wait()
+                await store.delete(key)
+
+async def collect_garbage(dry_run: bool = False) -> RetentionReport:
+    """One full retention pass; with dry_run nothing is changed, only counted"""
+    db = get_database()
+    store = get_image_store()
+    limiter = DeleteRateLimiter(settings.IMAGE_GC_DELETES_PER_SECOND)
+    report = RetentionReport(dry_run=dry_run)
+
+    report.raw_responses_pruned = await prune_raw_responses(db, dry_run)
+    await reconcile_manifest(db, store, limiter, report)
+    await sweep_store(db, store, limiter, report)
+    report.partial_uploads_deleted = await sweep_partial_uploads(db, dry_run)
+    logger.info(f"Retention pass{' (dry run)' if dry_run else ''}: {report.dict()}")
+    return report
+
+async def run_retention_scheduler():
+    """Background loop running the retention pass on a fixed interval, in one worker at a time"""
+    await run_periodically("retention", settings.IMAGE_GC_INTERVAL_MINUTES * 60, collect_garbage)
+
+async def _main():
+    from app.database import connect_to_mongo, close_mongo_connection
+    from app.utils.storage import close_image_store
+
+    parser = argparse.ArgumentParser(description="Run one retention and orphaned image collection pass")
+    parser.add_argument("--dry-run", action="store_true", help="Report what would be removed without removing it")
+    args = parser.parse_args()
+
+    await connect_to_mongo()
+    try:
+        report = await collect_garbage(dry_run=args.dry_run)
+        print(json.dumps(report.dict(), indent=2))
+    finally:
+        await close_image_store()
+        await close_mongo_connection()
+
+if __name__ == "__main__":
+    asyncio.run(_main())
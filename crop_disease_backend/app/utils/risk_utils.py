@@ -0,0 +1,53 @@
+# risk_utils.py
+import numpy as np
+from typing import Tuple
+
+# Most foliar pathogens are favoured by leaf wetness (high humidity) and mild
+# temperatures; these bounds shape the weather multiplier below.
+OPTIMAL_TEMPERATURE = 24.0
+TEMPERATURE_SPREAD = 8.0
+HUMIDITY_FLOOR = 40.0
+HUMIDITY_CEILING = 90.0
+
+HIGH_RISK = 0.5
+MODERATE_RISK = 0.2
+RISK_LEVELS = np.array(["low", "moderate", "high"])
+
+def weather_favorability(temperatures: np.ndarray, humidities: np.ndarray) -> np.ndarray:
+    """
+    How favourable current weather is for disease development, in [0, 1].
+    Missing weather (NaN) is treated as neutral (0.5).
+    """
+    humidity_factor = np.clip(
+        (humidities - HUMIDITY_FLOOR) / (HUMIDITY_CEILING - HUMIDITY_FLOOR), 0.0, 1.0
+    )
+    temperature_factor = np.exp(-((temperatures - OPTIMAL_TEMPERATURE) / TEMPERATURE_SPREAD) ** 2)
+    favorability = humidity_factor * temperature_factor
+    return np.where(np.isnan(favorability), 0.5, favorability)
+
+def compute_risk_scores(
+    counts: np.ndarray,
+    group_index: np.ndarray,
+    region_index: np.ndarray,
+    temperatures: np.ndarray,
+    humidities: np.ndarray
+) -> Tuple[np.ndarray, np.ndarray]:
+    """
+    Risk score per (region, crop, disease) row.
+
+    counts[i] is how often disease i was diagnosed for its (region, crop)
+    group, group_index[i] identifies that group and region_index[i] its
+    region, which indexes the per-region temperatures / humidities.
+    The score is the disease's share of its group's history scaled by the
+    weather favourability of the region. Returns (scores, levels).
+    """
+    counts = counts.astype(float)
+    group_totals = np.bincount(group_index, weights=counts)
+    share = counts / group_totals[group_index]
+    
+    favorability = weather_favorability(temperatures, humidities)[region_index]
+    # Even unfavourable weather leaves some baseline risk from history
+    scores = np.round(share * (0.3 + 0.7 * favorability), 4)
+    
+    levels = RISK_LEVELS[(scores >= MODERATE_RISK).astype(int) + (scores >= HIGH_RISK).astype(int)]
+    return scores, levels
@@ -0,0 +1,51 @@
+# scheduling.py
+"""
+Periodic background jobs that run in one worker at a time.
+
+Every worker runs the loop, but a pass only starts in the worker holding the
+job's lease, a document in the `leases` collection that expires one interval
+after it was taken. Workers that started while MongoDB was unreachable keep
+looping and join in once the heartbeat has reconnected; passes are skipped
+while disconnected.
+"""
+import asyncio
+import logging
+import os
+import socket
+import uuid
+from datetime import datetime, timedelta
+from typing import Awaitable, Callable
+from pymongo.errors import DuplicateKeyError
+from app.database import get_database, is_database_connected
+
+logger = logging.getLogger(__name__)
+
+# Identifies this worker as a lease holder
+WORKER_ID = f"{socket.gethostname()}:{os.getpid()}:{uuid.uuid4().hex[:8]}"
+# Longest a worker waits before checking whether a lease has become free
+LEASE_POLL_SECONDS = 60
+
+async def acquire_lease(name: str, seconds: float) -> bool:
+    """Take the named lease for `seconds` if it is free or expired"""
+    now = datetime.utcnow()
+    try:
+        await get_database().leases.update_one(
+            {"_id": name, "expires_at": {"$lt": now}},
+            {"$set": {"holder": WORKER_ID, "acquired_at": now, "expires_at": now + timedelta(seconds=seconds)}},
+            upsert=True
+        )
+        return True
+    except DuplicateKeyError:
+        # The lease exists and has not expired yet
+        return False
+
+async def run_periodically(name: str, interval: float, job: Callable[[], Awaitable]):
+    """Run `job` about every `interval` seconds across all workers, in one worker at a time"""
+    poll = min(interval, LEASE_POLL_SECONDS)
+    while True:
+        try:
+            if is_database_connected() and await acquire_lease(name, interval):
+                await job()
+        except Exception as e:
+            logger.error(f"Scheduled job {name} failed: {e}")
+        await asyncio.sleep(poll)
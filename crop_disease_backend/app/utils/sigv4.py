@@ -0,0 +1,38 @@
+# sigv4.py
+"""
+AWS Signature Version 4 for S3-compatible object stores.
+
+Kept free of app settings so the object-store stand-in can verify
+signatures with the same code the client signs with.
+"""
+import hashlib
+import hmac
+from typing import Dict, Tuple
+from urllib.parse import quote
+
+def sha256_hex(data: bytes) -> str:
+    return hashlib.sha256(data).hexdigest()
+
+def _hmac(key: bytes, message: str) -> bytes:
+    return hmac.new(key, message.encode(), hashlib.sha256).digest()
+
+def sigv4_signature(secret_key: str, region: str, amz_date: str, method: str, path: str,
+                    query: Dict[str, str], headers: Dict[str, str], payload_hash: str,
+                    service: str = "s3") -> Tuple[str, str]:
+    """
+    Signature over an already URI-encoded path.
+    Returns (signature, signed header list); headers must include host.
+    """
+    canonical_query = "&".join(
+        f"{quote(k, safe='-_.~')}={quote(v, safe='-_.~')}" for k, v in sorted(query.items())
+    )
+    normalized = {k.lower(): " ".join(str(v).split()) for k, v in headers.items()}
+    signed_headers = ";".join(sorted(normalized))
+    canonical_headers = "".join(f"{k}:{normalized[k]}\n" for k in sorted(normalized))
+    canonical_request = "\n".join([
+        method, path, canonical_query, canonical_headers, signed_headers, payload_hash
+    ])
+    scope = f"{amz_date[:8]}/{region}/{service}/aws4_request"
+    string_to_sign = "\n".join(["AWS4-HMAC-SHA256", amz_date, scope, sha256_hex(canonical_request.encode())])
+    signing_key = _hmac(_hmac(_hmac(_hmac(f"AWS4{secret_key}".encode(), amz_date[:8]), region), service), "aws4_request")
+    return hmac.new(signing_key, string_to_sign.encode(), hashlib.sha256).hexdigest(), signed_headers
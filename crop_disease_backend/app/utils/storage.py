@@ -0,0 +1,307 @@
+# storage.py
+"""
+Image storage backends.
+
+Everything that touches image bytes goes through an ImageStore so API nodes
+can share one bucket instead of a local disk:
+
+- LocalImageStore keeps files under a directory (the default; single node).
+- S3ImageStore talks to any S3-compatible object store (AWS S3, MinIO, Ceph,
+  or app.testing.object_store) with SigV4-signed requests over httpx.
+
+Select the backend with STORAGE_BACKEND=local|s3. Keys are relative paths
+such as "ab/cd/<sha256>.webp".
+"""
+import asyncio
+import datetime
+import itertools
+import os
+import uuid
+import xml.etree.ElementTree as ElementTree
+from abc import ABC, abstractmethod
+from typing import AsyncIterator, Dict, Iterator, List, Optional, Tuple
+from urllib.parse import quote, urlencode, urlsplit
+import httpx
+from app.config import settings
+from app.utils.image_utils import IMAGES_DIR
+from app.utils.sigv4 import sha256_hex, sigv4_signature
+
+CHUNK_SIZE = 64 * 1024
+LIST_PAGE_SIZE = 1000
+
+# (key, last modified in UTC)
+ObjectInfo = Tuple[str, datetime.datetime]
+
+class ImageStore(ABC):
+    """Put / get / stream / delete / presign over string keys"""
+    scheme = ""
+
+    @abstractmethod
+    async def put(self, key: str, data: bytes, content_type: str = "application/octet-stream",
+                  cache_control: Optional[str] = None) -> None:
+        ...
+
+    @abstractmethod
+    async def get(self, key: str) -> Optional[bytes]:
+        """Object bytes, or None if the key does not exist"""
+
+    @abstractmethod
+    def stream(self, key: str, chunk_size: int = CHUNK_SIZE) -> AsyncIterator[bytes]:
+        """Object bytes in chunks; raises FileNotFoundError if the key does not exist"""
+
+    @abstractmethod
+    async def exists(self, key: str) -> bool:
+        ...
+
+    @abstractmethod
+    async def delete(self, key: str) -> bool:
+        """Remove an object; False if it did not exist"""
+
+    @abstractmethod
+    def list_objects(self, prefix: str = "") -> AsyncIterator[List[ObjectInfo]]:
+        """All objects under a prefix, in pages of up to LIST_PAGE_SIZE"""
+
+    def presign(self, key: str, expires_in: int, issued_at: Optional[datetime.datetime] = None) -> Optional[str]:
+        """Time-limited direct download URL, or None if the backend cannot serve clients directly"""
+        return None
+
+    def local_path(self, key: str) -> Optional[str]:
+        """Filesystem path for zero-copy file responses, or None for remote backends"""
+        return None
+
+    def uri(self, key: str) -> str:
+        """Location recorded in documents, e.g. local://ab/cd/x.webp"""
+        return f"{self.scheme}://{key}"
+
+    async def close(self) -> None:
+        pass
+
+class LocalImageStore(ImageStore):
+    """Files under a root directory; writes are atomic renames"""
+    scheme = "local"
+
+    def __init__(self, root: str):
+        self.root = root
+
+    def _path(self, key: str) -> str:
+        return os.path.join(self.root, *key.split("/"))
+
+    def _write(self, key: str, data: bytes) -> None:
+        path = self._path(key)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        temporary = f"{path}.{uuid.uuid4().hex}.tmp"
+        with open(temporary, "wb") as f:
+            f.write(data)
+        os.replace(temporary, path)
+
+    def _read(self, key: str) -> Optional[bytes]:
+        try:
+            with open(self._path(key), "rb") as f:
+                return f.read()
+        except FileNotFoundError:
+            return None
+
+    def _remove(self, key: str) -> bool:
+        try:
+            os.remove(self._path(key))
+            return True
+        except FileNotFoundError:
+            return False
+
+    async def put(self, key, data, content_type="application/octet-stream", cache_control=None):
+        await asyncio.to_thread(self._write, key, data)
+
+    async def get(self, key):
+        return await asyncio.to_thread(self._read, key)
+
+    async def stream(self, key, chunk_size=CHUNK_SIZE):
+        handle = await asyncio.to_thread(open, self._path(key), "rb")
+        try:
+            while chunk := await asyncio.to_thread(handle.read, chunk_size):
+                yield chunk
+        finally:
+            handle.close()
+
+    async def exists(self, key):
+        return await asyncio.to_thread(os.path.exists, self._path(key))
+
+    async def delete(self, key):
+        return await asyncio.to_thread(self._remove, key)
+
+    def _walk(self, prefix: str) -> Iterator[ObjectInfo]:
+        for directory, _, files in os.walk(self._path(prefix) if prefix else self.root):
+            relative = os.path.relpath(directory, self.root).replace(os.sep, "/")
+            for name in files:
+                try:
+                    modified = os.path.getmtime(os.path.join(directory, name))
+                except FileNotFoundError:
+                    continue
+                key = name if relative == "." else f"{relative}/{name}"
+                yield key, datetime.datetime.utcfromtimestamp(modified)
+
+    async def list_objects(self, prefix=""):
+        walker = self._walk(prefix)
+        while page := await asyncio.to_thread(lambda: list(itertools.islice(walker, LIST_PAGE_SIZE))):
+            yield page
+
+    def local_path(self, key):
+        return self._path(key)
+
+class S3ImageStore(ImageStore):
+    """S3-compatible object store using path-style addressing"""
+    scheme = "s3"
+
+    def __init__(self, endpoint_url: str, bucket: str, access_key: str, secret_key: str,
+                 region: str = "us-east-1", prefix: str = "", timeout: float = 30.0):
+        self.endpoint_url = endpoint_url.rstrip("/")
+        self.bucket = bucket
+        self.access_key = access_key
+        self.secret_key = secret_key
+        self.region = region
+        self.prefix = prefix.strip("/")
+        self.host = urlsplit(self.endpoint_url).netloc
+        self._client = httpx.AsyncClient(timeout=timeout)
+
+    def _object_path(self, key: str) -> str:
+        full_key = f"{self.prefix}/{key}" if self.prefix else key
+        return quote(f"/{self.bucket}/{full_key}", safe="/-_.~")
+
+    def _signed_headers(self, method: str, path: str, payload_hash: str,
+                        extra: Optional[Dict[str, str]] = None,
+                        query: Optional[Dict[str, str]] = None) -> Dict[str, str]:
+        amz_date = datetime.datetime.utcnow().strftime("%Y%m%dT%H%M%SZ")
+        headers = {"host": self.host, "x-amz-date": amz_date, "x-amz-content-sha256": payload_hash, **(extra or {})}
+        signature, signed = sigv4_signature(
+            self.secret_key, self.region, amz_date, method, path, query or {}, headers, payload_hash
+        )
+        headers["Authorization"] = (
+            f"AWS4-HMAC-SHA256 Credential={self.access_key}/{amz_date[:8]}/{self.region}/s3/aws4_request, "
+            f"SignedHeaders={signed}, Signature={signature}"
+        )
+        del headers["host"]  # httpx sets it from the URL
+        return headers
+
+    async def _request(self, method: str, key: str, data: bytes = b"",
+                       extra: Optional[Dict[str, str]] = None, stream: bool = False) -> httpx.Response:
+        path = self._object_path(key)
+        headers = self._signed_headers(method, path, sha256_hex(data), extra)
+        request = self._client.build_request(method, f"{self.endpoint_url}{path}", content=data or None, headers=headers)
+        return await self._client.send(request, stream=stream)
+
+    async def put(self, key, data, content_type="application/octet-stream", cache_control=None):
+        extra = {"content-type": content_type}
+        if cache_control:
+            extra["cache-control"] = cache_control
+        response = await self._request("PUT", key, data, extra)
+        response.raise_for_status()
+
+    async def get(self, key):
+        response = await self._request("GET", key)
+        if response.status_code == 404:
+            return None
+        response.raise_for_status()
+        return response.content
+
+    async def stream(self, key, chunk_size=CHUNK_SIZE):
+        response = await self._request("GET", key, stream=True)
+        try:
+            if response.status_code == 404:
+                raise FileNotFoundError(key)
+            response.raise_for_status()
+            async for chunk in response.aiter_bytes(chunk_size):
+                yield chunk
+        finally:
+            await response.aclose()
+
+    async def exists(self, key):
+        response = await self._request("HEAD", key)
+        if response.status_code == 404:
+            return False
+        response.raise_for_status()
+        return True
+
+    async def delete(self, key):
+        # S3 answers 204 whether or not the key existed
+        existed = await self.exists(key)
+        response = await self._request("DELETE", key)
+        response.raise_for_status()
+        return existed
+
+    async def list_objects(self, prefix=""):
+        full_prefix = f"{self.prefix}/{prefix}" if self.prefix else prefix
+        path = quote(f"/{self.bucket}", safe="/-_.~")
+        query = {"list-type": "2", "prefix": full_prefix, "max-keys": str(LIST_PAGE_SIZE)}
+        while True:
+            headers = self._signed_headers("GET", path, sha256_hex(b""), query=query)
+            encoded = "&".join(f"{quote(k, safe='-_.~')}={quote(v, safe='-_.~')}" for k, v in sorted(query.items()))
+            response = await self._client.get(f"{self.endpoint_url}{path}?{encoded}", headers=headers)
+            response.raise_for_status()
+            root = ElementTree.fromstring(response.content)
+            # Results are namespaced on AWS but not on every compatible store
+            namespace = root.tag[:root.tag.index("}") + 1] if root.tag.startswith("{") else ""
+            page = []
+            for item in root.iter(f"{namespace}Contents"):
+                key = item.findtext(f"{namespace}Key", "")
+                modified = item.findtext(f"{namespace}LastModified", "")
+                if self.prefix:
+                    key = key[len(self.prefix) + 1:]
+                page.append((key, datetime.datetime.strptime(modified[:19], "%Y-%m-%dT%H:%M:%S")))
+            if page:
+                yield page
+            token = root.findtext(f"{namespace}NextContinuationToken")
+            if root.findtext(f"{namespace}IsTruncated") != "true" or not token:
+                break
+            query["continuation-token"] = token
+
+    def presign(self, key, expires_in, issued_at=None):
+        issued_at = issued_at or datetime.datetime.utcnow()
+        amz_date = issued_at.strftime("%Y%m%dT%H%M%SZ")
+        path = self._object_path(key)
+        query = {
+            "X-Amz-Algorithm": "AWS4-HMAC-SHA256",
+            "X-Amz-Credential": f"{self.access_key}/{amz_date[:8]}/{self.region}/s3/aws4_request",
+            "X-Amz-Date": amz_date,
+            # S3 rejects presigned URLs valid for more than seven days
+            "X-Amz-Expires": str(min(expires_in, 7 * 24 * 3600)),
+            "X-Amz-SignedHeaders": "host"
+        }
+        signature, _ = sigv4_signature(
+            self.secret_key, self.region, amz_date, "GET", path, query, {"host": self.host}, "UNSIGNED-PAYLOAD"
+        )
+        return f"{self.endpoint_url}{path}?{urlencode({**query, 'X-Amz-Signature': signature})}"
+
+    def uri(self, key):
+        full_key = f"{self.prefix}/{key}" if self.prefix else key
+        return f"s3://{self.bucket}/{full_key}"
+
+    async def close(self):
+        await self._client.aclose()
+
+def create_image_store() -> ImageStore:
+    """Build the backend selected by STORAGE_BACKEND"""
+    if settings.STORAGE_BACKEND == "s3":
+        return S3ImageStore(
+            endpoint_url=settings.S3_ENDPOINT_URL,
+            bucket=settings.S3_BUCKET,
+            access_key=settings.S3_ACCESS_KEY_ID,
+            secret_key=settings.S3_SECRET_ACCESS_KEY,
+            region=settings.S3_REGION,
+            prefix=settings.S3_PREFIX
+        )
+    if settings.STORAGE_BACKEND != "local":
+        raise ValueError(f"Unknown STORAGE_BACKEND: {settings.STORAGE_BACKEND}")
+    return LocalImageStore(IMAGES_DIR)
+
+_image_store: Optional[ImageStore] = None
+
+def get_image_store() -> ImageStore:
+    global _image_store
+    if _image_store is None:
+        _image_store = create_image_store()
+    return _image_store
+
+async def close_image_store():
+    global _image_store
+    if _image_store is not None:
+        await _image_store.close()
+        _image_store = None
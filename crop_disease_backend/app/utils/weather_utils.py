@@ -1,23 +1,100 @@
 # weather_utils.py
-import requests
-from typing import Dict, Any, Optional
+import asyncio
+import time
+from collections import OrderedDict
+import httpx
+import numpy as np
+from typing import Awaitable, Callable, Dict, Any, Optional, Tuple
 from app.config import settings
 from app.models.advisory import WeatherAdvice
 import logging
 
 logger = logging.getLogger(__name__)
 
-async def get_weather_data(region: str) -> Optional[Dict[str, Any]]:
-    """Get weather data from API or return dummy data"""
-    if not settings.WEATHER_API_KEY:
-        # Return dummy weather data
-        return {
-            "temperature": 25.5,
-            "humidity": 65,
-            "weather_condition": "partly_cloudy",
-            "region": region
-        }
+_http_client: Optional[httpx.AsyncClient] = None
+
+def get_http_client() -> httpx.AsyncClient:
+    """Shared pooled HTTP client for weather requests"""
+    global _http_client
+    if _http_client is None or _http_client.is_closed:
+        _http_client = httpx.AsyncClient(
+            timeout=settings.WEATHER_HTTP_TIMEOUT,
+            limits=httpx.Limits(
+                max_connections=settings.WEATHER_MAX_CONNECTIONS,
+                max_keepalive_connections=settings.WEATHER_MAX_CONNECTIONS
+            )
+        )
+    return _http_client
+
+async def close_weather_client():
+    """Close the shared HTTP client"""
+    global _http_client
+    if _http_client is not None:
+        await _http_client.aclose()
+        _http_client = None
+
+def normalize_region(region: str) -> str:
+    """Cache key for a region name ("  New  Delhi " -> "new delhi")"""
+    return " ".join(region.split()).lower()
+
+class WeatherCache:
+    """
+    Per-region TTL cache with stale-while-revalidate and single-flight fetches.
+    Concurrent misses for the same region share one outbound request.
+    """
+    def __init__(self, ttl: float, stale_ttl: float, max_entries: int):
+        self.ttl = ttl
+        self.stale_ttl = stale_ttl
+        self.max_entries = max_entries
+        self._entries: "OrderedDict[str, Tuple[Dict[str, Any], float]]" = OrderedDict()
+        self._inflight: Dict[str, asyncio.Task] = {}
+    
+    def clear(self):
+        self._entries.clear()
     
+    def _store(self, key: str, data: Dict[str, Any]):
+        self._entries[key] = (data, time.monotonic())
+        self._entries.move_to_end(key)
+        while len(self._entries) > self.max_entries:
+            self._entries.popitem(last=False)
+    
+    def _fetch(self, key: str, fetch: Callable[[], Awaitable[Optional[Dict[str, Any]]]]) -> asyncio.Task:
+        task = self._inflight.get(key)
+        if task is None:
+            async def run():
+                try:
+                    data = await fetch()
+                    if data is not None:
+                        self._store(key, data)
+                    return data
+                finally:
+                    self._inflight.pop(key, None)
+            task = asyncio.ensure_future(run())
+            self._inflight[key] = task
+        return task
+    
+    async def get(self, key: str, fetch: Callable[[], Awaitable[Optional[Dict[str, Any]]]]) -> Optional[Dict[str, Any]]:
+        entry = self._entries.get(key)
+        if entry is not None:
+            data, fetched_at = entry
+            age = time.monotonic() - fetched_at
+            if age < self.ttl:
+                return data
+            if age < self.ttl + self.stale_ttl:
+                # Serve stale and refresh in the background
+                self._fetch(key, fetch)
+                return data
+        # shield() so a cancelled caller does not cancel the shared fetch
+        return await asyncio.shield(self._fetch(key, fetch))
+
+weather_cache = WeatherCache(
+    ttl=settings.WEATHER_CACHE_TTL_SECONDS,
+    stale_ttl=settings.WEATHER_CACHE_STALE_SECONDS,
+    max_entries=settings.WEATHER_CACHE_MAX_REGIONS
+)
+
+async def _fetch_weather_data(region: str) -> Optional[Dict[str, Any]]:
+    """Fetch current weather for a region from the weather API"""
     try:
         url = f"{settings.WEATHER_API_URL}"
         params = {
@@ -26,7 +103,7 @@ async def get_weather_data(region: str) -> Optional[Dict[str, Any]]:
             "units": "metric"
         }
         
-        response = requests.get(url, params=params, timeout=5)
+        response = await get_http_client().get(url, params=params)
         response.raise_for_status()
         
         data = response.json()
@@ -40,6 +117,59 @@ async def get_weather_data(region: str) -> Optional[Dict[str, Any]]:
         logger.error(f"Error fetching weather data: {e}")
         return None
 
+async def get_weather_data(region: str) -> Optional[Dict[str, Any]]:
+    """Get weather data from API or return dummy data"""
+    if not settings.WEATHER_API_KEY:
+        # Return dummy weather data
+        return {
+            "temperature": 25.5,
+            "humidity": 65,
+            "weather_condition": "partly_cloudy",
+            "region": region
+        }
+    
+    data = await weather_cache.get(normalize_region(region), lambda: _fetch_weather_data(region))
+    if data is None:
+        return None
+    # The cached entry may have been fetched under another spelling of the region
+    return {**data, "region": region}
+
+# Advice tables indexed by band: 0 = high, 1 = low, 2 = normal
+TEMPERATURE_ADVICE = (
+    {
+        "planting_advice": "High temperature detected. Consider planting heat-resistant varieties.",
+        "irrigation_advice": "Increase watering frequency due to high temperature."
+    },
+    {
+        "planting_advice": "Low temperature. Consider using greenhouse or wait for warmer weather.",
+        "irrigation_advice": "Reduce watering as evaporation is low in cool weather."
+    },
+    {
+        "planting_advice": "Good temperature for most crops. Proceed with normal planting.",
+        "irrigation_advice": "Maintain regular watering schedule."
+    }
+)
+
+HUMIDITY_ADVICE = (
+    {
+        "pest_risk": "High risk of fungal diseases and pests due to high humidity. Monitor crops closely.",
+        "humidity_advice": "Humidity is very high. Watch for fungal diseases and avoid overwatering."
+    },
+    {
+        "pest_risk": "Low risk of pests, but plants may be stressed by low humidity.",
+        "humidity_advice": "Humidity is low. Plants may need extra irrigation."
+    },
+    {
+        "pest_risk": "Low risk of pest activity under current humidity conditions.",
+        "humidity_advice": "Humidity levels are good for crop growth."
+    }
+)
+
+HIGH_TEMPERATURE = 30
+LOW_TEMPERATURE = 15
+HIGH_HUMIDITY = 80
+LOW_HUMIDITY = 40
+
 def generate_weather_advice(weather_data: Dict[str, Any]) -> WeatherAdvice:
     """Generate weather-based agricultural advice"""
     temp = weather_data["temperature"]
@@ -47,37 +177,37 @@ def generate_weather_advice(weather_data: Dict[str, Any]) -> WeatherAdvice:
     condition = weather_data["weather_condition"]
     
     # Generate advice based on weather conditions
-    if temp > 30:
-        planting_advice = "High temperature detected. Consider planting heat-resistant varieties."
-        irrigation_advice = "Increase watering frequency due to high temperature."
-    elif temp < 15:
-        planting_advice = "Low temperature. Consider using greenhouse or wait for warmer weather."
-        irrigation_advice = "Reduce watering as evaporation is low in cool weather."
-    else:
-        planting_advice = "Good temperature for most crops. Proceed with normal planting."
-        irrigation_advice = "Maintain regular watering schedule."
-    
-    if humidity > 80:
-        pest_risk = "High risk of fungal diseases and pests due to high humidity. Monitor crops closely."
-    elif humidity < 40:
-        pest_risk = "Low risk of pests, but plants may be stressed by low humidity."
+    if temp > HIGH_TEMPERATURE:
+        temperature_advice = TEMPERATURE_ADVICE[0]
+    elif temp < LOW_TEMPERATURE:
+        temperature_advice = TEMPERATURE_ADVICE[1]
     else:
-        pest_risk = "Low risk of pest activity under current humidity conditions."
+        temperature_advice = TEMPERATURE_ADVICE[2]
     
-    # Humidity advice
-    if humidity > 80:
-        humidity_advice = "Humidity is very high. Watch for fungal diseases and avoid overwatering."
-    elif humidity < 40:
-        humidity_advice = "Humidity is low. Plants may need extra irrigation."
+    if humidity > HIGH_HUMIDITY:
+        humidity_advice = HUMIDITY_ADVICE[0]
+    elif humidity < LOW_HUMIDITY:
+        humidity_advice = HUMIDITY_ADVICE[1]
     else:
-        humidity_advice = "Humidity levels are good for crop growth."
+        humidity_advice = HUMIDITY_ADVICE[2]
 
     return WeatherAdvice(
         temperature=temp,
         humidity=humidity,
         weather_condition=condition,
-        planting_advice=planting_advice,
-        irrigation_advice=irrigation_advice,
-        pest_risk=pest_risk,
-        humidity_advice=humidity_advice
-    )
\ No newline at end of file
+        **temperature_advice,
+        **humidity_advice
+    )
+
+def weather_bands(temperatures: np.ndarray, humidities: np.ndarray) -> Tuple[np.ndarray, np.ndarray]:
+    """
+    Vectorized form of the rules in generate_weather_advice.
+    Returns band indices into TEMPERATURE_ADVICE and HUMIDITY_ADVICE.
+    """
+    temperature_band = np.select(
+        [temperatures > HIGH_TEMPERATURE, temperatures < LOW_TEMPERATURE], [0, 1], default=2
+    )
+    humidity_band = np.select(
+        [humidities > HIGH_HUMIDITY, humidities < LOW_HUMIDITY], [0, 1], default=2
+    )
+    return temperature_band, humidity_band
@@ -0,0 +1,65 @@
+# images.py
+"""Synthetic crop-photo corpus for benchmarks (no binary fixtures in the repo)"""
+import io
+from typing import List, Tuple
+import numpy as np
+from PIL import Image
+
+# (width, height, format) roughly matching what farmers upload: phone photos,
+# downscaled shares from messaging apps and occasional PNG screenshots
+DEFAULT_PROFILES: List[Tuple[int, int, str]] = [
+    (4000, 3000, "JPEG"),
+    (1600, 1200, "JPEG"),
+    (1280, 960, "JPEG"),
+    (800, 600, "JPEG"),
+    (1080, 1920, "PNG"),
+]
+
+def leaf_image(width: int, height: int, seed: int = 0) -> Image.Image:
+    """A leaf-coloured image with lesion-like blotches and sensor noise"""
+    rng = np.random.default_rng(seed)
+    # Work on a small canvas and upscale; full-resolution noise is unrealistically incompressible
+    small_w, small_h = max(8, width // 8), max(8, height // 8)
+    base = np.empty((small_h, small_w, 3), dtype=np.float32)
+    base[..., 0] = rng.uniform(30, 70)
+    base[..., 1] = rng.uniform(100, 160)
+    base[..., 2] = rng.uniform(30, 60)
+    
+    yy, xx = np.mgrid[0:small_h, 0:small_w]
+    for _ in range(rng.integers(3, 12)):
+        cy, cx = rng.uniform(0, small_h), rng.uniform(0, small_w)
+        radius = rng.uniform(2, max(3, min(small_w, small_h) / 6))
+        mask = ((yy - cy) ** 2 + (xx - cx) ** 2) < radius ** 2
+        base[mask] = rng.uniform([90, 60, 20], [140, 100, 50])
+    
+    base += rng.normal(0, 6, base.shape)
+    image = Image.fromarray(np.clip(base, 0, 255).astype(np.uint8), "RGB")
+    image = image.resize((width, height), Image.Resampling.BILINEAR)
+    noise = rng.normal(0, 3, (height, width, 3))
+    return Image.fromarray(np.clip(np.asarray(image) + noise, 0, 255).astype(np.uint8), "RGB")
+
+def encode(image: Image.Image, fmt: str, quality: int = 90) -> bytes:
+    buffer = io.BytesIO()
+    if fmt == "JPEG":
+        image.save(buffer, format="JPEG", quality=quality)
+    else:
+        image.save(buffer, format=fmt)
+    return buffer.getvalue()
+
+def build_corpus(count: int = 10, profiles: List[Tuple[int, int, str]] = DEFAULT_PROFILES,
+                 max_bytes: int = 5 * 1024 * 1024) -> List[Tuple[str, bytes, str]]:
+    """
+    (filename, content, content_type) tuples cycling through the profiles.
+    Images above max_bytes (the upload limit) are re-encoded at lower quality.
+    """
+    corpus = []
+    for i in range(count):
+        width, height, fmt = profiles[i % len(profiles)]
+        image = leaf_image(width, height, seed=i)
+        data = encode(image, fmt)
+        if len(data) > max_bytes:
+            fmt = "JPEG"
+            data = encode(image, fmt, quality=70)
+        extension = ".jpg" if fmt == "JPEG" else ".png"
+        corpus.append((f"leaf_{i}{extension}", data, "image/jpeg" if fmt == "JPEG" else "image/png"))
+    return corpus
@@ -0,0 +1,363 @@
+# loadtest.py
+"""
+End-to-end load test for the API.
+
+By default it starts the fake external services and the backend (with the
+in-memory database) as local subprocesses, then drives a weighted mix of
+endpoints through a series of concurrency stages:
+
+    python -m benchmarks.loadtest --stages 1,5,10,25 --stage-seconds 20
+
+Use --base-url to target an already running server instead. Results are
+reported per stage and endpoint (p50/p95/p99 latency, throughput, error
+rate). --save-baseline stores them as JSON; --compare checks a run against
+a stored baseline and exits non-zero on a regression.
+"""
+import argparse
+import asyncio
+import json
+import os
+import random
+import shutil
+import socket
+import subprocess
+import sys
+import tempfile
+import time
+import uuid
+from typing import Any, Dict, List, Optional, Tuple
+import httpx
+from benchmarks.images import build_corpus
+
+BACKEND_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+DEFAULT_BASELINE = os.path.join(BACKEND_DIR, "benchmarks", "baselines", "loadtest.json")
+
+CROPS = ["tomato", "potato", "corn", "wheat", "rice"]
+DISEASES = ["Early_Blight", "Late_Blight", "Bacterial_Spot", "Powdery_Mildew"]
+
+# Relative frequency of each action in the per-user loop
+DEFAULT_MIX = {
+    "POST /disease/predict": 2,
+    "GET /disease/history": 4,
+    "GET /disease/diagnosis/{id}": 2,
+    "GET /disease/statistics": 2,
+    "GET /dashboard/statistics": 1,
+    "GET /advisory/disease/{name}": 2,
+    "GET /advisory/list": 1,
+    "GET /advisory/weather": 2,
+    "POST /auth/login": 1,
+}
+
+def percentile(ordered: List[float], p: float) -> float:
+    if not ordered:
+        return 0.0
+    return ordered[min(len(ordered) - 1, int(p * len(ordered)))]
+
+class Recorder:
+    """
+    Latency samples and error counts per endpoint. Throughput only counts
+    requests completed before the deadline, so the drain of requests still
+    in flight when a stage ends does not dilute it.
+    """
+    def __init__(self, deadline: float = float("inf")):
+        self.deadline = deadline
+        self.samples: Dict[str, List[float]] = {}
+        self.errors: Dict[str, int] = {}
+        self.completed: Dict[str, int] = {}
+
+    def record(self, endpoint: str, elapsed_ms: float, ok: bool):
+        self.samples.setdefault(endpoint, []).append(elapsed_ms)
+        if time.perf_counter() <= self.deadline:
+            self.completed[endpoint] = self.completed.get(endpoint, 0) + 1
+        if not ok:
+            self.errors[endpoint] = self.errors.get(endpoint, 0) + 1
+
+    def summary(self, window: float) -> Dict[str, Dict[str, float]]:
+        result = {}
+        for endpoint, samples in sorted(self.samples.items()):
+            ordered = sorted(samples)
+            errors = self.errors.get(endpoint, 0)
+            result[endpoint] = {
+                "requests": len(ordered),
+                "throughput_rps": round(self.completed.get(endpoint, 0) / window, 2) if window else 0.0,
+                "error_rate": round(errors / len(ordered), 4),
+                "p50_ms": round(percentile(ordered, 0.50), 2),
+                "p95_ms": round(percentile(ordered, 0.95), 2),
+                "p99_ms": round(percentile(ordered, 0.99), 2),
+            }
+        return result
+
+class VirtualUser:
+    """One farmer session: logs in once, then performs weighted random actions"""
+    def __init__(self, client: httpx.AsyncClient, recorder: Recorder, corpus: List[Tuple[str, bytes, str]],
+                 credentials: Dict[str, str], mix: Dict[str, int], rng: random.Random):
+        self.client = client
+        self.recorder = recorder
+        self.corpus = corpus
+        self.credentials = credentials
+        self.rng = rng
+        self.actions = list(mix)
+        self.weights = list(mix.values())
+        self.headers: Dict[str, str] = {}
+        self.diagnosis_ids: List[str] = []
+
+    async def request(self, endpoint: str, method: str, url: str, **kwargs) -> Optional[httpx.Response]:
+        start = time.perf_counter()
+        try:
+            response = await self.client.request(method, url, headers=self.headers, **kwargs)
+            ok = response.status_code < 400
+        except httpx.HTTPError:
+            response, ok = None, False
+        self.recorder.record(endpoint, (time.perf_counter() - start) * 1000, ok)
+        return response
+
+    async def login(self):
+        response = await self.request("POST /auth/login", "POST", "/auth/login", json=self.credentials)
+        if response is not None and response.status_code == 200:
+            self.headers = {"Authorization": f"Bearer {response.json()['access_token']}"}
+
+    async def step(self):
+        action = self.rng.choices(self.actions, self.weights)[0]
+        if action == "POST /auth/login":
+            await self.login()
+        elif action == "POST /disease/predict":
+            filename, content, content_type = self.rng.choice(self.corpus)
+            response = await self.request(
+                action, "POST", "/disease/predict",
+                files={"file": (filename, content, content_type)},
+                data={"crop_type": self.rng.choice(CROPS)}
+            )
+            if response is not None and response.status_code == 200:
+                self.diagnosis_ids.append(response.json().get("_id"))
+        elif action == "GET /disease/diagnosis/{id}":
+            if not self.diagnosis_ids:
+                return
+            await self.request(action, "GET", f"/disease/diagnosis/{self.rng.choice(self.diagnosis_ids)}")
+        elif action == "GET /advisory/disease/{name}":
+            await self.request(
+                action, "GET", f"/advisory/disease/{self.rng.choice(DISEASES)}",
+                params={"crop_type": self.rng.choice(CROPS)}
+            )
+        else:
+            method, path = action.split(" ", 1)
+            await self.request(action, method, path)
+
+async def register_users(client: httpx.AsyncClient, count: int, run_id: str) -> List[Dict[str, str]]:
+    users = []
+    for i in range(count):
+        user = {
+            "name": f"Load Test {i}",
+            "email": f"load-{run_id}-{i}@example.com",
+            "phone_number": f"+91{9000000000 + i}",
+            "region": ["Punjab", "Kerala", "Maharashtra", "Bihar"][i % 4],
+            "password": "LoadTest123",
+        }
+        response = await client.post("/auth/register", json=user)
+        if response.status_code != 200:
+            raise RuntimeError(f"Could not register load-test user: {response.status_code} {response.text}")
+        users.append({"email": user["email"], "password": user["password"]})
+    return users
+
+async def run_stage(client: httpx.AsyncClient, users: List[Dict[str, str]], corpus, concurrency: int,
+                    seconds: float, mix: Dict[str, int], seed: int) -> Dict[str, Any]:
+    # Sessions log in before the clock starts: one bcrypt verification per
+    # virtual user would otherwise make every stage's cost grow with concurrency
+    virtual_users = [
+        VirtualUser(client, Recorder(), corpus, users[index % len(users)], mix, random.Random(seed + index))
+        for index in range(concurrency)
+    ]
+    await asyncio.gather(*(user.login() for user in virtual_users))
+    deadline = time.perf_counter() + seconds
+    recorder = Recorder(deadline)
+
+    async def worker(user: VirtualUser):
+        user.recorder = recorder
+        while time.perf_counter() < deadline:
+            await user.step()
+
+    started = time.perf_counter()
+    await asyncio.gather(*(worker(user) for user in virtual_users))
+    duration = time.perf_counter() - started
+    endpoints = recorder.summary(seconds)
+    total = sum(e["requests"] for e in endpoints.values())
+    errors = sum(recorder.errors.values())
+    return {
+        "concurrency": concurrency,
+        "duration_s": round(duration, 2),
+        "total_requests": total,
+        "throughput_rps": round(sum(recorder.completed.values()) / seconds, 2) if seconds else 0.0,
+        "error_rate": round(errors / total, 4) if total else 0.0,
+        "endpoints": endpoints,
+    }
+
+def free_port() -> int:
+    with socket.socket() as s:
+        s.bind(("127.0.0.1", 0))
+        return s.getsockname()[1]
+
+def wait_for(url: str, timeout: float = 30.0):
+    deadline = time.time() + timeout
+    while time.time() < deadline:
+        try:
+            if httpx.get(url, timeout=1.0).status_code < 500:
+                return
+        except httpx.HTTPError:
+            pass
+        time.sleep(0.2)
+    raise RuntimeError(f"Timed out waiting for {url}")
+
+def start_local_stack(args, workdir: str) -> Tuple[str, List[subprocess.Popen]]:
+    """Start fake services and the backend (memory database, uploads under workdir) as subprocesses"""
+    fake_port, api_port = free_port(), free_port()
+    fakes_url = f"http://127.0.0.1:{fake_port}"
+    processes = [subprocess.Popen(
+        [sys.executable, "-m", "app.testing.fake_services", "--port", str(fake_port),
+         "--latency-ms", str(args.provider_latency_ms), "--error-rate", str(args.provider_error_rate),
+         "--seed", str(args.seed)],
+        cwd=BACKEND_DIR, env={**os.environ, "SECRET_KEY": os.getenv("SECRET_KEY", "load-test-secret")}
+    )]
+    wait_for(f"{fakes_url}/stats")
+
+    env = {
+        **os.environ,
+        "SECRET_KEY": os.getenv("SECRET_KEY", "load-test-secret"),
+        "ENVIRONMENT": "benchmark",
+        "DATABASE_BACKEND": "memory",
+        "UPLOAD_DIR": os.path.join(workdir, "images"),
+        "RESUMABLE_UPLOAD_DIR": os.path.join(workdir, "partial"),
+        "KINDWISE_API_KEY": "fake",
+        "KINDWISE_API_URL": f"{fakes_url}/kindwise/api/v1",
+        "GEMINI_API_KEY": "fake",
+        "GEMINI_API_ENDPOINT": f"{fakes_url}/gemini",
+        "WEATHER_API_KEY": "fake",
+        "WEATHER_API_URL": f"{fakes_url}/weather",
+    }
+    processes.append(subprocess.Popen(
+        [sys.executable, "-m", "uvicorn", "app.main:app", "--port", str(api_port),
+         "--log-level", "warning", "--no-access-log"],
+        cwd=BACKEND_DIR, env=env, stdout=subprocess.DEVNULL
+    ))
+    base_url = f"http://127.0.0.1:{api_port}"
+    wait_for(f"{base_url}/health")
+    return base_url, processes
+
+def compare(results: Dict[str, Any], baseline: Dict[str, Any], tolerance: float) -> List[str]:
+    """Regressions of p95 latency or error rate beyond tolerance, per stage and endpoint"""
+    regressions = []
+    baseline_stages = {s["concurrency"]: s for s in baseline.get("stages", [])}
+    for stage in results["stages"]:
+        reference = baseline_stages.get(stage["concurrency"])
+        if not reference:
+            continue
+        for endpoint, current in stage["endpoints"].items():
+            previous = reference["endpoints"].get(endpoint)
+            if not previous or not previous["p95_ms"]:
+                continue
+            if current["p95_ms"] > previous["p95_ms"] * (1 + tolerance):
+                regressions.append(
+                    f"c={stage['concurrency']} {endpoint}: p95 {previous['p95_ms']}ms -> {current['p95_ms']}ms"
+                )
+            if current["error_rate"] > previous["error_rate"] + 0.01:
+                regressions.append(
+                    f"c={stage['concurrency']} {endpoint}: error rate {previous['error_rate']} -> {current['error_rate']}"
+                )
+    return regressions
+
+def print_report(results: Dict[str, Any]):
+    for stage in results["stages"]:
+        print(f"\nconcurrency={stage['concurrency']}  {stage['total_requests']} requests in "
+              f"{stage['duration_s']}s  {stage['throughput_rps']} req/s  error rate {stage['error_rate']:.2%}")
+        print(f"  {'endpoint':34} {'reqs':>6} {'rps':>8} {'err':>7} {'p50':>9} {'p95':>9} {'p99':>9}")
+        for endpoint, e in stage["endpoints"].items():
+            print(f"  {endpoint:34} {e['requests']:>6} {e['throughput_rps']:>8} {e['error_rate']:>7.2%} "
+                  f"{e['p50_ms']:>7}ms {e['p95_ms']:>7}ms {e['p99_ms']:>7}ms")
+
+async def run(args) -> Dict[str, Any]:
+    corpus = build_corpus(args.images)
+    limits = httpx.Limits(max_connections=max(args.stages) * 2)
+    async with httpx.AsyncClient(base_url=args.base_url, timeout=args.timeout, limits=limits) as client:
+        users = await register_users(client, args.users, uuid.uuid4().hex[:8])
+        stages = []
+        for concurrency in args.stages:
+            stage = await run_stage(client, users, corpus, concurrency, args.stage_seconds, DEFAULT_MIX, args.seed)
+            stages.append(stage)
+    return {
+        "config": {
+            "stages": args.stages,
+            "stage_seconds": args.stage_seconds,
+            "users": args.users,
+            "images": args.images,
+            "provider_latency_ms": args.provider_latency_ms,
+            "provider_error_rate": args.provider_error_rate,
+            "target": "external" if args.external else "local",
+            # The local stack shares these CPUs with the load generator
+            "cpu_count": os.cpu_count(),
+        },
+        "created_at": time.strftime("%Y-%m-%dT%H:%M:%SZ", time.gmtime()),
+        "stages": stages,
+    }
+
+def main():
+    parser = argparse.ArgumentParser(description="Load test the crop disease API")
+    parser.add_argument("--base-url", help="Target an already running server instead of a local stack")
+    parser.add_argument("--stages", default="1,5,10,25", help="Comma-separated concurrency levels")
+    parser.add_argument("--stage-seconds", type=float, default=20.0)
+    parser.add_argument("--users", type=int, default=20, help="Distinct accounts to register")
+    parser.add_argument("--images", type=int, default=10, help="Size of the synthetic image corpus")
+    parser.add_argument("--timeout", type=float, default=60.0)
+    parser.add_argument("--provider-latency-ms", type=float, default=300.0, help="Median fake provider latency")
+    parser.add_argument("--provider-error-rate", type=float, default=0.0)
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--output", help="Write full results as JSON")
+    parser.add_argument("--save-baseline", nargs="?", const=DEFAULT_BASELINE, help="Store results as baseline")
+    parser.add_argument("--compare", nargs="?", const=DEFAULT_BASELINE, help="Compare against a baseline")
+    parser.add_argument("--tolerance", type=float, default=0.25, help="Allowed relative p95 regression")
+    args = parser.parse_args()
+    args.stages = [int(s) for s in args.stages.split(",")]
+    args.external = bool(args.base_url)
+
+    processes: List[subprocess.Popen] = []
+    workdir = None
+    try:
+        if not args.base_url:
+            # Nothing in the memory database refers to the uploads once it is gone
+            workdir = tempfile.mkdtemp(prefix="loadtest-")
+            args.base_url, processes = start_local_stack(args, workdir)
+        results = asyncio.run(run(args))
+    finally:
+        for process in processes:
+            process.terminate()
+        for process in processes:
+            process.wait()
+        if workdir:
+            shutil.rmtree(workdir, ignore_errors=True)
+
+    print_report(results)
+    failed = False
+    if args.save_baseline and args.provider_error_rate == 0 and any(s["error_rate"] for s in results["stages"]):
+        # --compare only flags error rates above the baseline's; errors stored
+        # here would pass as normal from then on
+        print("\nNot saving a baseline with errors while the fake providers inject none")
+        args.save_baseline = None
+        failed = True
+    for path in filter(None, [args.output, args.save_baseline]):
+        os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+        with open(path, "w") as f:
+            json.dump(results, f, indent=2)
+        print(f"\nResults written to {path}")
+
+    if args.compare:
+        with open(args.compare) as f:
+            regressions = compare(results, json.load(f), args.tolerance)
+        if regressions:
+            print("\nRegressions against baseline:")
+            for line in regressions:
+                print(f"  {line}")
+            failed = True
+        else:
+            print("\nNo regressions against baseline")
+    if failed:
+        sys.exit(1)
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,331 @@
+# micro.py
+"""
+Micro-benchmarks for the per-request hot paths: image preprocessing,
+ingest transcoding and encoding, JSON rendering of diagnosis documents, advisory parsing and
+validation, and weather advice.
+
+    python -m benchmarks.micro                        # run everything
+    python -m benchmarks.micro -k encode_image        # only matching cases
+    python -m benchmarks.micro --check                # fail on threshold / baseline regressions
+    python -m benchmarks.micro --save-baseline        # update benchmarks/baselines/micro.json
+    python -m benchmarks.micro --record               # append this run to the history file
+
+Every case is timed as the median of several repeats, each auto-calibrated
+to run for at least --min-time seconds. The baseline file holds the median
+of each case plus optional per-case "thresholds" (absolute ceilings in
+microseconds) that protect an optimisation once it has landed. --record
+appends results tagged with the current git commit to
+benchmarks/baselines/micro_history.jsonl so timings can be followed over
+commits.
+"""
+import argparse
+import datetime
+import fnmatch
+import json
+import os
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+from typing import Any, Callable, Dict, List, Optional, Tuple
+from bson import ObjectId
+from benchmarks.images import encode, leaf_image
+
+BACKEND_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+DEFAULT_BASELINE = os.path.join(BACKEND_DIR, "benchmarks", "baselines", "micro.json")
+DEFAULT_HISTORY = os.path.join(BACKEND_DIR, "benchmarks", "baselines", "micro_history.jsonl")
+
+# app.config refuses to load without a secret; none of the benchmarked code uses it
+os.environ.setdefault("SECRET_KEY", "micro-benchmark")
+
+# (label, width, height, format) for file-based cases
+IMAGE_FILES = [
+    ("4000x3000-jpeg", 4000, 3000, "JPEG"),
+    ("1280x960-jpeg", 1280, 960, "JPEG"),
+    ("1080x1920-png", 1080, 1920, "PNG"),
+]
+
+# (label, width, height) for in-memory cases, each run in several PIL modes
+IMAGE_SIZES = [
+    ("4000x3000", 4000, 3000),
+    ("1280x960", 1280, 960),
+    ("800x600", 800, 600),
+]
+IMAGE_MODES = ["RGB", "RGBA", "L", "P"]
+
+# A case is (name, setup); setup returns the zero-argument callable to time
+Case = Tuple[str, Callable[[], Callable[[], Any]]]
+
+def diagnosis_document(seed: int) -> Dict[str, Any]:
+    """A diagnosis as stored by the predict endpoint, including the raw Kindwise payload"""
+    suggestions = []
+    for rank in range(5):
+        suggestions.append({
+            "id": f"{seed:04x}{rank:02x}",
+            "name": f"Disease_{rank}",
+            "probability": round(0.9 / (rank + 1), 4),
+            "similar_images": [
+                {
+                    "id": f"img-{seed}-{rank}-{i}",
+                    "url": f"https://plant.id/media/images/{seed}{rank}{i}.jpg",
+                    "url_small": f"https://plant.id/media/images/{seed}{rank}{i}.small.jpg",
+                    "similarity": 0.5 + i / 10,
+                }
+                for i in range(2)
+            ],
+            "details": {
+                "local_name": f"Disease {rank}",
+                "description": "Fungal disease causing concentric brown rings on older leaves. " * 3,
+                "url": "https://en.wikipedia.org/wiki/Early_blight",
+                "treatment": {
+                    "chemical": ["Apply chlorothalonil", "Apply mancozeb"],
+                    "biological": ["Bacillus subtilis spray"],
+                    "prevention": ["Rotate crops", "Remove debris", "Avoid overhead watering"],
+                },
+                "classification": ["Fungi", "Ascomycota", "Dothideomycetes"],
+                "common_names": ["Target spot"],
+                "cause": "Alternaria solani",
+            },
+        })
+    return {
+        "_id": ObjectId(),
+        "user_id": ObjectId(),
+        "image_path": f"/srv/uploads/images/{seed:08x}.jpg",
+        "image_url": f"/uploads/images/{seed:08x}.jpg",
+        "crop_type": "tomato",
+        "predicted_disease": "Disease_0",
+        "confidence_score": 0.9,
+        "advisory_id": ObjectId(),
+        "kindwise_response": {
+            "disease_name": "Disease_0",
+            "confidence": 0.9,
+            "all_suggestions": [{"name": s["name"], "probability": s["probability"]} for s in suggestions],
+            "raw_response": {
+                "access_token": f"tok{seed:x}",
+                "status": "COMPLETED",
+                "result": {
+                    "disease": {"suggestions": suggestions},
+                    "is_plant": {"probability": 0.99, "binary": True},
+                    "is_healthy": {"probability": 0.05, "binary": False},
+                },
+            },
+        },
+        "created_at": datetime.datetime(2024, 1, 1) + datetime.timedelta(minutes=seed),
+    }
+
+def image_cases(workdir: str) -> List[Case]:
+    from PIL import Image
+    from app.utils.image_utils import preprocess_image
+    from app.utils.image_storage import transcode
+    from app.utils.kindwise_api import KindwiseAPI
+
+    cases: List[Case] = []
+    for label, width, height, fmt in IMAGE_FILES:
+        def setup(width=width, height=height, fmt=fmt, label=label):
+            path = os.path.join(workdir, f"{label}.{fmt.lower()}")
+            if not os.path.exists(path):
+                with open(path, "wb") as f:
+                    f.write(encode(leaf_image(width, height), fmt))
+            return lambda: preprocess_image(path)
+        cases.append((f"preprocess_image[{label}]", setup))
+
+    for label, width, height, fmt in IMAGE_FILES:
+        for store_format in ("webp", "jpeg"):
+            def setup(width=width, height=height, fmt=fmt, store_format=store_format):
+                data = encode(leaf_image(width, height), fmt)
+                return lambda: transcode(data, store_format, 2048, 82)
+            cases.append((f"transcode[{label}-{store_format}]", setup))
+
+    kindwise = KindwiseAPI()
+    for label, width, height in IMAGE_SIZES:
+        for mode in IMAGE_MODES:
+            def setup(width=width, height=height, mode=mode):
+                image = leaf_image(width, height)
+                if mode == "P":
+                    image = image.quantize(256)
+                elif mode != "RGB":
+                    image = image.convert(mode)
+                image.load()
+                assert isinstance(image, Image.Image)
+                return lambda: kindwise.encode_image(image)
+            cases.append((f"encode_image[{label}-{mode}]", setup))
+    return cases
+
+def serialization_cases() -> List[Case]:
+    from app.utils.mongo_utils import MongoJSONResponse
+
+    cases: List[Case] = []
+    for count in (1, 20, 100):
+        def setup(count=count):
+            documents = [diagnosis_document(i) for i in range(count)]
+            return lambda: MongoJSONResponse(documents).body
+        cases.append((f"mongo_json_response[{count}-docs]", setup))
+    return cases
+
+def advisory_cases() -> List[Case]:
+    from app.testing.fake_services import fake_advisory
+    from app.utils.gemini_utils import GeminiAPI
+
+    gemini = GeminiAPI.__new__(GeminiAPI)  # skip client configuration; only pure helpers are used
+    advisory = fake_advisory("Disease Detected: Early_Blight\nCrop Type: tomato")
+    fenced = "```json\n" + json.dumps(advisory, indent=4) + "\n```"
+    partial = {k: v for k, v in advisory.items() if k not in ("severity", "prevention_tips", "treatment_steps")}
+
+    def parse_and_validate(text: str):
+        return gemini._validate_advisory_structure(gemini._parse_advisory_json(text), "Early_Blight", "tomato")
+
+    return [
+        ("gemini_parse_advisory_json[fenced]", lambda: lambda: gemini._parse_advisory_json(fenced)),
+        ("gemini_validate_advisory[complete]",
+         lambda: lambda: gemini._validate_advisory_structure(advisory, "Early_Blight", "tomato")),
+        ("gemini_validate_advisory[partial]",
+         lambda: lambda: gemini._validate_advisory_structure(partial, "Early_Blight", "tomato")),
+        ("gemini_parse_and_validate[fenced]", lambda: lambda: parse_and_validate(fenced)),
+    ]
+
+def weather_cases() -> List[Case]:
+    from app.utils.weather_utils import generate_weather_advice
+
+    samples = [
+        {"temperature": t, "humidity": h, "weather_condition": "Clear"}
+        for t in (10.0, 22.0, 34.0) for h in (30, 60, 90)
+    ]
+
+    def run():
+        for sample in samples:
+            generate_weather_advice(sample)
+
+    return [("generate_weather_advice[9-bands]", lambda: run)]
+
+def all_cases(workdir: str) -> List[Case]:
+    return image_cases(workdir) + serialization_cases() + advisory_cases() + weather_cases()
+
+def measure(func: Callable[[], Any], min_time: float, repeats: int) -> Dict[str, float]:
+    """Median, min and spread of per-call time in microseconds"""
+    func()  # warm up caches and lazy imports
+    loops = 1
+    while True:
+        start = time.perf_counter()
+        for _ in range(loops):
+            func()
+        elapsed = time.perf_counter() - start
+        if elapsed >= min_time:
+            break
+        loops = max(loops * 2, int(loops * min_time / max(elapsed, 1e-9) * 1.1))
+
+    samples = [elapsed / loops]
+    for _ in range(repeats - 1):
+        start = time.perf_counter()
+        for _ in range(loops):
+            func()
+        samples.append((time.perf_counter() - start) / loops)
+    samples_us = [s * 1e6 for s in samples]
+    return {
+        "median_us": round(statistics.median(samples_us), 2),
+        "min_us": round(min(samples_us), 2),
+        "stdev_us": round(statistics.pstdev(samples_us), 2),
+        "loops": loops,
+    }
+
+def git_commit() -> Optional[str]:
+    try:
+        return subprocess.check_output(
+            ["git", "rev-parse", "--short", "HEAD"], cwd=BACKEND_DIR, stderr=subprocess.DEVNULL, text=True
+        ).strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+def check(results: Dict[str, Dict[str, float]], baseline: Dict[str, Any], tolerance: float) -> List[str]:
+    """Cases slower than their absolute threshold or than the baseline median beyond tolerance"""
+    failures = []
+    thresholds = baseline.get("thresholds", {})
+    reference = baseline.get("results", {})
+    for name, current in results.items():
+        limit = thresholds.get(name)
+        if limit is not None and current["median_us"] > limit:
+            failures.append(f"{name}: {current['median_us']}us exceeds threshold {limit}us")
+        previous = reference.get(name)
+        if previous and current["median_us"] > previous["median_us"] * (1 + tolerance):
+            failures.append(f"{name}: {previous['median_us']}us -> {current['median_us']}us")
+    return failures
+
+def print_report(results: Dict[str, Dict[str, float]], baseline: Optional[Dict[str, Any]]):
+    reference = (baseline or {}).get("results", {})
+    print(f"{'case':46} {'median':>12} {'min':>12} {'stdev':>10} {'vs base':>8}")
+    for name, r in results.items():
+        delta = ""
+        if name in reference and reference[name]["median_us"]:
+            delta = f"{r['median_us'] / reference[name]['median_us']:.2f}x"
+        print(f"{name:46} {r['median_us']:>10.1f}us {r['min_us']:>10.1f}us {r['stdev_us']:>8.1f}us {delta:>8}")
+
+def main():
+    parser = argparse.ArgumentParser(description="Micro-benchmarks for request hot paths")
+    parser.add_argument("-k", "--filter", help="Only run cases matching this glob (substring match if no wildcard)")
+    parser.add_argument("--min-time", type=float, default=0.2, help="Minimum seconds per repeat")
+    parser.add_argument("--repeats", type=int, default=5)
+    parser.add_argument("--baseline", default=DEFAULT_BASELINE)
+    parser.add_argument("--save-baseline", action="store_true", help="Store medians as the new baseline")
+    parser.add_argument("--set-thresholds", type=float, metavar="FACTOR",
+                        help="With --save-baseline, set each run case's threshold to FACTOR x its median")
+    parser.add_argument("--check", action="store_true", help="Exit non-zero on threshold or baseline regressions")
+    parser.add_argument("--tolerance", type=float, default=0.3, help="Allowed relative slowdown against baseline")
+    parser.add_argument("--record", nargs="?", const=DEFAULT_HISTORY, help="Append results to a history file")
+    parser.add_argument("--output", help="Write results as JSON")
+    args = parser.parse_args()
+
+    pattern = args.filter
+    if pattern and not any(c in pattern for c in "*?["):
+        pattern = f"*{pattern}*"
+
+    baseline = None
+    if os.path.exists(args.baseline):
+        with open(args.baseline) as f:
+            baseline = json.load(f)
+
+    results: Dict[str, Dict[str, float]] = {}
+    with tempfile.TemporaryDirectory() as workdir:
+        for name, setup in all_cases(workdir):
+            if pattern and not fnmatch.fnmatch(name, pattern):
+                continue
+            results[name] = measure(setup(), args.min_time, args.repeats)
+            print(f"  {name}: {results[name]['median_us']:.1f}us", file=sys.stderr)
+
+    print_report(results, baseline)
+    run = {
+        "commit": git_commit(),
+        "created_at": time.strftime("%Y-%m-%dT%H:%M:%SZ", time.gmtime()),
+        "python": sys.version.split()[0],
+        "results": results,
+    }
+
+    if args.output:
+        with open(args.output, "w") as f:
+            json.dump(run, f, indent=2)
+    if args.record:
+        with open(args.record, "a") as f:
+            f.write(json.dumps(run) + "\n")
+        print(f"\nAppended to {args.record}")
+    if args.save_baseline:
+        # Thresholds are curated by hand and survive baseline refreshes
+        run["thresholds"] = dict((baseline or {}).get("thresholds", {}))
+        if args.set_thresholds:
+            for name, r in results.items():
+                run["thresholds"][name] = round(r["median_us"] * args.set_thresholds, 1)
+        if baseline and pattern:
+            run["results"] = {**baseline.get("results", {}), **results}
+        with open(args.baseline, "w") as f:
+            json.dump(run, f, indent=2)
+        print(f"\nBaseline written to {args.baseline}")
+
+    if args.check:
+        failures = check(results, baseline or {}, args.tolerance)
+        if failures:
+            print("\nRegressions:")
+            for line in failures:
+                print(f"  {line}")
+            sys.exit(1)
+        print("\nNo regressions")
+
+if __name__ == "__main__":
+    main()
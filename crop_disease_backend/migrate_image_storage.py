@@ -0,0 +1,104 @@
+# migrate_image_storage.py
+"""
+Point existing diagnoses at the configured image store.
+
+Older diagnoses record an absolute file path (image_path) and no image_key.
+This sets image_key and rewrites image_path to the store URI; with --copy it
+also uploads the legacy file to the store (e.g. when moving to STORAGE_BACKEND=s3)
+and registers it in the images manifest.
+
+Usage:
+    python migrate_image_storage.py --dry-run
+    STORAGE_BACKEND=s3 S3_BUCKET=... python migrate_image_storage.py --copy
+"""
+import argparse
+import asyncio
+import os
+from datetime import datetime
+from app.database import connect_to_mongo, close_mongo_connection, get_database
+from app.utils.image_delivery import image_key, is_valid_key
+from app.utils.image_storage import IMMUTABLE_CACHE_CONTROL
+from app.utils.image_utils import IMAGES_DIR
+from app.utils.storage import get_image_store, close_image_store
+
+MEDIA_TYPES = {
+    ".jpg": "image/jpeg",
+    ".jpeg": "image/jpeg",
+    ".png": "image/png",
+    ".webp": "image/webp"
+}
+
+def legacy_file(doc: dict, key: str):
+    """Local file holding a diagnosis image, if any"""
+    for candidate in (doc.get("image_path"), os.path.join(IMAGES_DIR, *key.split("/"))):
+        if candidate and "://" not in candidate and os.path.isfile(candidate):
+            return candidate
+    return None
+
+async def migrate(copy: bool, dry_run: bool):
+    db = get_database()
+    store = get_image_store()
+    migrated = copied = missing = 0
+
+    cursor = db.diagnoses.find(
+        {"$or": [{"image_key": {"$exists": False}}, {"image_path": {"$not": {"$regex": "^[a-z0-9]+://"}}}]},
+        {"image_key": 1, "image_path": 1, "image_url": 1, "user_id": 1}
+    )
+    for doc in await cursor.to_list(length=None):
+        key = image_key(doc)
+        if not key or not is_valid_key(key):
+            print(f"skip {doc['_id']}: no usable image key")
+            continue
+
+        available = True
+        if copy and not await store.exists(key):
+            path = legacy_file(doc, key)
+            if path is None:
+                available = False
+                missing += 1
+                print(f"missing file for {doc['_id']} ({key})")
+            elif not dry_run:
+                with open(path, "rb") as f:
+                    data = f.read()
+                await store.put(
+                    key, data,
+                    content_type=MEDIA_TYPES.get(os.path.splitext(key)[1].lower(), "application/octet-stream"),
+                    cache_control=IMMUTABLE_CACHE_CONTROL
+                )
+                copied += 1
+
+        if not dry_run:
+            if copy and available:
+                await db.images.update_one(
+                    {"_id": key},
+                    {
+                        "$setOnInsert": {"uploaded_by": doc.get("user_id"), "created_at": datetime.utcnow()},
+                        "$set": {"last_referenced_at": datetime.utcnow()},
+                        "$inc": {"ref_count": 1}
+                    },
+                    upsert=True
+                )
+            await db.diagnoses.update_one(
+                {"_id": doc["_id"]},
+                {"$set": {"image_key": key, "image_path": store.uri(key)}}
+            )
+        migrated += 1
+
+    prefix = "would migrate" if dry_run else "migrated"
+    print(f"{prefix} {migrated} diagnoses, copied {copied} files, {missing} files missing")
+
+async def main():
+    parser = argparse.ArgumentParser(description="Migrate diagnosis images to the configured image store")
+    parser.add_argument("--copy", action="store_true", help="Upload legacy local files to the store")
+    parser.add_argument("--dry-run", action="store_true", help="Report what would change without writing")
+    args = parser.parse_args()
+
+    await connect_to_mongo()
+    try:
+        await migrate(args.copy, args.dry_run)
+    finally:
+        await close_image_store()
+        await close_mongo_connection()
+
+if __name__ == "__main__":
+    asyncio.run(main())
@@ -0,0 +1,73 @@
+# test_batch_delete.py
+"""
+Batch delete against the in-memory database, including a concurrent delete
+that removes one of the matched diagnoses between the find and the delete.
+
+    python -m pytest tests
+"""
+import asyncio
+import os
+from types import SimpleNamespace
+
+os.environ.setdefault("SECRET_KEY", "test")
+os.environ["DATABASE_BACKEND"] = "memory"
+
+from bson import ObjectId
+from fastapi import BackgroundTasks
+from app.controllers.disease_controller import DiseaseController
+from app.database import connect_to_mongo, get_database
+from app.models.diagnosis import DiagnosisBatchDelete
+
+USER = SimpleNamespace(id=ObjectId(), email="grower@example.com")
+SHARED_KEY = "ab/cd/shared.webp"
+
+async def seed(count: int):
+    """`count` diagnoses of USER all pointing at one image"""
+    await connect_to_mongo()
+    db = get_database()
+    ids = [ObjectId() for _ in range(count)]
+    await db.diagnoses.insert_many([
+        {"_id": i, "user_id": str(USER.id), "crop_type": "tomato", "image_key": SHARED_KEY} for i in ids
+    ])
+    await db.images.insert_one({"_id": SHARED_KEY, "ref_count": count})
+    return db, [str(i) for i in ids]
+
+def statuses(result):
+    return {status.id: status.status for status in result.results}
+
+def test_batch_delete_removes_and_releases_everything():
+    async def scenario():
+        db, ids = await seed(3)
+        result = await DiseaseController().delete_diagnoses(
+            DiagnosisBatchDelete(ids=ids), USER, BackgroundTasks()
+        )
+        assert result.deleted_count == 3
+        assert set(statuses(result).values()) == {"deleted"}
+        assert await db.diagnoses.count_documents({}) == 0
+        assert (await db.images.find_one({"_id": SHARED_KEY}))["ref_count"] == 0
+
+    asyncio.run(scenario())
+
+def test_batch_delete_reports_only_what_it_removed():
+    async def scenario():
+        db, ids = await seed(3)
+        controller = DiseaseController()
+        claim = db.diagnoses.update_many
+
+        async def update_many_after_concurrent_delete(*args, **kwargs):
+            # Another request deletes the first diagnosis after this one found it
+            db.diagnoses.update_many = claim
+            concurrent = await controller.delete_diagnoses(DiagnosisBatchDelete(ids=ids[:1]), USER, BackgroundTasks())
+            assert concurrent.deleted_count == 1
+            return await claim(*args, **kwargs)
+
+        db.diagnoses.update_many = update_many_after_concurrent_delete
+        result = await controller.delete_diagnoses(DiagnosisBatchDelete(ids=ids), USER, BackgroundTasks())
+
+        assert result.deleted_count == 2
+        assert statuses(result) == {ids[0]: "not_found", ids[1]: "deleted", ids[2]: "deleted"}
+        assert await db.diagnoses.count_documents({}) == 0
+        # Each reference released exactly once between the two requests
+        assert (await db.images.find_one({"_id": SHARED_KEY}))["ref_count"] == 0
+
+    asyncio.run(scenario())
@@ -0,0 +1,65 @@
+# test_idempotency.py
+"""
+Idempotency keys against the in-memory database: a request whose claim was
+taken over must not release or overwrite the new holder's record.
+
+    python -m pytest tests
+"""
+import asyncio
+import os
+
+os.environ.setdefault("SECRET_KEY", "test")
+os.environ["DATABASE_BACKEND"] = "memory"
+
+import pytest
+from app.config import settings
+from app.database import connect_to_mongo, get_database
+from app.utils.idempotency import idempotent
+
+RECORD_ID = "predict:user:key"
+
+def run_with_takeover(first_fails: bool):
+    """
+    The first request outlives IDEMPOTENCY_LOCK_SECONDS, a retry takes the key
+    over, then the first one finishes (or fails) while the retry is running.
+    Returns the stored record once both are done.
+    """
+    async def scenario():
+        await connect_to_mongo()
+        first_running, first_may_finish, retry_running, retry_may_finish = (asyncio.Event() for _ in range(4))
+
+        async def first():
+            first_running.set()
+            await first_may_finish.wait()
+            if first_fails:
+                raise RuntimeError("provider failed")
+            return {"answer": "first"}
+
+        async def retry():
+            retry_running.set()
+            await retry_may_finish.wait()
+            return {"answer": "retry"}
+
+        first_task = asyncio.create_task(idempotent("predict", "key", "user", "fp", first))
+        await first_running.wait()
+        await asyncio.sleep(settings.IDEMPOTENCY_LOCK_SECONDS + 0.05)
+        retry_task = asyncio.create_task(idempotent("predict", "key", "user", "fp", retry))
+        await retry_running.wait()
+
+        first_may_finish.set()
+        await asyncio.gather(first_task, return_exceptions=True)
+        record = await get_database().idempotency_keys.find_one({"_id": RECORD_ID})
+        assert record is not None and record["state"] == "processing"
+
+        retry_may_finish.set()
+        assert await retry_task == ({"answer": "retry"}, False)
+        return await get_database().idempotency_keys.find_one({"_id": RECORD_ID})
+
+    return asyncio.run(scenario())
+
+@pytest.mark.parametrize("first_fails", [True, False])
+def test_taken_over_claim_is_left_to_its_new_holder(monkeypatch, first_fails):
+    monkeypatch.setattr(settings, "IDEMPOTENCY_LOCK_SECONDS", 0.2)
+    record = run_with_takeover(first_fails)
+    assert record["state"] == "completed"
+    assert record["response"] == {"answer": "retry"}
@@ -0,0 +1,72 @@
+# test_image_release.py
+"""
+Releasing the last reference to an image while the same photo is uploaded
+again, against the in-memory database and a local store in a temporary
+directory.
+
+    python -m pytest tests
+"""
+import asyncio
+import io
+import os
+
+os.environ.setdefault("SECRET_KEY", "test")
+os.environ["DATABASE_BACKEND"] = "memory"
+
+from fastapi import UploadFile
+from starlette.datastructures import Headers
+from benchmarks.images import encode, leaf_image
+from app.database import connect_to_mongo, get_database
+from app.utils import storage
+from app.utils.image_storage import release_image, store_image
+
+PHOTO = encode(leaf_image(64, 48), "JPEG")
+
+def upload() -> UploadFile:
+    return UploadFile(
+        io.BytesIO(PHOTO), size=len(PHOTO), filename="leaf.jpg", headers=Headers({"content-type": "image/jpeg"})
+    )
+
+def test_upload_during_release_keeps_the_object(monkeypatch, tmp_path):
+    store = storage.LocalImageStore(str(tmp_path))
+    monkeypatch.setattr(storage, "_image_store", store)
+
+    async def scenario():
+        await connect_to_mongo()
+        stored, _ = await store_image(upload())
+        delete = store.delete
+        uploads = []
+
+        async def delete_during_upload(key):
+            # The same photo arrives while the object is being deleted
+            uploads.append(asyncio.create_task(store_image(upload())))
+            await asyncio.sleep(0.05)
+            await delete(key)
+
+        monkeypatch.setattr(store, "delete", delete_during_upload)
+        assert await release_image(stored.key)
+        again, _ = await uploads[0]
+
+        assert again.key == stored.key and not again.deduplicated
+        assert await store.exists(stored.key)
+        entry = await get_database().images.find_one({"_id": stored.key})
+        assert entry["ref_count"] == 1 and "deleting_at" not in entry
+
+    asyncio.run(scenario())
+
+def test_release_of_last_reference_removes_object_and_entry(monkeypatch, tmp_path):
+    store = storage.LocalImageStore(str(tmp_path))
+    monkeypatch.setattr(storage, "_image_store", store)
+
+    async def scenario():
+        await connect_to_mongo()
+        stored, _ = await store_image(upload())
+        duplicate, _ = await store_image(upload())
+        assert duplicate.deduplicated
+
+        assert not await release_image(stored.key)
+        assert await release_image(stored.key)
+        assert not await store.exists(stored.key)
+        assert await get_database().images.find_one({"_id": stored.key}) is None
+
+    asyncio.run(scenario())
@@ -29,9 +29,12 @@ async function fetchSupportedCrops() {
   return data;
 }
 
+// Matches MAX_IMAGES_PER_DIAGNOSIS on the backend
+const MAX_IMAGES = 5;
+
 export default function Dashboard() {
-  const [selectedFile, setSelectedFile] = useState<File | null>(null);
-  const [preview, setPreview] = useState<string | null>(null);
+  const [selectedFiles, setSelectedFiles] = useState<File[]>([]);
+  const [previews, setPreviews] = useState<string[]>([]);
   const [cropType, setCropType] = useState<string>("");
   const [predictionResult, setPredictionResult] = useState<any>(null);
   const { toast } = useToast();
@@ -67,8 +70,20 @@ export default function Dashboard() {
   });
 
   const handleFileChange = (event: React.ChangeEvent<HTMLInputElement>) => {
-    const file = event.target.files?.[0];
-    if (file) {
+    const files = Array.from(event.target.files ?? []);
+    if (files.length === 0) return;
+
+    // Several photos of the same plant are analyzed together
+    if (files.length > MAX_IMAGES) {
+      toast({
+        title: "Too Many Images",
+        description: `Please select at most ${MAX_IMAGES} photos of the same plant`,
+        variant: "destructive",
+      });
+      return;
+    }
+
+    for (const file of files) {
       // Validate file type
       if (!file.type.startsWith('image/')) {
         toast({
@@ -88,19 +103,16 @@ export default function Dashboard() {
         });
         return;
       }
-
-      setSelectedFile(file);
-      const reader = new FileReader();
-      reader.onloadend = () => {
-        setPreview(reader.result as string);
-      };
-      reader.readAsDataURL(file);
-      setPredictionResult(null); // Clear previous results
     }
+
+    previews.forEach((src) => URL.revokeObjectURL(src));
+    setSelectedFiles(files);
+    setPreviews(files.map((file) => URL.createObjectURL(file)));
+    setPredictionResult(null); // Clear previous results
   };
 
   const handleUpload = () => {
-    if (!selectedFile) {
+    if (selectedFiles.length === 0) {
       toast({
         title: "No file selected",
         description: "Please choose an image file to upload.",
@@ -119,15 +131,16 @@ export default function Dashboard() {
     }
 
     const formData = new FormData();
-    formData.append("file", selectedFile);
+    selectedFiles.forEach((file) => formData.append("files", file));
     formData.append("crop_type", cropType);
 
     mutation.mutate(formData);
   };
 
   const resetUpload = () => {
-    setSelectedFile(null);
-    setPreview(null);
+    previews.forEach((src) => URL.revokeObjectURL(src));
+    setSelectedFiles([]);
+    setPreviews([]);
     setCropType("");
     setPredictionResult(null);
   };
@@ -254,21 +267,27 @@ export default function Dashboard() {
                         id="file-upload"
                         className="hidden"
                         accept="image/*"
+                        multiple
                         onChange={handleFileChange}
                       />
-                      {preview ? (
+                      {previews.length > 0 ? (
                         <div className="space-y-4">
-                          <img 
-                            src={preview} 
-                            alt="Selected crop" 
-                            className="max-h-60 mx-auto rounded-lg shadow-md" 
-                          />
+                          <div className="flex flex-wrap justify-center gap-2">
+                            {previews.map((src, index) => (
+                              <img
+                                key={src}
+                                src={src}
+                                alt={`Selected crop ${index + 1}`}
+                                className={`${previews.length > 1 ? "max-h-32" : "max-h-60"} rounded-lg shadow-md`}
+                              />
+                            ))}
+                          </div>
                           <Button 
                             variant="outline" 
                             onClick={resetUpload}
                             className="ml-4"
                           >
-                            Choose Different Image
+                            Choose Different Images
                           </Button>
                         </div>
                       ) : (
@@ -279,7 +298,7 @@ export default function Dashboard() {
                               Upload crop image for analysis
                             </p>
                             <p className="text-muted-foreground mb-4">
-                              Drag and drop or click to select files (JPG, PNG - Max 5MB)
+                              Select up to {MAX_IMAGES} photos of the same plant (JPG, PNG - Max 5MB each)
                             </p>
                             <Button asChild>
                               <label htmlFor="file-upload" className="cursor-pointer">
@@ -293,7 +312,7 @@ export default function Dashboard() {
                   </div>
 
                   {/* Analysis Button */}
-                  {selectedFile && cropType && (
+                  {selectedFiles.length > 0 && cropType && (
                     <Button 
                       onClick={handleUpload} 
                       className="w-full" 
@@ -116,7 +116,8 @@ export default function History() {
                         {item.image_url && (
                           <div className="flex items-center justify-between">
                             <img 
-                              src={`${import.meta.env.VITE_API_BASE_URL || 'http://localhost:8000'}${item.image_url}`}
+                              src={`${import.meta.env.VITE_API_BASE_URL || 'http://localhost:8000'}${item.thumbnail_url || item.image_url}`}
+                              loading="lazy"
                               alt="Analyzed crop" 
                               className="h-20 w-20 object-cover rounded-lg"
                             />